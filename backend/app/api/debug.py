@@ -0,0 +1,23 @@
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+import logging
+
+from app.core.profiling import load_profile, token_matches
+
+# Only mounted when request profiling is enabled
+router = APIRouter(prefix="/debug")
+
+logger = logging.getLogger(__name__)
+
+@router.get("/profiles/{profile_id}", include_in_schema=False)
+async def get_profile(profile_id: str, x_profile_token: str = Header(None)):
+    """
+    Download a stored request profile in folded-stack format, e.g.
+    `flamegraph.pl profile.folded > profile.svg` or open it in speedscope.
+    """
+    if not token_matches(x_profile_token):
+        raise HTTPException(status_code=404, detail="Not found")
+    profile = load_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(profile)
@@ -1,17 +1,34 @@
-from fastapi import APIRouter, HTTPException, Depends, Path, status
+from fastapi import APIRouter, HTTPException, Depends, Path, Query, status, BackgroundTasks
 from fastapi.security import OAuth2PasswordBearer
-from app.services.jwt import create_access_token, get_current_session, verify_password
-from app.models.imageview import PasswordAuth, Token, PhotoList, SelectionResponse
-from app.services.dynamodb import get_dynamodb_client
-from botocore.exceptions import ClientError
-from fastapi.responses import JSONResponse
-
-from app.core.jwt import TABLE_NAME, ACCESS_TOKEN_EXPIRE_MINUTES
-
+from app.services.jwt import create_access_token, get_current_claims
+from app.services.session_cache import photo_list_cache, META_READY, META_UNKNOWN
+from app.services.password_hasher import password_hasher, HasherBusy
+from app.services.rate_limit import limit_auth_attempts
+from app.models.imageview import PasswordAuth, Token, PhotoList, SessionPhotos, SelectionResponse
+from app.services.dynamodb import get_dynamodb_client, TABLE_NAME
+from app.services.zipstream import ZipFile, stream_zip
+from app.services.image_cache import warm_gallery
+from app.services.photo_meta import is_index_key, photo_index_state, read_photo_index
+from app.services.bursts import group_bursts
+from app.api.uploads import STREAM_CHUNK_SIZE
+from app.services.s3 import BUCKET_NAME, get_s3_client
+from app.core.breaker import DependencyUnavailable
+from app.core.config import get_settings
+from app.utils.s3 import object_key_from_url
+from botocore.exceptions import BotoCoreError, ClientError
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from app.core.jwt import ACCESS_TOKEN_EXPIRE_MINUTES
+
+from collections import deque
 from datetime import datetime, timedelta
+from typing import List, Optional, Set
 
+import asyncio
 import logging
-import bcrypt
+import posixpath
+import re
 import traceback
 
 logger = logging.getLogger(__name__)
@@ -22,24 +39,56 @@ router = APIRouter(prefix="/api/v1")
 
 
 
+async def upgrade_password_hash(table, session_id: str, password: str, old_hash: str):
+    """Re-hash a verified password with the current work factor (runs after the response)"""
+    from boto3.dynamodb.conditions import Attr
+
+    try:
+        new_hash = await password_hasher.hash(password)
+        # Only replace the hash we verified against, in case it changed meanwhile
+        await run_in_threadpool(
+            table.update_item,
+            Key={"session_id": session_id},
+            UpdateExpression="SET hashed_password = :hash",
+            ConditionExpression=Attr("hashed_password").eq(old_hash),
+            ExpressionAttributeValues={":hash": new_hash}
+        )
+        logger.info(f"Upgraded password hash for session: {session_id}")
+    except HasherBusy:
+        logger.info(f"Skipped password hash upgrade for session {session_id}: hasher busy")
+    except (ClientError, BotoCoreError, DependencyUnavailable) as e:
+        logger.warning(f"Could not upgrade password hash for session {session_id}: {str(e)}")
 
+async def record_session_activity(table, session_id: str, now: int):
+    """Set the last_activity shown in the event listing (runs after the response)"""
+    from boto3.dynamodb.conditions import Attr
 
+    try:
+        # A blind write, no read; the condition only keeps a session swept
+        # meanwhile from coming back as a stub item
+        await run_in_threadpool(
+            table.update_item,
+            Key={"session_id": session_id},
+            UpdateExpression="SET last_activity = :now",
+            ConditionExpression=Attr("session_id").exists(),
+            ExpressionAttributeValues={":now": now}
+        )
+    except (ClientError, BotoCoreError, DependencyUnavailable) as e:
+        logger.warning(f"Could not record activity of session {session_id}: {str(e)}")
 
 @router.post("/session/{session_id}/auth", response_model=Token)
 async def authenticate_session(
+    background_tasks: BackgroundTasks,
     session_id: str = Path(...),
     auth_data: PasswordAuth = None,
+    _rate_limit: None = Depends(limit_auth_attempts),
     dynamodb = Depends(get_dynamodb_client)
 ):
     """
-    Authenticate a user for a specific session using a password
+    Authenticate a user for a specific session using a password.
+    Throttled per session and client IP before any database or bcrypt work.
     """
-    # Add debug logging for the incoming request
     logger.info(f"Authentication attempt for session_id: {session_id}")
-    if auth_data:
-        logger.info(f"Request contains auth_data with password: {auth_data.password}")
-    else:
-        logger.info("Request does not contain auth_data")
 
     if not auth_data:
         raise HTTPException(status_code=400, detail="Password is required")
@@ -50,7 +99,8 @@ async def authenticate_session(
         logger.info(f"Querying DynamoDB table {TABLE_NAME} for session_id: {session_id}")
         response = table.get_item(Key={"session_id": session_id})
 
-        if "Item" not in response:
+        # Photo index items share the table but aren't sessions
+        if "Item" not in response or is_index_key(session_id):
             logger.warning(f"Session not found: {session_id}")
             # Return a 404 directly instead of throwing an exception that gets caught by the outer handler
             return JSONResponse(
@@ -61,25 +111,37 @@ async def authenticate_session(
         session = response["Item"]
         logger.info(f"Found session: {session_id}")
 
-        # Log the stored hashed_password value
-        if "hashed_password" in session:
-            logger.info(f"Stored password from DynamoDB: {session['hashed_password']}")
-        else:
-            logger.error(f"No hashed_password found in session data: {session}")
+        # DynamoDB TTL deletes lazily, so an expired item can still be returned
+        expires_at = session.get("expires_at")
+        if expires_at is not None and int(expires_at) <= int(datetime.now().timestamp()):
+            logger.warning(f"Session expired: {session_id}")
+            return JSONResponse(
+                status_code=410,
+                content={"detail": "Session has expired"}
+            )
+
+        if "hashed_password" not in session:
+            logger.error(f"No hashed_password found in session: {session_id}")
             return JSONResponse(
                 status_code=500,
                 content={"detail": "Session data is missing password"}
             )
 
-        # Verify the password
+        # Verify the password on the hashing pool so bcrypt never blocks the event loop
         try:
-            is_valid = verify_password(auth_data.password, session["hashed_password"])
+            is_valid = await password_hasher.verify(auth_data.password, session["hashed_password"])
             logger.info(f"Password verification result: {is_valid}")
             if not is_valid:
                 return JSONResponse(
                     status_code=401,
                     content={"detail": "Incorrect password"}
                 )
+        except HasherBusy:
+            return JSONResponse(
+                status_code=503,
+                content={"detail": "Too many login attempts in progress, please retry"},
+                headers={"Retry-After": "1"}
+            )
         except Exception as verify_error:
             logger.error(f"Error during password verification: {str(verify_error)}")
             return JSONResponse(
@@ -87,17 +149,38 @@ async def authenticate_session(
                 content={"detail": f"Password verification error: {str(verify_error)}"}
             )
 
+        # Transparently move plain text and outdated hashes to the current work factor
+        if password_hasher.needs_rehash(session["hashed_password"]):
+            background_tasks.add_task(
+                upgrade_password_hash, table, session_id, auth_data.password, session["hashed_password"]
+            )
+
+        background_tasks.add_task(record_session_activity, table, session_id, int(datetime.now().timestamp()))
+
         # Generate access token
         logger.info("Generating JWT access token")
         access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        token_data = {"sub": session_id}
+        if "photo_version" in session:
+            # The pv claim lets /photos and /select trust the cached photo list
+            token_data["pv"] = int(session["photo_version"])
+            # A ready index is only read by the first /photos; a pending or absent one needs no read
+            index_state = photo_index_state(session)
+            photo_list_cache.put(session_id, token_data["pv"], session.get("photo_urls", []),
+                                 meta_state=index_state if index_state != META_READY else META_UNKNOWN)
         access_token = create_access_token(
-            data={"sub": session_id},
+            data=token_data,
             expires_delta=access_token_expires
         )
 
+        # The gallery asks for its photos next; start loading them into the image cache
+        warm_gallery(get_s3_client, BUCKET_NAME, session.get("photo_urls", []), label=f"session {session_id}")
+
         logger.info("Authentication successful, returning token")
         return {"access_token": access_token, "token_type": "bearer"}
 
+    except DependencyUnavailable:
+        raise
     except ClientError as e:
         error_message = str(e)
         logger.error(f"DynamoDB error: {error_message}")
@@ -114,22 +197,66 @@ async def authenticate_session(
             content={"detail": f"Authentication failed: {str(e)}"}
         )
 
-@router.get("/session/{session_id}/photos", response_model=PhotoList)
+def _photo_meta(entry) -> Optional[dict]:
+    """Index entries are [width, height, orientation, taken_at, placeholder, dhash]"""
+    if not entry:
+        return None
+    return {"width": entry[0], "height": entry[1], "orientation": entry[2], "taken_at": entry[3],
+            "placeholder": entry[4]}
+
+def _session_photos(photos: List[str], meta, collapse: Optional[str] = None, burst: Optional[int] = None,
+                    bursts: Optional[List[List[int]]] = None) -> dict:
+    """Response body of /photos; `bursts` is the grouping of the photos if already known"""
+    if collapse is None and burst is None:
+        return {"photos": photos, "meta": [_photo_meta(entry) for entry in meta or []]}
+
+    if bursts is None:
+        bursts = group_bursts(meta, len(photos))
+    if burst is not None:
+        if burst >= len(bursts):
+            raise HTTPException(status_code=404, detail="Burst not found")
+        indices, sizes = bursts[burst], None
+    else:
+        indices, sizes = [frames[0] for frames in bursts], [len(frames) for frames in bursts]
+    meta = meta or []
+    return {
+        "photos": [photos[i] for i in indices],
+        "meta": [_photo_meta(meta[i]) for i in indices] if meta else [],
+        "bursts": sizes
+    }
+
+@router.get("/session/{session_id}/photos", response_model=SessionPhotos)
 async def get_session_photos(
     session_id: str = Path(...),
-    current_session: str = Depends(get_current_session),
+    collapse: Optional[str] = Query(None, pattern="^bursts$"),
+    burst: Optional[int] = Query(None, ge=0),
+    claims: dict = Depends(get_current_claims),
     dynamodb = Depends(get_dynamodb_client)
 ):
     """
-    Get the list of photos for a specific session (protected by JWT)
+    Get the list of photos for a specific session, with each photo's size,
+    orientation, capture time and placeholder once they have been indexed
+    (protected by JWT).
+
+    collapse=bursts returns only the first frame of each burst of
+    near-identical shots, with the size of each burst in `bursts`;
+    burst=N returns all frames of the N-th burst of that list.
     """
     # Verify that the token session matches the requested session
-    if current_session != session_id:
+    if claims["sub"] != session_id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access denied to this session"
         )
 
+    # Tokens issued for a photo list version can be answered from memory
+    version = claims.get("pv")
+    cached = photo_list_cache.get_with_meta(session_id, version)
+    if cached is not None:
+        if (collapse is not None or burst is not None) and cached.bursts is None:
+            cached.bursts = group_bursts(cached.meta, len(cached.photos))
+        return _session_photos(cached.photos, cached.meta, collapse, burst, cached.bursts)
+
     try:
         # Get the session from DynamoDB
         table = dynamodb.Table(TABLE_NAME)
@@ -139,10 +266,22 @@ async def get_session_photos(
             raise HTTPException(status_code=404, detail="Session not found")
 
         session = response["Item"]
-
-        # Return the photo URLs
-        return {"photos": session.get("photo_urls", [])}
-
+        photos = session.get("photo_urls", [])
+        index_state, meta = await run_in_threadpool(read_photo_index, table, session)
+        if version is not None and int(session.get("photo_version", 0)) == version:
+            photo_list_cache.put(session_id, version, photos, meta, index_state)
+
+        # Return the photo URLs and their metadata
+        return _session_photos(photos, meta, collapse, burst)
+
+    except DependencyUnavailable:
+        # DynamoDB is failing fast; a list whose index was still pending beats an error
+        stale = photo_list_cache.peek(session_id, version)
+        if stale is None:
+            raise
+        return _session_photos(stale.photos, stale.meta, collapse, burst)
+    except HTTPException:
+        raise
     except ClientError as e:
         logger.error(f"DynamoDB error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error")
@@ -154,57 +293,197 @@ async def get_session_photos(
 async def select_session_photos(
     selection: PhotoList,
     session_id: str = Path(...),
-    current_session: str = Depends(get_current_session),
+    claims: dict = Depends(get_current_claims),
     dynamodb = Depends(get_dynamodb_client)
 ):
     """
     Save the selected photos for a specific session (protected by JWT)
     """
     # Verify that the token session matches the requested session
-    if current_session != session_id:
+    if claims["sub"] != session_id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access denied to this session"
         )
 
+    from boto3.dynamodb.conditions import Attr
+
+    version = claims.get("pv")
+    selected_photos = set(selection.photos)
+
     try:
-        # Get the session from DynamoDB
         table = dynamodb.Table(TABLE_NAME)
-        response = table.get_item(Key={"session_id": session_id})
 
-        if "Item" not in response:
-            raise HTTPException(status_code=404, detail="Session not found")
+        all_photos = photo_list_cache.get(session_id, version)
+        if all_photos is not None:
+            # No read needed: the write itself checks the cached list is still current
+            condition = Attr("photo_version").eq(version)
+        else:
+            # Get the session from DynamoDB
+            response = table.get_item(Key={"session_id": session_id})
 
-        session = response["Item"]
+            if "Item" not in response:
+                raise HTTPException(status_code=404, detail="Session not found")
 
-        # Verify that all selected photos exist in the session
-        all_photos = set(session.get("photo_urls", []))
-        selected_photos = set(selection.photos)
+            all_photos = response["Item"].get("photo_urls", [])
+            condition = Attr("session_id").exists()
 
+        # Verify that all selected photos exist in the session
         if not selected_photos.issubset(all_photos):
             raise HTTPException(
                 status_code=400,
                 detail="Selected photos contain URLs that don't exist in this session"
             )
 
-        # Update the session with selected photos
-        table.update_item(
-            Key={"session_id": session_id},
-            UpdateExpression="SET selected_photos = :selected, updated_at = :time",
-            ExpressionAttributeValues={
-                ":selected": list(selected_photos),
-                ":time": int(datetime.now().timestamp())
-            }
-        )
+        # Update the session with selected photos (and the event index summary)
+        try:
+            table.update_item(
+                Key={"session_id": session_id},
+                UpdateExpression="SET selected_photos = :selected, selection_count = :count, updated_at = :time, last_activity = :time",
+                ConditionExpression=condition,
+                ExpressionAttributeValues={
+                    ":selected": list(selected_photos),
+                    ":count": len(selected_photos),
+                    ":time": int(datetime.now().timestamp())
+                }
+            )
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+                raise
+            photo_list_cache.invalidate(session_id, version)
+            raise HTTPException(status_code=404, detail="Session not found or has changed")
 
         return {
             "success": True,
             "message": f"Successfully selected {len(selected_photos)} photos"
         }
 
+    except HTTPException:
+        raise
     except ClientError as e:
         logger.error(f"DynamoDB error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database error")
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to save selection: {str(e)}")
+
+async def _open_photo(s3_client, key: str):
+    """get_object and the first chunk of the body, off the event loop"""
+    response = await run_in_threadpool(s3_client.get_object, Bucket=BUCKET_NAME, Key=key)
+    first = await run_in_threadpool(response["Body"].read, STREAM_CHUNK_SIZE)
+    return response, first
+
+async def _body_chunks(key: str, body, first: bytes):
+    try:
+        chunk = first
+        while chunk:
+            yield chunk
+            chunk = await run_in_threadpool(body.read, STREAM_CHUNK_SIZE)
+    except (ClientError, BotoCoreError) as e:
+        # The entry is half written and can't be skipped; the client gets a
+        # ZIP without its central directory, which unzip reports as broken
+        logger.error(f"Aborting ZIP download: reading {key} failed mid-stream: {str(e)}")
+        raise
+    finally:
+        body.close()
+
+def _close_opened(opening: asyncio.Future):
+    if not opening.cancelled() and opening.exception() is None:
+        opening.result()[0]["Body"].close()
+
+def _archive_name(key: str, used: Set[str]) -> str:
+    """File name inside the ZIP; repeated names get a " (n)" suffix"""
+    name = posixpath.basename(key) or "photo"
+    stem, ext = posixpath.splitext(name)
+    n = 1
+    while name in used:
+        n += 1
+        name = f"{stem} ({n}){ext}"
+    used.add(name)
+    return name
+
+async def _session_files(s3_client, keys: List[str], prefetch: int):
+    """
+    ZIP entries for `keys`, in order. While one photo is being written the
+    next `prefetch` are already being opened, so each starts without waiting
+    for S3; at most one chunk per opened photo is held in memory.
+    """
+    remaining = iter(keys)
+    pending = deque()
+    used_names: Set[str] = set()
+
+    def open_next():
+        key = next(remaining, None)
+        if key is not None:
+            pending.append((key, asyncio.ensure_future(_open_photo(s3_client, key))))
+
+    for _ in range(prefetch + 1):
+        open_next()
+    try:
+        while pending:
+            key, opening = pending.popleft()
+            open_next()
+            try:
+                response, first = await opening
+            except (ClientError, BotoCoreError, DependencyUnavailable) as e:
+                # The response has already started; leave the photo out
+                logger.warning(f"Skipping {key} in ZIP download: {str(e)}")
+                continue
+            yield ZipFile(
+                name=_archive_name(key, used_names),
+                modified=response["LastModified"],
+                chunks=_body_chunks(key, response["Body"], first),
+                size=response["ContentLength"],
+            )
+    finally:
+        for _, opening in pending:
+            opening.cancel()
+            opening.add_done_callback(_close_opened)
+
+@router.get("/session/{session_id}/download")
+async def download_session_photos(
+    session_id: str = Path(...),
+    include: str = Query("selected", pattern="^(selected|all)$"),
+    claims: dict = Depends(get_current_claims),
+    dynamodb = Depends(get_dynamodb_client),
+    s3_client = Depends(get_s3_client)
+):
+    """
+    Download the session's selected photos (or all of them with include=all)
+    as one ZIP, streamed from S3 as it is built (protected by JWT)
+    """
+    if claims["sub"] != session_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied to this session"
+        )
+
+    try:
+        table = dynamodb.Table(TABLE_NAME)
+        response = await run_in_threadpool(table.get_item, Key={"session_id": session_id})
+    except (ClientError, BotoCoreError) as e:
+        logger.error(f"DynamoDB error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Database error")
+
+    if "Item" not in response:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    session = response["Item"]
+    photos = session.get("photo_urls", [])
+    if include == "selected":
+        selected = set(session.get("selected_photos", []))
+        photos = [url for url in photos if url in selected]
+    # photo_urls come from the client that created the session; only this
+    # event's objects in our bucket may end up in the ZIP
+    prefix = f"{session.get('event_id', '')}/"
+    keys = [key for key in (object_key_from_url(url, BUCKET_NAME, prefix) for url in photos) if key]
+    if not keys:
+        raise HTTPException(status_code=404, detail="No photos to download")
+
+    filename = re.sub(r"[^A-Za-z0-9_-]", "", session_id) or "photos"
+    files = _session_files(s3_client, keys, get_settings().DOWNLOAD_PREFETCH)
+    return StreamingResponse(
+        stream_zip(files),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}.zip"'}
+    )
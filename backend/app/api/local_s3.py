@@ -0,0 +1,88 @@
+from fastapi import APIRouter, Request, Header, HTTPException, Path
+from fastapi.responses import Response, StreamingResponse
+from botocore.exceptions import ClientError
+from typing import Optional
+import asyncio
+import tempfile
+import logging
+
+from app.services.local_storage import COPY_CHUNK_SIZE, get_local_s3_client
+
+# Serves the presigned URLs handed out by LocalS3Client. Only mounted when
+# STORAGE_BACKEND=local, so the Flutter client and load tests can PUT/GET
+# exactly as they would against S3.
+router = APIRouter(prefix="/local-s3")
+
+logger = logging.getLogger(__name__)
+
+def client_error_response(e: ClientError) -> Response:
+    error = e.response.get("Error", {})
+    status = e.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 500)
+    return Response(
+        content=f"<Error><Code>{error.get('Code')}</Code><Message>{error.get('Message')}</Message></Error>",
+        status_code=status,
+        media_type="application/xml"
+    )
+
+@router.put("/{bucket}/{key:path}")
+async def put_local_object(
+    request: Request,
+    bucket: str = Path(...),
+    key: str = Path(...),
+    uploadId: Optional[str] = None,
+    partNumber: Optional[int] = None
+):
+    """PUT an object (or one part of a multipart upload) like a presigned S3 URL"""
+    s3_client = get_local_s3_client()
+    # Spool the body so large parts don't sit in memory
+    body = tempfile.SpooledTemporaryFile(max_size=COPY_CHUNK_SIZE)
+    async for chunk in request.stream():
+        body.write(chunk)
+    body.seek(0)
+
+    try:
+        if uploadId:
+            if partNumber is None:
+                raise HTTPException(status_code=400, detail="partNumber is required with uploadId")
+            result = await asyncio.to_thread(
+                s3_client.upload_part,
+                Bucket=bucket, Key=key, UploadId=uploadId, PartNumber=partNumber, Body=body
+            )
+        else:
+            result = await asyncio.to_thread(
+                s3_client.put_object,
+                Bucket=bucket, Key=key, Body=body, ContentType=request.headers.get("content-type")
+            )
+    except ClientError as e:
+        return client_error_response(e)
+    finally:
+        body.close()
+
+    return Response(status_code=200, headers={"ETag": result["ETag"]})
+
+@router.get("/{bucket}/{key:path}")
+async def get_local_object(
+    bucket: str = Path(...),
+    key: str = Path(...),
+    range_header: Optional[str] = Header(None, alias="Range")
+):
+    """GET an object, honouring a single Range header"""
+    s3_client = get_local_s3_client()
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=key, Range=range_header)
+    except ClientError as e:
+        return client_error_response(e)
+
+    headers = {
+        "ETag": response["ETag"],
+        "Content-Length": str(response["ContentLength"]),
+        "Accept-Ranges": "bytes"
+    }
+    if "ContentRange" in response:
+        headers["Content-Range"] = response["ContentRange"]
+    return StreamingResponse(
+        response["Body"].iter_chunks(),
+        status_code=206 if "ContentRange" in response else 200,
+        media_type=response["ContentType"],
+        headers=headers
+    )
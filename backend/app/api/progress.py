@@ -0,0 +1,67 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, Path, Query, status
+from fastapi.responses import StreamingResponse
+from typing import Optional
+import logging
+
+from app.core.config import get_settings
+from app.models.session import CHANNEL_PATTERN
+from app.services.jwt import get_current_claims, oauth2_scheme
+from app.services.progress import progress_hub, ChannelLimitReached, MAX_SUBSCRIBERS
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api/v1")
+
+# Comment lines sent while a channel is quiet, so proxies don't close the stream
+PROGRESS_HEARTBEAT_SECONDS = get_settings().PROGRESS_HEARTBEAT_SECONDS
+
+@router.post("/progress", status_code=status.HTTP_201_CREATED)
+async def open_progress_batch():
+    """
+    Start an upload batch: returns the batch_id to send with the uploads and
+    /session/create, and to watch at /progress/{batch_id}. Batch ids are
+    random, so only whoever asked for one can watch it.
+    """
+    try:
+        return {"batch_id": progress_hub.open_channel()}
+    except ChannelLimitReached:
+        raise HTTPException(status_code=503, detail="Too many uploads in progress, please retry",
+                            headers={"Retry-After": "5"})
+
+@router.get("/progress/{channel}")
+async def stream_progress(
+    channel: str = Path(..., pattern=CHANNEL_PATTERN),
+    last_event_id: Optional[str] = Header(None),
+    token: Optional[str] = Depends(oauth2_scheme),
+    access_token: Optional[str] = Query(None)
+):
+    """
+    Server-Sent Events for an upload batch (a batch_id from POST /progress)
+    or a session (its session_id, with the session's token as a Bearer
+    header or `access_token`, since EventSource can't set headers):
+    file_progress, file_uploaded, file_failed, batch_done,
+    derivatives_progress and derivatives_ready. Reconnecting clients get the
+    events they missed via Last-Event-ID.
+    """
+    if not progress_hub.has_channel(channel):
+        raise HTTPException(status_code=404, detail="Progress channel not found")
+    if not progress_hub.is_batch(channel):
+        claims = await get_current_claims(token or access_token)
+        if claims["sub"] != channel:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access denied to this session")
+    if progress_hub.subscriber_count(channel) >= MAX_SUBSCRIBERS:
+        raise HTTPException(status_code=429, detail="Too many subscribers for this channel")
+
+    after = int(last_event_id) if last_event_id and last_event_id.isdigit() else 0
+
+    async def events():
+        # Browsers wait this long before reconnecting
+        yield b"retry: 3000\n\n"
+        async for event in progress_hub.subscribe(channel, after, heartbeat=PROGRESS_HEARTBEAT_SECONDS):
+            yield event.encoded if event is not None else b": ping\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
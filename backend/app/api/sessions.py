@@ -1,40 +1,37 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Header, Path, Query
 from pydantic import BaseModel
-import boto3
 from botocore.exceptions import ClientError
-import uuid
-from typing import List
-import os
-from dotenv import load_dotenv
+from typing import List, Optional
 import logging
-from ..models.session import CreateSessionRequest, SessionResponse
-from ..utils.password import generate_random_password, hash_password
-from datetime import datetime
+import json
+import base64
+import hmac
+from ..models.session import CreateSessionRequest, SessionResponse, SessionSummary, SessionSummaryPage
+from ..services.password_hasher import HasherBusy
+from ..services.dynamodb import get_dynamodb_client, TABLE_NAME, EVENT_INDEX_NAME
+from ..core.config import get_settings
+from ..services.image_cache import warm_gallery
+from ..services.sessions import create_photo_session
+from ..services.s3 import get_s3_client, BUCKET_NAME
 
 
-# Load environment variables
-load_dotenv()
-
 # Initialize router with prefix
 router = APIRouter(prefix="/api/v1")
 
 logger = logging.getLogger(__name__)
 
-# Initialize DynamoDB client as a dependency
-def get_dynamodb_client():
-    return boto3.resource(
-        'dynamodb',
-        region_name='ap-south-1',
-        aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-        aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY')
-    )
-
-# Table name for sessions
-TABLE_NAME = "photo_sessions_share"
+MAX_SESSIONS_PAGE = 100
 
-# Base URL for session links
-# For local testing, default to localhost
-BASE_URL = os.getenv('FRONTEND_URL', os.getenv('BASE_URL', 'http://localhost:3000'))
+def require_operator(x_operator_token: Optional[str] = Header(None)):
+    """
+    Operator-only routes: X-Operator-Token must match OPERATOR_TOKEN. Without
+    an OPERATOR_TOKEN they don't exist (404), like /debug.
+    """
+    expected = get_settings().OPERATOR_TOKEN
+    if not expected:
+        raise HTTPException(status_code=404, detail="Not found")
+    if not x_operator_token or not hmac.compare_digest(x_operator_token.encode(), expected.encode()):
+        raise HTTPException(status_code=401, detail="Invalid operator token")
 
 @router.post("/session/create", response_model=SessionResponse)
 async def create_session(
@@ -47,41 +44,20 @@ async def create_session(
     logger.info(f"Creating session for event_id: {request.event_id} with {len(request.photo_urls)} photos")
 
     try:
-        # Get the table
         table = dynamodb.Table(TABLE_NAME)
+        try:
+            session = await create_photo_session(table, request.event_id, request.photo_urls, request.batch_id)
+        except HasherBusy:
+            raise HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": "1"})
 
-        # Generate a unique session ID
-        session_id = str(uuid.uuid4())
-
-        # Generate a random password
-        password = generate_random_password(6)
-
-        # Hash the password for storage
-        hashed_password = hash_password(password)
-
-        # Create the session link
-        session_link = f"{BASE_URL}/session/{session_id}"
-
-        # Store session data in DynamoDB
-        table.put_item(
-            Item={
-                'session_id': session_id,
-                'event_id': request.event_id,
-                'hashed_password': hashed_password,
-                'photo_urls': request.photo_urls,
-                'created_at': int(datetime.now().timestamp())
-            }
-        )
-
-        logger.info(f"Successfully created session with ID: {session_id}")
+        if get_settings().IMAGE_PREFETCH_ON_CREATE:
+            warm_gallery(get_s3_client, BUCKET_NAME, request.photo_urls, label=f"session {session.session_id}")
 
         # Return the session details
-        return SessionResponse(
-            session_id=session_id,
-            session_link=session_link,
-            password=password
-        )
+        return session
 
+    except HTTPException:
+        raise
     except ClientError as e:
         error_message = str(e)
         logger.error(f"DynamoDB ClientError: {error_message}")
@@ -89,3 +65,75 @@ async def create_session(
     except Exception as e:
         logger.error(f"Unexpected error in create_session: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to create session: {str(e)}")
+
+
+def encode_cursor(last_evaluated_key: dict) -> str:
+    """Encode a DynamoDB LastEvaluatedKey as an opaque URL-safe cursor"""
+    # DynamoDB returns numbers as Decimal, which json can't serialise directly
+    plain = {k: int(v) if k == "created_at" else v for k, v in last_evaluated_key.items()}
+    return base64.urlsafe_b64encode(json.dumps(plain).encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> dict:
+    """Decode a cursor produced by encode_cursor back into an ExclusiveStartKey"""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, UnicodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(key, dict) or not {"session_id", "event_id", "created_at"} <= key.keys():
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return key
+
+def to_session_summary(item: dict) -> SessionSummary:
+    """Build a SessionSummary from an event index item"""
+    def as_int(value):
+        return int(value) if value is not None else None
+
+    return SessionSummary(
+        session_id=item["session_id"],
+        event_id=item["event_id"],
+        created_at=int(item["created_at"]),
+        photo_count=as_int(item.get("photo_count")),
+        selection_count=as_int(item.get("selection_count")),
+        last_activity=as_int(item.get("last_activity"))
+    )
+
+@router.get("/event/{event_id}/sessions", response_model=SessionSummaryPage)
+async def list_event_sessions(
+    event_id: str = Path(...),
+    limit: int = Query(25, ge=1, le=MAX_SESSIONS_PAGE),
+    cursor: Optional[str] = Query(None),
+    _operator: None = Depends(require_operator),
+    dynamodb = Depends(get_dynamodb_client)
+):
+    """
+    List the sessions of an event, newest first, using the event index
+    (operators only: it hands out session IDs). Pass the returned
+    next_cursor back as `cursor` to fetch the next page.
+    """
+    from boto3.dynamodb.conditions import Key
+
+    query_args = {
+        "IndexName": EVENT_INDEX_NAME,
+        "KeyConditionExpression": Key("event_id").eq(event_id),
+        "ScanIndexForward": False,
+        "Limit": limit
+    }
+    if cursor:
+        start_key = decode_cursor(cursor)
+        if start_key["event_id"] != event_id:
+            raise HTTPException(status_code=400, detail="Cursor does not belong to this event")
+        query_args["ExclusiveStartKey"] = start_key
+
+    try:
+        table = dynamodb.Table(TABLE_NAME)
+        response = table.query(**query_args)
+    except ClientError as e:
+        error_message = str(e)
+        logger.error(f"DynamoDB ClientError listing sessions for event {event_id}: {error_message}")
+        raise HTTPException(status_code=500, detail=f"Error listing sessions: {error_message}")
+
+    last_key = response.get("LastEvaluatedKey")
+    return SessionSummaryPage(
+        sessions=[to_session_summary(item) for item in response.get("Items", [])],
+        next_cursor=encode_cursor(last_key) if last_key else None
+    )
@@ -1,89 +1,73 @@
-from fastapi import APIRouter, File, UploadFile, Form, HTTPException, Depends, Header, Request
-import boto3
+from fastapi import APIRouter, File, UploadFile, Form, HTTPException, Depends, Header
 from botocore.exceptions import ClientError
 import botocore
 import uuid
-from typing import List
-import os
-from dotenv import load_dotenv
+from typing import List, Optional
 import logging
-import io
-from pydantic import BaseModel
-from fastapi.responses import Response, JSONResponse
+from pydantic import BaseModel, Field
+from fastapi.responses import Response, JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from urllib.parse import urlparse, parse_qs
 import base64
+import io
+import json
+import re
 import httpx
-
-
-
-
-
-from fastapi.middleware.cors import CORSMiddleware
-
-
-# Load environment variables
-load_dotenv()
+from app.core.breaker import DependencyUnavailable
+from app.core.config import get_settings
+from app.core.timing import time_downstream
+from app.models.session import CHANNEL_PATTERN
+from app.services.image_cache import image_cache
+from app.services.progress import progress_hub, TransferProgress
+from app.services.s3 import BUCKET_NAME, get_s3_client
 
 # Initialize router with prefix to prevent duplication
 router = APIRouter(prefix="/api/v1")
 
 logger = logging.getLogger(__name__)
 
-# Use your bucket name
-BUCKET_NAME = "screenmirror-canvas-storage"
+# Downloads and proxied uploads move at most this much at a time
+STREAM_CHUNK_SIZE = 1024 * 1024
 
-# Initialize S3 client as a dependency
-def get_s3_client():
-    # Check if we're in local development mode
-    is_development = os.getenv("ENVIRONMENT") == "development"
+# Streamed multi-photo upload results, one JSON object per line
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
 
-    # For local development, you can use a mock client or the real one with clear error messages
-    if is_development:
-        logger.info("Using S3 client in development mode")
+BASE64_PATTERN = re.compile(r"[A-Za-z0-9+/]*={0,2}")
 
-        # Option 1: Use real client with better error handling
-        try:
-            return boto3.client(
-                's3',
-                region_name='ap-south-1',
-                aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-                aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY')
-            )
-        except Exception as e:
-            logger.error(f"Failed to initialize S3 client: {str(e)}")
-            # In local development, we can continue with a mock client
-            logger.info("Falling back to mock S3 client for local development")
-
-            # Create a mock client for local development
-            class MockS3Client:
-                def upload_fileobj(self, file_object, bucket, key, **kwargs):
-                    logger.info(f"MOCK S3: Would upload to {bucket}/{key}")
-                    # In a real implementation, you might save this to a local folder
-                    return True
-
-                def generate_presigned_url(self, client_method, params, **kwargs):
-                    logger.info(f"MOCK S3: Would generate presigned URL for {params}")
-                    # Return a dummy local URL for testing
-                    return f"http://localhost:8000/mock-s3/{params.get('Bucket', 'bucket')}/{params.get('Key', 'key')}"
-
-            return MockS3Client()
-
-    # For production, use the real client
-    return boto3.client(
-        's3',
-        region_name='ap-south-1',
-        aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-        aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY')
-    )
+def iter_object_body(body, chunk_size: int = STREAM_CHUNK_SIZE):
+    """Yield an S3 object body in chunks, closing it when done or abandoned"""
+    try:
+        yield from body.iter_chunks(chunk_size)
+    finally:
+        body.close()
+
+def iter_object_body_into_cache(body, cache_key: str, content_type: str, chunk_size: int = STREAM_CHUNK_SIZE):
+    """iter_object_body that also stores the object in the image cache once fully sent"""
+    chunks = []
+    for chunk in iter_object_body(body, chunk_size):
+        chunks.append(chunk)
+        yield chunk
+    image_cache.put(cache_key, b"".join(chunks), content_type)
+
+def base64_decoded_length(data: str) -> int:
+    return len(data) // 4 * 3 - (len(data) - len(data.rstrip("=")))
+
+async def iter_base64_decoded(data: str, chunk_size: int = STREAM_CHUNK_SIZE):
+    """Decode validated, padded base64 in chunks of about chunk_size bytes"""
+    step = chunk_size // 3 * 4
+    for start in range(0, len(data), step):
+        yield base64.b64decode(data[start:start + step])
 
 @router.post("/upload-photo")
 async def upload_photo(
     event_id: str = Form(...),
     file: UploadFile = File(...),
+    batch_id: Optional[str] = Form(None, pattern=CHANNEL_PATTERN),
     s3_client = Depends(get_s3_client)
 ):
     """
-    Upload a single photo directly to S3 bucket
+    Upload a single photo directly to S3 bucket. With a batch_id from POST /progress,
+    progress is published to /progress/{batch_id}.
     """
     logger.info(f"Processing upload for event_id: {event_id}, filename: {file.filename}")
 
@@ -98,23 +82,26 @@ async def upload_photo(
         file_key = f"{event_id}/{file_id}/{file.filename}"
         logger.info(f"Generated S3 key: {file_key}")
 
-        # Create a BytesIO object from the file content
-        file_object = io.BytesIO(await file.read())
-
-        # Upload to S3 using the file object
+        # Upload to S3 straight from the spooled upload, a chunk at a time
         logger.info(f"Uploading file to S3: {file_key}")
-        s3_client.upload_fileobj(
-            file_object,
-            BUCKET_NAME,
-            file_key,
-            ExtraArgs={
-                "ContentType": file.content_type
-            }
-        )
+        # upload_fileobj runs on s3transfer's own threads, out of reach of the
+        # request's timing context, so the whole transfer is timed here
+        with time_downstream("s3", "UploadFileobj"):
+            await run_in_threadpool(
+                s3_client.upload_fileobj,
+                file.file,
+                BUCKET_NAME,
+                file_key,
+                ExtraArgs={
+                    "ContentType": file.content_type
+                },
+                Callback=TransferProgress(batch_id, file.filename, file.size)
+            )
         logger.info(f"Successfully uploaded file to S3: {file_key}")
 
         # Generate a URL to access the file (if public)
         file_url = f"https://{BUCKET_NAME}.s3.ap-south-1.amazonaws.com/{file_key}"
+        progress_hub.publish(batch_id, "file_uploaded", filename=file.filename, file_key=file_key, file_url=file_url)
 
         return {
             "success": True,
@@ -126,21 +113,117 @@ async def upload_photo(
     except ClientError as e:
         error_message = str(e)
         logger.error(f"S3 ClientError while uploading file: {error_message}")
+        progress_hub.publish(batch_id, "file_failed", filename=file.filename, error=error_message)
         raise HTTPException(status_code=500, detail=f"Error uploading file: {error_message}")
+    except DependencyUnavailable as e:
+        progress_hub.publish(batch_id, "file_failed", filename=file.filename, error=e.detail)
+        raise
     except Exception as e:
         logger.error(f"Unexpected error in upload_photo: {str(e)}")
+        progress_hub.publish(batch_id, "file_failed", filename=file.filename, error=str(e))
         raise HTTPException(status_code=500, detail=f"Failed to upload photo: {str(e)}")
     finally:
         await file.close()
 
+async def _upload_batch_file(s3_client, file: UploadFile, file_key: str, batch_id: Optional[str], is_development: bool) -> dict:
+    """Upload one file of a multi-photo upload; S3 failures raise HTTPException"""
+    # Log detailed information in development mode
+    if is_development:
+        logger.info(f"Processing file: {file.filename}")
+        logger.info(f"File size: approximately {file.size} bytes")
+
+    # Upload to S3 straight from the spooled upload, a chunk at a time
+    logger.info(f"Uploading file to S3: {file_key}")
+    try:
+        with time_downstream("s3", "UploadFileobj"):
+            await run_in_threadpool(
+                s3_client.upload_fileobj,
+                file.file,
+                BUCKET_NAME,
+                file_key,
+                ExtraArgs={
+                    "ContentType": file.content_type
+                },
+                Callback=TransferProgress(batch_id, file.filename, file.size)
+            )
+        logger.info(f"Successfully uploaded file to S3: {file_key}")
+    except ClientError as s3_error:
+        logger.error(f"S3 Client Error: {str(s3_error)}")
+        if is_development:
+            logger.error(f"S3 Error Response: {s3_error.response if hasattr(s3_error, 'response') else 'No response details'}")
+        raise HTTPException(status_code=500, detail=f"S3 upload failed: {str(s3_error)}")
+    except DependencyUnavailable:
+        raise
+    except Exception as upload_error:
+        logger.error(f"Unexpected upload error: {str(upload_error)}")
+        raise HTTPException(status_code=500, detail=f"Unexpected upload error: {str(upload_error)}")
+
+    # Generate a URL to access the file (if public)
+    file_url = f"https://{BUCKET_NAME}.s3.ap-south-1.amazonaws.com/{file_key}"
+    progress_hub.publish(batch_id, "file_uploaded", filename=file.filename, file_key=file_key, file_url=file_url)
+    return {
+        "filename": file.filename,
+        "file_key": file_key,
+        "file_url": file_url
+    }
+
+def _detach_upload(file: UploadFile) -> UploadFile:
+    """
+    A copy of `file` that owns its spooled data. FastAPI closes the request's
+    form files when the endpoint returns, before a streamed body is sent.
+    """
+    detached = UploadFile(file.file, size=file.size, filename=file.filename, headers=file.headers)
+    file.file = io.BytesIO()
+    return detached
+
+def _ndjson(line: dict) -> bytes:
+    return json.dumps(line).encode() + b"\n"
+
+async def _stream_batch_results(s3_client, event_id: str, session_id: str, files: List[UploadFile],
+                                batch_id: Optional[str], is_development: bool):
+    """One NDJSON line per file as it finishes, then a summary line; failures don't stop the batch"""
+    uploaded = failed = 0
+    try:
+        for file in files:
+            try:
+                if not file.filename:
+                    raise ValueError("Empty filename")
+                file_key = f"{event_id}/{session_id}/{file.filename}"
+                result = await _upload_batch_file(s3_client, file, file_key, batch_id, is_development)
+                uploaded += 1
+                yield _ndjson({"status": "uploaded", **result})
+            except Exception as e:
+                error = e.detail if isinstance(e, HTTPException) else str(e)
+                logger.error(f"Error uploading file {file.filename}: {error}")
+                failed += 1
+                progress_hub.publish(batch_id, "file_failed", filename=file.filename, error=error)
+                yield _ndjson({"status": "failed", "filename": file.filename, "error": error})
+            finally:
+                await file.close()
+    finally:
+        # Also reached when the client goes away mid-batch
+        for file in files:
+            await file.close()
+
+    progress_hub.publish(batch_id, "batch_done", session_id=session_id, uploaded=uploaded, failed=failed)
+    yield _ndjson({"status": "done", "session_id": session_id, "uploaded": uploaded, "failed": failed})
+
 @router.post("/upload-multiple-photos")
 async def upload_multiple_photos(
     event_id: str = Form(...),
     files: List[UploadFile] = File(...),
+    batch_id: Optional[str] = Form(None, pattern=CHANNEL_PATTERN),
+    accept: Optional[str] = Header(None),
     s3_client = Depends(get_s3_client)
 ):
     """
-    Upload multiple photos directly to S3 bucket
+    Upload multiple photos directly to S3 bucket. With a batch_id from POST
+    /progress, per-file progress is published to /progress/{batch_id} while
+    the request runs.
+
+    With `Accept: application/x-ndjson` the response is streamed instead: one
+    JSON line per file as soon as it is stored ("uploaded" or "failed", and a
+    failure doesn't stop the rest), then a "done" line with the session_id.
     """
     logger.info(f"Processing multiple uploads for event_id: {event_id}, file count: {len(files)}")
 
@@ -155,14 +238,22 @@ async def upload_multiple_photos(
     logger.info(f"Generated session_id for batch upload: {session_id}")
 
     # Check if we're in local development mode
-    is_development = os.getenv("ENVIRONMENT") == "development"
+    is_development = get_settings().is_development
 
-    # Log AWS credentials for debugging (ONLY in development mode)
+    # Log AWS settings for debugging (ONLY in development mode)
     if is_development:
-        logger.info(f"AWS Access Key ID: {os.getenv('AWS_ACCESS_KEY_ID')}")
         logger.info(f"AWS Region: ap-south-1")
         logger.info(f"S3 Bucket: {BUCKET_NAME}")
 
+    if accept and NDJSON_MEDIA_TYPE in accept:
+        return StreamingResponse(
+            _stream_batch_results(
+                s3_client, event_id, session_id, [_detach_upload(file) for file in files], batch_id, is_development
+            ),
+            media_type=NDJSON_MEDIA_TYPE,
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
     for file in files:
         try:
             if not file.filename:
@@ -171,46 +262,9 @@ async def upload_multiple_photos(
 
             # Create a unique key for the file
             file_key = f"{event_id}/{session_id}/{file.filename}"
-
-            # Log detailed information in development mode
-            if is_development:
-                logger.info(f"Processing file: {file.filename}")
-                logger.info(f"File size: approximately {len(await file.read())} bytes")
-                await file.seek(0)  # Reset file position after reading
-
-            # Create a BytesIO object from the file content
-            file_object = io.BytesIO(await file.read())
-
-            # Upload to S3 using the file object
-            logger.info(f"Uploading file to S3: {file_key}")
-            try:
-                s3_client.upload_fileobj(
-                    file_object,
-                    BUCKET_NAME,
-                    file_key,
-                    ExtraArgs={
-                        "ContentType": file.content_type
-                    }
-                )
-                logger.info(f"Successfully uploaded file to S3: {file_key}")
-            except ClientError as s3_error:
-                logger.error(f"S3 Client Error: {str(s3_error)}")
-                if is_development:
-                    logger.error(f"S3 Error Response: {s3_error.response if hasattr(s3_error, 'response') else 'No response details'}")
-                raise HTTPException(status_code=500, detail=f"S3 upload failed: {str(s3_error)}")
-            except Exception as upload_error:
-                logger.error(f"Unexpected upload error: {str(upload_error)}")
-                raise HTTPException(status_code=500, detail=f"Unexpected upload error: {str(upload_error)}")
-
-            # Generate a URL to access the file (if public)
-            file_url = f"https://{BUCKET_NAME}.s3.ap-south-1.amazonaws.com/{file_key}"
-
-            results.append({
-                "filename": file.filename,
-                "file_key": file_key,
-                "file_url": file_url
-            })
+            results.append(await _upload_batch_file(s3_client, file, file_key, batch_id, is_development))
         except HTTPException as he:
+            progress_hub.publish(batch_id, "file_failed", filename=file.filename, error=he.detail)
             # Re-raise HTTP exceptions
             raise he
         except Exception as e:
@@ -224,9 +278,11 @@ async def upload_multiple_photos(
                 "filename": file.filename,
                 "error": str(e)
             })
+            progress_hub.publish(batch_id, "file_failed", filename=file.filename, error=str(e))
         finally:
             await file.close()
 
+    progress_hub.publish(batch_id, "batch_done", session_id=session_id, uploaded=len(results), failed=len(errors))
     return {
         "success": len(results) > 0,
         "session_id": session_id,
@@ -317,6 +373,8 @@ async def generate_upload_urls(
             status_code=500,
             detail=f"Error generating presigned URL: {error_code} - {error_message}"
         )
+    except DependencyUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Unexpected error in generate_upload_urls: {str(e)}")
         raise HTTPException(
@@ -386,8 +444,7 @@ async def proxy_image(
     and returns the image data directly, handling the S3 authentication
     """
     # Only allow this in development mode for security
-    is_development = os.getenv("ENVIRONMENT") == "development"
-    if not is_development:
+    if not get_settings().is_development:
         raise HTTPException(status_code=403, detail="This endpoint is only available in development mode")
 
     # Log the request for debugging
@@ -417,17 +474,15 @@ async def proxy_image(
             # Try to get the object from S3
             response = s3_client.get_object(Bucket=BUCKET_NAME, Key=object_key)
 
-            # Get the file content
-            file_content = response['Body'].read()
-
             # Determine the content type or default to image/jpeg
             content_type = response.get('ContentType', 'image/jpeg')
 
-            # Return the file content with appropriate headers
+            # Stream the file content with appropriate headers
             # This bypasses CORS and authentication issues
-            return Response(
-                content=file_content,
-                media_type=content_type
+            return StreamingResponse(
+                iter_object_body(response['Body']),
+                media_type=content_type,
+                headers={"Content-Length": str(response['ContentLength'])}
             )
         except ClientError as e:
             error_code = e.response.get('Error', {}).get('Code')
@@ -438,6 +493,8 @@ async def proxy_image(
             else:
                 raise HTTPException(status_code=500, detail=f"S3 error: {error_code}")
 
+    except DependencyUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Error proxying image: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to proxy image: {str(e)}")
@@ -535,6 +592,8 @@ async def refresh_image_url(
             status_code=500,
             detail=f"Error refreshing URL: {error_code} - {error_message}"
         )
+    except DependencyUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Unexpected error in refresh_image_url: {str(e)}")
         raise HTTPException(
@@ -543,7 +602,7 @@ async def refresh_image_url(
         )
 
 @router.get("/direct-access")
-async def direct_access(url: str, request: Request):
+async def direct_access(url: str):
     """
     Endpoint to proxy image requests directly, bypassing CORS restrictions.
     Works in both development and production environments.
@@ -553,53 +612,13 @@ async def direct_access(url: str, request: Request):
     """
     logger.info(f"Direct access request for URL: {url}")
 
-    # Get config or use defaults
-    if hasattr(request.app.state, 'config'):
-        config = request.app.state.config
-        logger.info(f"Using app state config")
-    else:
-        # Fallback configuration
-        logger.warning("No app state config found, using fallback config")
-        from pydantic import BaseModel
-        class FallbackConfig(BaseModel):
-            AWS_BUCKET_NAME: str = "screenmirror-canvas-storage"
-        config = FallbackConfig()
-
-    # Get S3 client - either from app state or create a new one
-    if hasattr(request.app.state, 's3_client'):
-        client = request.app.state.s3_client
-        logger.info("Using app state S3 client")
-    else:
-        logger.warning("Creating new S3 client as none found in app state")
-        client = boto3.client(
-            's3',
-            region_name='ap-south-1',
-            aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-            aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY')
-        )
-
-    try:
-        # Log request headers for debugging
-        logger.info(f"Request headers: {request.headers}")
-        origin = request.headers.get('origin', 'unknown')
-        logger.info(f"Request origin: {origin}")
-
-        # Check if the origin is allowed
-        allowed_origins = os.getenv("ALLOWED_ORIGINS", "https://photo-share-app-id.web.app").split(",")
-        allowed_origins = [o.strip() for o in allowed_origins if o.strip()]
-
-        # In development, allow localhost
-        if os.getenv("ENVIRONMENT") == "development":
-            allowed_origins.append("http://localhost:3000")
-
-        # For testing, you can uncomment this line to allow all origins
-        # allowed_origins.append("*")
+    config = get_settings()
 
-        # If the origin is not in our allowed list, set default
-        if origin != "unknown" and origin not in allowed_origins and "*" not in allowed_origins:
-            logger.warning(f"Origin {origin} not in allowed origins: {allowed_origins}")
-            # We will continue processing but will set the correct CORS headers later
+    # Shared S3 client (created once, or the local stand-in)
+    client = get_s3_client()
 
+    # CORS headers are added by CorsMiddleware, on errors too
+    try:
         # Security check - only allow S3 URLs
         parsed_url = urlparse(url)
         is_s3_url = ".s3." in parsed_url.netloc or "s3.amazonaws.com" in parsed_url.netloc
@@ -608,13 +627,7 @@ async def direct_access(url: str, request: Request):
             logger.warning(f"Attempted to proxy non-S3 URL: {url}")
             return JSONResponse(
                 status_code=403,
-                content={"detail": "Only S3 URLs can be proxied for security reasons"},
-                headers={
-                    "Access-Control-Allow-Origin": origin,
-                    "Access-Control-Allow-Credentials": "true",
-                    "Access-Control-Allow-Methods": "GET, OPTIONS",
-                    "Access-Control-Allow-Headers": "*"
-                }
+                content={"detail": "Only S3 URLs can be proxied for security reasons"}
             )
 
         # Fetch the actual image data
@@ -653,6 +666,16 @@ async def direct_access(url: str, request: Request):
 
         logger.info(f"Accessing S3 object: bucket={bucket_name}, key={object_key}")
 
+        # Served from memory or disk when cached (photos are warmed on sign-in)
+        cache_key = f"{bucket_name}/{object_key}"
+        cached = await image_cache.get(cache_key)
+        if cached is not None:
+            return Response(
+                content=cached.body,
+                media_type=cached.content_type,
+                headers={"Cache-Control": "public, max-age=86400"}
+            )
+
         try:
             # Get the S3 object
             response = client.get_object(
@@ -663,162 +686,52 @@ async def direct_access(url: str, request: Request):
             # Get the content type
             content_type = response['ContentType']
 
-            # Stream the data
-            data = response['Body'].read()
-
-            # Get the origin from the request headers
-            origin = request.headers.get('origin', '*')
-
-            # Set appropriate CORS headers
-            cors_headers = {
-                "Access-Control-Allow-Methods": "GET, OPTIONS",
-                "Access-Control-Allow-Headers": "*",
-                "Access-Control-Allow-Credentials": "true",
-                "Cache-Control": "public, max-age=86400"  # Cache for 24 hours
-            }
-
-            # Check if origin is allowed
-            allowed_origins = os.getenv("ALLOWED_ORIGINS", "https://photo-share-app-id.web.app").split(",")
-            allowed_origins = [o.strip() for o in allowed_origins if o.strip()]
-            if os.getenv("ENVIRONMENT") == "development":
-                allowed_origins.append("http://localhost:3000")
-
-            # Set Access-Control-Allow-Origin
-            if origin in allowed_origins or "*" in allowed_origins:
-                cors_headers["Access-Control-Allow-Origin"] = origin
-            elif origin != "unknown":
-                # If we have an origin but it's not allowed, use the first allowed origin
-                # This might help in some cases where the domain is the same but with different subdomains
-                if allowed_origins:
-                    cors_headers["Access-Control-Allow-Origin"] = allowed_origins[0]
-                    logger.warning(f"Origin {origin} not allowed, using {allowed_origins[0]} instead")
-                else:
-                    cors_headers["Access-Control-Allow-Origin"] = "https://photo-share-app-id.web.app"
-                    logger.warning(f"No allowed origins found, using default")
+            # Stream the data with the object's content type, keeping small
+            # enough objects for the next request
+            if image_cache.accepts(response['ContentLength']):
+                chunks = iter_object_body_into_cache(response['Body'], cache_key, content_type)
             else:
-                # If no origin, use wildcard for testing
-                cors_headers["Access-Control-Allow-Origin"] = "*"
-                logger.warning(f"No origin found, using wildcard")
-
-            # Return with appropriate content type and CORS headers
-            return Response(
-                content=data,
+                chunks = iter_object_body(response['Body'])
+            return StreamingResponse(
+                chunks,
                 media_type=content_type,
-                headers=cors_headers
+                headers={
+                    "Cache-Control": "public, max-age=86400",  # Cache for 24 hours
+                    "Content-Length": str(response['ContentLength'])
+                }
             )
 
         except botocore.exceptions.ClientError as e:
             error_code = e.response['Error']['Code']
-            origin = request.headers.get('origin', '*')
-
-            # Create consistent CORS headers for error responses
-            allowed_origins = os.getenv("ALLOWED_ORIGINS", "https://photo-share-app-id.web.app").split(",")
-            allowed_origins = [o.strip() for o in allowed_origins if o.strip()]
-            if os.getenv("ENVIRONMENT") == "development":
-                allowed_origins.append("http://localhost:3000")
-
-            cors_headers = {
-                "Access-Control-Allow-Methods": "GET, OPTIONS",
-                "Access-Control-Allow-Headers": "*",
-                "Access-Control-Allow-Credentials": "true",
-            }
-
-            if origin in allowed_origins or "*" in allowed_origins:
-                cors_headers["Access-Control-Allow-Origin"] = origin
-            elif origin != "unknown" and allowed_origins:
-                cors_headers["Access-Control-Allow-Origin"] = allowed_origins[0]
-            else:
-                cors_headers["Access-Control-Allow-Origin"] = "*"
 
             if error_code == 'NoSuchKey':
                 logger.error(f"S3 object not found: {bucket_name}/{object_key}")
                 return JSONResponse(
                     status_code=404,
-                    content={"detail": "Image not found in S3"},
-                    headers=cors_headers
+                    content={"detail": "Image not found in S3"}
                 )
             elif error_code == 'AccessDenied':
                 logger.error(f"Access denied to S3 object: {bucket_name}/{object_key}")
                 return JSONResponse(
                     status_code=403,
-                    content={"detail": "Access denied to the requested image"},
-                    headers=cors_headers
+                    content={"detail": "Access denied to the requested image"}
                 )
             else:
                 logger.error(f"S3 error: {error_code} - {str(e)}")
                 return JSONResponse(
                     status_code=500,
-                    content={"detail": f"S3 error: {error_code}"},
-                    headers=cors_headers
+                    content={"detail": f"S3 error: {error_code}"}
                 )
 
+    except DependencyUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Error proxying image: {str(e)}")
-        origin = request.headers.get('origin', '*')
-
-        # Create consistent CORS headers for general error response
-        allowed_origins = os.getenv("ALLOWED_ORIGINS", "https://photo-share-app-id.web.app").split(",")
-        allowed_origins = [o.strip() for o in allowed_origins if o.strip()]
-        if os.getenv("ENVIRONMENT") == "development":
-            allowed_origins.append("http://localhost:3000")
-
-        cors_headers = {
-            "Access-Control-Allow-Methods": "GET, OPTIONS",
-            "Access-Control-Allow-Headers": "*",
-            "Access-Control-Allow-Credentials": "true",
-        }
-
-        if origin in allowed_origins or "*" in allowed_origins:
-            cors_headers["Access-Control-Allow-Origin"] = origin
-        elif origin != "unknown" and allowed_origins:
-            cors_headers["Access-Control-Allow-Origin"] = allowed_origins[0]
-        else:
-            cors_headers["Access-Control-Allow-Origin"] = "*"
-
         return JSONResponse(
             status_code=500,
-            content={"detail": f"Failed to proxy image: {str(e)}"},
-            headers=cors_headers
+            content={"detail": f"Failed to proxy image: {str(e)}"}
         )
 
-@router.options("/direct-access")
-async def direct_access_options(request: Request):
-    """Handle OPTIONS requests for CORS preflight checks."""
-    origin = request.headers.get('origin', '*')
-
-    # Check if origin is allowed
-    allowed_origins = os.getenv("ALLOWED_ORIGINS", "https://photo-share-app-id.web.app").split(",")
-    allowed_origins = [o.strip() for o in allowed_origins if o.strip()]
-    if os.getenv("ENVIRONMENT") == "development":
-        allowed_origins.append("http://localhost:3000")
-
-    # Create CORS headers
-    cors_headers = {
-        "Access-Control-Allow-Methods": "GET, OPTIONS",
-        "Access-Control-Allow-Headers": "*",
-        "Access-Control-Allow-Credentials": "true",
-        "Access-Control-Max-Age": "3600",
-    }
-
-    # Set Access-Control-Allow-Origin
-    if origin in allowed_origins or "*" in allowed_origins:
-        cors_headers["Access-Control-Allow-Origin"] = origin
-    elif origin != "unknown":
-        if allowed_origins:
-            cors_headers["Access-Control-Allow-Origin"] = allowed_origins[0]
-            logger.warning(f"OPTIONS: Origin {origin} not allowed, using {allowed_origins[0]} instead")
-        else:
-            cors_headers["Access-Control-Allow-Origin"] = "https://photo-share-app-id.web.app"
-            logger.warning(f"OPTIONS: No allowed origins found, using default")
-    else:
-        cors_headers["Access-Control-Allow-Origin"] = "*"
-        logger.warning(f"OPTIONS: No origin found, using wildcard")
-
-    return Response(
-        content="",
-        headers=cors_headers
-    )
-
 # Add new model for proxy upload request
 class ProxyUploadRequest(BaseModel):
     presigned_url: str
@@ -839,9 +752,15 @@ async def proxy_upload(
         # Parse the URL to extract important information
         parsed_url = urlparse(request.presigned_url)
 
-        # Decode the base64 file content
+        # Decode the base64 file content a chunk at a time while sending it;
+        # anything but plain padded base64 is decoded up front as before
         try:
-            file_content = base64.b64decode(request.file_content)
+            if BASE64_PATTERN.fullmatch(request.file_content) and len(request.file_content) % 4 == 0:
+                content_length = base64_decoded_length(request.file_content)
+                file_content = iter_base64_decoded(request.file_content)
+            else:
+                file_content = base64.b64decode(request.file_content)
+                content_length = len(file_content)
         except Exception as e:
             logger.error(f"Failed to decode base64 content: {e}")
             raise HTTPException(
@@ -849,9 +768,6 @@ async def proxy_upload(
                 detail=f"Invalid base64 encoding: {str(e)}"
             )
 
-        # Create a file-like object from the decoded content
-        file_obj = io.BytesIO(file_content)
-
         # Make the request to S3 using the presigned URL
         async with httpx.AsyncClient() as client:
             # Extract content type from presigned URL query parameters if available
@@ -862,11 +778,12 @@ async def proxy_upload(
                 content_type = query_params["Content-Type"][0]
 
             # Make the PUT request to S3
-            response = await client.put(
-                request.presigned_url,
-                content=file_content,
-                headers={"Content-Type": content_type}
-            )
+            with time_downstream("s3", "PresignedPut"):
+                response = await client.put(
+                    request.presigned_url,
+                    content=file_content,
+                    headers={"Content-Type": content_type, "Content-Length": str(content_length)}
+                )
 
             if response.status_code not in [200, 204]:
                 logger.error(f"S3 upload failed: {response.status_code} - {response.text}")
@@ -912,6 +829,8 @@ class CompleteMultipartUploadRequest(BaseModel):
     file_name: str
     upload_id: str
     parts: List[dict]
+    # Publishes file_uploaded / file_failed to /progress/{batch_id} (issued by POST /progress)
+    batch_id: Optional[str] = Field(None, pattern=CHANNEL_PATTERN)
 
 @router.post("/generate-multipart-upload-urls")
 async def generate_multipart_upload_urls(
@@ -968,6 +887,8 @@ async def generate_multipart_upload_urls(
             "message": "Multipart upload initiated successfully",
             "upload_configs": upload_configs
         }
+    except DependencyUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Error in generate_multipart_upload_urls: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to initiate multipart upload: {str(e)}")
@@ -1045,6 +966,8 @@ async def get_presigned_upload_part_url(
         except ClientError as e:
             logger.error(f"Error generating presigned URL for part: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Failed to generate presigned URL: {str(e)}")
+    except DependencyUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Error in get_presigned_upload_part_url: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to get presigned URL: {str(e)}")
@@ -1102,6 +1025,7 @@ async def complete_multipart_upload(
             final_url = response.get('Location')
             if not final_url:
                 final_url = f"https://{BUCKET_NAME}.s3.amazonaws.com/{file_key}"
+            progress_hub.publish(request.batch_id, "file_uploaded", filename=file_name, file_key=file_key, file_url=final_url)
 
             return {
                 "message": "Multipart upload completed successfully",
@@ -1110,6 +1034,7 @@ async def complete_multipart_upload(
             }
         except ClientError as e:
             logger.error(f"Error completing multipart upload: {str(e)}")
+            progress_hub.publish(request.batch_id, "file_failed", filename=file_name, error=str(e))
 
             # Provide more detailed error information
             error_msg = str(e)
@@ -1118,6 +1043,8 @@ async def complete_multipart_upload(
                 raise HTTPException(status_code=400, detail="Invalid parts list. Some parts may be missing or incorrect.")
 
             raise HTTPException(status_code=500, detail=f"Failed to complete multipart upload: {str(e)}")
+    except DependencyUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Error in complete_multipart_upload: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to complete multipart upload: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,64 @@
+"""
+boto3 clients, created on first use.
+
+Importing boto3 and building a client loads botocore's service models, which
+is the slowest part of starting the app; nothing here runs at import time.
+"""
+from functools import lru_cache
+
+from app.core.config import get_settings
+
+
+def _boto3():
+    import boto3
+    from app.core.timing import instrument_boto3
+
+    instrument_boto3()
+    return boto3
+
+
+def _credentials() -> dict:
+    settings = get_settings()
+    return {
+        "aws_access_key_id": settings.AWS_ACCESS_KEY_ID,
+        "aws_secret_access_key": settings.AWS_SECRET_ACCESS_KEY,
+    }
+
+
+def _api_config():
+    """Tight timeouts and few retries, so a degraded service trips its breaker quickly"""
+    from botocore.config import Config
+
+    settings = get_settings()
+    return Config(
+        connect_timeout=settings.AWS_CONNECT_TIMEOUT_SECONDS,
+        read_timeout=settings.AWS_READ_TIMEOUT_SECONDS,
+        retries={"mode": "standard", "max_attempts": settings.AWS_MAX_ATTEMPTS},
+    )
+
+
+@lru_cache()
+def s3_client(region_name: str = "ap-south-1"):
+    """Shared S3 client (boto3 clients are thread-safe)"""
+    from app.core.breaker import protect_client
+
+    return protect_client(
+        _boto3().client("s3", region_name=region_name, config=_api_config(), **_credentials())
+    )
+
+
+def dynamodb_resource(region_name: str = "ap-south-1"):
+    """A new DynamoDB resource; resources aren't thread-safe, so they aren't shared"""
+    from app.core.breaker import protect_client
+
+    resource = _boto3().resource("dynamodb", region_name=region_name, config=_api_config(), **_credentials())
+    protect_client(resource.meta.client)
+    return resource
+
+
+def s3_bulk_client(max_connections: int, region_name: str = "ap-south-1"):
+    """A new S3 client with a connection pool for `max_connections` concurrent requests (bulk tools)"""
+    from botocore.config import Config
+
+    config = Config(max_pool_connections=max_connections, retries={"mode": "adaptive", "max_attempts": 10})
+    return _boto3().client("s3", region_name=region_name, config=config, **_credentials())
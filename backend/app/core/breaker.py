@@ -0,0 +1,158 @@
+"""
+Circuit breakers for S3 and DynamoDB.
+
+Each dependency has a breaker fed by botocore's call events on the API's
+clients (see app.core.aws). After BREAKER_FAILURE_THRESHOLD consecutive
+failed calls (connection errors, timeouts, 5xx and throttling, counted after
+botocore's own retries) the breaker opens: calls fail at once with
+DependencyUnavailable, a 503 with Retry-After, instead of each request
+waiting out the timeouts. After BREAKER_RESET_SECONDS one call is let
+through as a probe; its success closes the breaker, its failure opens it for
+another period. Errors like NoSuchKey or a failed condition mean the
+dependency is answering and count as successes.
+
+Endpoints that can answer from a cache (image cache, photo list cache) still
+do while a breaker is open.
+"""
+from typing import Dict, Tuple
+import logging
+import math
+import threading
+import time
+
+from fastapi import HTTPException
+
+from app.core.config import get_settings
+from app.core.metrics import CallbackGauge, Counter, registry
+
+logger = logging.getLogger(__name__)
+
+BREAKER_ENABLED = get_settings().BREAKER_ENABLED
+BREAKER_FAILURE_THRESHOLD = get_settings().BREAKER_FAILURE_THRESHOLD
+BREAKER_RESET_SECONDS = get_settings().BREAKER_RESET_SECONDS
+
+# Error codes that mean the service is overloaded rather than the request wrong
+THROTTLING_CODES = {
+    "SlowDown", "Throttling", "ThrottlingException", "RequestLimitExceeded",
+    "ProvisionedThroughputExceededException", "RequestThrottled",
+}
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class DependencyUnavailable(HTTPException):
+    """A call refused because the dependency's breaker is open"""
+
+    def __init__(self, dependency: str, retry_after: float):
+        super().__init__(
+            status_code=503,
+            detail=f"{dependency} is unavailable, please retry",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+        self.dependency = dependency
+
+
+class CircuitBreaker:
+    """Closed -> open after repeated failures -> half-open probe -> closed or open again"""
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_started = 0.0
+        # Calls come from the event loop and from worker threads
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raise DependencyUnavailable unless a call may go ahead now"""
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            now = time.monotonic()
+            if self.state == OPEN and now - self.opened_at >= self.reset_seconds:
+                self.state = HALF_OPEN
+                self.probe_started = now
+                return
+            if self.state == HALF_OPEN and now - self.probe_started >= self.reset_seconds:
+                # The probe never reported back; let another one through
+                self.probe_started = now
+                return
+            _REJECTED.labels(self.name).inc()
+            retry_after = self.reset_seconds - (now - self.opened_at) if self.state == OPEN else 1
+        raise DependencyUnavailable(self.name, retry_after)
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            if self.state != CLOSED:
+                logger.info(f"Circuit breaker for {self.name} closed")
+                self.state = CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                logger.warning(f"Circuit breaker for {self.name} opened after {self.failures} failures")
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+
+breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    breaker = breakers.get(name)
+    if breaker is None:
+        breaker = breakers.setdefault(name, CircuitBreaker(name))
+    return breaker
+
+
+def _failed(http_response, parsed) -> bool:
+    status = getattr(http_response, "status_code", None) or 0
+    code = (parsed or {}).get("Error", {}).get("Code")
+    return status >= 500 or code in THROTTLING_CODES
+
+
+def _before_call(model, **kwargs):
+    get_breaker(model.service_model.service_name).before_call()
+
+
+def _after_call(model, http_response=None, parsed=None, **kwargs):
+    breaker = get_breaker(model.service_model.service_name)
+    if _failed(http_response, parsed):
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+
+
+def _after_call_error(model, **kwargs):
+    # Connection errors and timeouts, once botocore's retries are used up
+    get_breaker(model.service_model.service_name).record_failure()
+
+
+def protect_client(client):
+    """Put a boto3 client's calls behind the breaker of its service"""
+    if not BREAKER_ENABLED:
+        return client
+    events = client.meta.events
+    events.register("before-call.*.*", _before_call, unique_id="photoshare-breaker-before")
+    events.register("after-call.*.*", _after_call, unique_id="photoshare-breaker-after")
+    events.register("after-call-error.*.*", _after_call_error, unique_id="photoshare-breaker-error")
+    return client
+
+
+def _states() -> Dict[Tuple[str, ...], float]:
+    return {(name,): _STATE_VALUES[breaker.state] for name, breaker in breakers.items()}
+
+
+_REJECTED = registry.register(Counter(
+    "photoshare_circuit_rejected_total", "Calls refused by an open circuit breaker", ["dependency"]
+))
+registry.register(CallbackGauge(
+    "photoshare_circuit_state", "Circuit breaker state (0 closed, 1 half-open, 2 open)", ["dependency"], _states
+))
@@ -1,46 +1,165 @@
-# from typing import List, Optional
-# from pydantic_settings import BaseSettings
-# from pydantic import AnyHttpUrl
-
-# class Settings(BaseSettings):
-#     # Server settings
-#     HOST: str = "0.0.0.0"
-#     PORT: int = 8000
-#     ENVIRONMENT: str = "production"
-
-#     # Database settings
-#     DATABASE_URL: str = "sqlite:///./photoshare.db"
-
-#     # Security settings
-#     SECRET_KEY: str = "your-super-secret-key-change-this-in-production"
-
-#     # CORS settings
-#     ALLOWED_ORIGINS: str = "*"
-
-#     # AWS settings
-#     AWS_ACCESS_KEY_ID: str
-#     AWS_SECRET_ACCESS_KEY: str
-#     AWS_DEFAULT_REGION: str = "ap-south-1"  # Default to Mumbai region if not specified
-
-#     # Frontend URL settings
-#     FRONTEND_URL: str = "https://main.d1q28qol42ug2a.amplifyapp.com"  # Default to production URL
-#     BACKEND_URL: Optional[str] = None  # Will be set based on request
-
-#     class Config:
-#         env_file = ".env"
-#         case_sensitive = True
-#         extra = "allow"
-
-#     @property
-#     def cors_origins(self) -> List[str]:
-#         if self.ENVIRONMENT == "development" or self.ALLOWED_ORIGINS == "*":
-#             return ["*"]
-#         return [origin.strip() for origin in self.ALLOWED_ORIGINS.split(",")]
-
-#     @property
-#     def api_url(self) -> str:
-#         if self.BACKEND_URL:
-#             return f"{self.BACKEND_URL}/api/v1"
-#         return "/api/v1"  # Relative URL if BACKEND_URL is not set
-
-# settings = Settings()
\ No newline at end of file
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Optional
+import os
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+BACKEND_DIR = Path(__file__).resolve().parents[2]
+
+
+class Settings(BaseSettings):
+    """
+    All configuration, read once from the environment and .env. Use
+    get_settings() rather than os.getenv so values are parsed and typed in
+    one place.
+    """
+    model_config = SettingsConfigDict(
+        # backend/.env, then ./.env when started from elsewhere
+        env_file=(BACKEND_DIR / ".env", ".env"),
+        extra="ignore",
+    )
+
+    # Server
+    ENVIRONMENT: str = "production"
+    # Comma-separated; "https://*.example.com" allows its subdomains, "*" any other
+    # origin (answered with a literal "*" and no credentials)
+    ALLOWED_ORIGINS: str = "https://photo-share-app-id.web.app"
+    CORS_MAX_AGE: int = 3600
+    FRONTEND_URL: Optional[str] = None
+    BASE_URL: Optional[str] = None
+
+    # AWS
+    AWS_ACCESS_KEY_ID: Optional[str] = None
+    AWS_SECRET_ACCESS_KEY: Optional[str] = None
+    AWS_DEFAULT_REGION: str = "ap-south-1"
+    AWS_BUCKET_NAME: str = "screenmirror-canvas-storage"
+    # Fail fast when AWS is slow: per-attempt timeouts, attempts per call
+    AWS_CONNECT_TIMEOUT_SECONDS: float = 2
+    AWS_READ_TIMEOUT_SECONDS: float = 10
+    AWS_MAX_ATTEMPTS: int = 2
+    # Circuit breakers per dependency (S3, DynamoDB): open after this many
+    # consecutive failed calls, probe again after BREAKER_RESET_SECONDS
+    BREAKER_ENABLED: bool = True
+    BREAKER_FAILURE_THRESHOLD: int = 5
+    BREAKER_RESET_SECONDS: float = 15
+
+    # Storage backend: "s3" (AWS) or "local" (filesystem + SQLite stand-ins)
+    STORAGE_BACKEND: str = "s3"
+    LOCAL_STORAGE_DIR: str = "./.local_storage"
+    LOCAL_STORAGE_URL: str = "http://localhost:8000"
+
+    # Sessions and auth
+    JWT_SECRET_KEY: str = "your-secret-key-change-in-production"
+    # X-Operator-Token for operator routes (event session listing); unset disables them
+    OPERATOR_TOKEN: str = ""
+    SESSION_TTL_DAYS: int = 90
+    # DynamoDB TTL (purge_at) removes a session item this long after it expires,
+    # leaving the sweeper time to delete its photos first
+    SESSION_PURGE_GRACE_DAYS: int = 7
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = min(4, os.cpu_count() or 1)
+    PASSWORD_HASH_QUEUE_SIZE: int = 64
+    TOKEN_CACHE_SIZE: int = 4096
+    PHOTO_LIST_CACHE_SIZE: int = 2048
+    # Photos a ZIP download opens ahead of the one being written
+    DOWNLOAD_PREFETCH: int = 4
+
+    # direct-access image cache: memory LRU plus a per-process disk tier. Per worker
+    # it holds up to IMAGE_CACHE_MEMORY_MB, plus IMAGE_PREFETCH_CONCURRENCY photos of
+    # up to IMAGE_CACHE_MAX_ITEM_MB being fetched, and IMAGE_CACHE_DISK_MB on disk
+    IMAGE_CACHE_ENABLED: bool = True
+    IMAGE_CACHE_MEMORY_MB: int = 64
+    IMAGE_CACHE_DISK_MB: int = 1024
+    IMAGE_CACHE_MAX_ITEM_MB: float = 8
+    IMAGE_CACHE_TTL_SECONDS: int = 3600
+    IMAGE_CACHE_DIR: str = "/tmp/photoshare-image-cache"
+    # Gallery warm-up after a guest signs in (and optionally on session create)
+    IMAGE_PREFETCH_PHOTOS: int = 24
+    IMAGE_PREFETCH_CONCURRENCY: int = 4
+    IMAGE_PREFETCH_MAX_MB: int = 32
+    IMAGE_PREFETCH_ON_CREATE: bool = False
+
+    # Photo metadata index (size, orientation, capture time) built on session create
+    PHOTO_META_ENABLED: bool = True
+    PHOTO_META_WORKERS: int = 8
+    PHOTO_META_HEADER_KB: int = 64
+    # BlurHash placeholders; photos without an EXIF preview are read whole up to this
+    # size, two at a time per worker
+    PHOTO_PLACEHOLDERS_ENABLED: bool = True
+    PHOTO_PLACEHOLDER_MAX_MB: float = 4
+    # Perceptual hashes for /photos?collapse=bursts: frames at most this many seconds
+    # and hash bits (of 64) apart belong to the same burst
+    BURST_INDEX_ENABLED: bool = True
+    BURST_MAX_GAP_SECONDS: float = 2
+    BURST_MAX_DISTANCE: int = 10
+
+    # Progress events (/progress/{channel}, Server-Sent Events)
+    PROGRESS_QUEUE_SIZE: int = 256
+    PROGRESS_HISTORY_SIZE: int = 256
+    PROGRESS_RETENTION_SECONDS: int = 900
+    PROGRESS_HEARTBEAT_SECONDS: float = 15
+
+    # Auth rate limits
+    AUTH_RATE_LIMIT_STORE: str = "memory"
+    AUTH_RATE_LIMIT_DB: str = "/tmp/photoshare_rate_limit.sqlite3"
+    AUTH_SESSION_BURST: float = 10
+    AUTH_SESSION_REFILL_PER_MINUTE: float = 10
+    AUTH_IP_BURST: float = 30
+    AUTH_IP_REFILL_PER_MINUTE: float = 60
+
+    # Expired session sweeper
+    SWEEPER_ENABLED: bool = False
+    SWEEPER_DRY_RUN: bool = False
+    SWEEPER_INTERVAL_SECONDS: int = 3600
+    SWEEPER_REQUESTS_PER_SECOND: float = 5
+    SWEEPER_MULTIPART_MAX_AGE_HOURS: int = 24
+    # Only the process holding this lock sweeps (one per host)
+    SWEEPER_LOCK_FILE: str = "/tmp/photoshare-sweeper.lock"
+
+    # Logging and instrumentation
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json"
+    LOG_SAMPLE_RATES: str = "direct-access=0.1,default=1"
+    SLOW_REQUEST_MS: float = 1000
+    SERVER_TIMING_ENABLED: bool = True
+
+    # Per-request profiling (staging only)
+    PROFILING_ENABLED: bool = False
+    PROFILING_TOKEN: str = ""
+    PROFILING_INTERVAL_MS: float = 5
+    PROFILING_MAX_SECONDS: float = 30
+    PROFILING_DIR: str = "/tmp/photoshare-profiles"
+    PROFILING_MAX_FILES: int = 50
+
+    @property
+    def is_development(self) -> bool:
+        return self.ENVIRONMENT == "development"
+
+    @property
+    def use_local_storage(self) -> bool:
+        return self.STORAGE_BACKEND == "local"
+
+    @property
+    def cors_origins(self) -> List[str]:
+        """ALLOWED_ORIGINS as a list, plus the local Flutter dev server in development"""
+        origins = [origin.strip() for origin in self.ALLOWED_ORIGINS.split(",") if origin.strip()]
+        if self.is_development:
+            origins.append("http://localhost:3000")
+        return origins
+
+    @property
+    def frontend_url(self) -> str:
+        return self.FRONTEND_URL or self.BASE_URL or "http://localhost:3000"
+
+    @property
+    def SECRET_KEY(self) -> str:
+        return self.JWT_SECRET_KEY
+
+
+@lru_cache()
+def get_settings() -> Settings:
+    return Settings()
+
+
+settings = get_settings()
@@ -0,0 +1,231 @@
+"""
+CORS for the whole app, answered in one place.
+
+The allowed origins are compiled once: exact origins go in a set, wildcard
+subdomain patterns ("https://*.example.com") in a set of (scheme, suffix, port)
+keys, so checking an origin is a few set lookups. The response headers for an
+origin are built the first time it is seen and reused as a tuple after that.
+
+"*" allows every other origin too, but only without credentials: those get a
+literal `Access-Control-Allow-Origin: *`, so no site can make credentialed
+requests just because "*" is configured.
+
+Preflight requests are answered by the middleware itself and never reach
+routing; browsers may cache the answer for CORS_MAX_AGE seconds.
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+import logging
+
+logger = logging.getLogger(__name__)
+
+Headers = Tuple[Tuple[bytes, bytes], ...]
+
+ALLOW_METHODS = b"DELETE, GET, HEAD, OPTIONS, PATCH, POST, PUT"
+EXPOSE_HEADERS = b"Content-Type, Content-Length, Content-Disposition"
+
+# Bounds the per-origin header caches; a client can send any Origin it likes
+MAX_CACHED_ORIGINS = 1024
+
+
+def _split_origin(origin: str) -> Optional[Tuple[str, str, str]]:
+    """Split e.g. https://a.example.com:8443 into ("https", "a.example.com", "8443")"""
+    scheme, sep, netloc = origin.strip().rstrip("/").lower().partition("://")
+    if not sep or not netloc or "/" in netloc:
+        return None
+    host, _, port = netloc.partition(":")
+    return scheme, host, port
+
+
+def _configured_origin(origin: str) -> str:
+    """A configured origin without the path some settings carry (https://x.web.app/app)"""
+    parsed = urlsplit(origin.strip())
+    if not parsed.scheme or not parsed.netloc:
+        return origin
+    if parsed.path.strip("/") or parsed.query or parsed.fragment:
+        logger.warning(f"CORS origin {origin!r} has a path; allowing {parsed.scheme}://{parsed.netloc}")
+    return f"{parsed.scheme}://{parsed.netloc}"
+
+
+class CorsPolicy:
+    """Compiled set of allowed origins and the headers to send for them"""
+
+    def __init__(self, origins: Iterable[str], allow_credentials: bool = True, max_age: int = 3600):
+        self.allow_all = False
+        self.exact = set()
+        self.wildcards = set()
+        for origin in origins:
+            if origin.strip() == "*":
+                self.allow_all = True
+                continue
+            parts = _split_origin(_configured_origin(origin))
+            if parts is None:
+                logger.warning(f"Ignoring invalid CORS origin {origin!r}")
+                continue
+            scheme, host, port = parts
+            if host.startswith("*."):
+                self.wildcards.add((scheme, host[1:], port))
+            else:
+                self.exact.add(f"{scheme}://{host}:{port}" if port else f"{scheme}://{host}")
+
+        credentials = ((b"access-control-allow-credentials", b"true"),) if allow_credentials else ()
+        # Vary: Origin is merged into the response's own Vary by the middleware
+        self._simple_headers: Headers = credentials + (
+            (b"access-control-expose-headers", EXPOSE_HEADERS),
+        )
+        self._preflight_headers: Headers = credentials + (
+            (b"access-control-allow-methods", ALLOW_METHODS),
+            (b"access-control-max-age", str(max_age).encode()),
+            (b"vary", b"Origin"),
+        )
+        # For origins only allowed by "*": no credentials
+        self._any_simple_headers: Headers = (
+            (b"access-control-allow-origin", b"*"),
+            (b"access-control-expose-headers", EXPOSE_HEADERS),
+        )
+        self._any_preflight_headers: Headers = (
+            (b"access-control-allow-origin", b"*"),
+            (b"access-control-allow-methods", ALLOW_METHODS),
+            (b"access-control-max-age", str(max_age).encode()),
+            (b"vary", b"Origin"),
+        )
+        self._simple_cache: Dict[bytes, Optional[Headers]] = {}
+        self._preflight_cache: Dict[Tuple[bytes, bytes], Headers] = {}
+
+    @classmethod
+    def from_settings(cls, settings) -> "CorsPolicy":
+        return cls(settings.cors_origins, max_age=settings.CORS_MAX_AGE)
+
+    def is_allowed(self, origin: str) -> bool:
+        return self.allow_all or self.is_listed(origin)
+
+    def is_listed(self, origin: str) -> bool:
+        """Whether `origin` is one of the configured origins (not just allowed by "*")"""
+        parts = _split_origin(origin)
+        if parts is None:
+            return False
+        scheme, host, port = parts
+        if (f"{scheme}://{host}:{port}" if port else f"{scheme}://{host}") in self.exact:
+            return True
+        if self.wildcards:
+            # ".b.example.com", ".example.com", ".com" for "a.b.example.com"
+            dot = host.find(".")
+            while dot != -1:
+                if (scheme, host[dot:], port) in self.wildcards:
+                    return True
+                dot = host.find(".", dot + 1)
+        return False
+
+    def simple_headers(self, origin: bytes) -> Optional[Headers]:
+        """Headers for an actual request from `origin`, or None if it isn't allowed"""
+        try:
+            return self._simple_cache[origin]
+        except KeyError:
+            pass
+        headers = None
+        if self.is_listed(origin.decode("latin-1")):
+            headers = ((b"access-control-allow-origin", origin),) + self._simple_headers
+        elif self.allow_all:
+            headers = self._any_simple_headers
+        _remember(self._simple_cache, origin, headers)
+        return headers
+
+    def preflight_headers(self, origin: bytes, request_headers: bytes) -> Optional[Headers]:
+        """Headers answering a preflight, or None if the origin isn't allowed"""
+        key = (origin, request_headers)
+        try:
+            return self._preflight_cache[key]
+        except KeyError:
+            pass
+        simple = self.simple_headers(origin)
+        if simple is None:
+            return None
+        if simple is self._any_simple_headers:
+            headers = self._any_preflight_headers
+        else:
+            headers = ((b"access-control-allow-origin", origin),) + self._preflight_headers
+        if request_headers:
+            # Any header may be sent; "*" isn't honoured for credentialed requests
+            headers += ((b"access-control-allow-headers", request_headers),)
+        _remember(self._preflight_cache, key, headers)
+        return headers
+
+
+def with_vary_origin(headers: List[Tuple[bytes, bytes]]) -> List[Tuple[bytes, bytes]]:
+    """Add Origin to the response's Vary header, or add one"""
+    for i, (name, value) in enumerate(headers):
+        if name.lower() == b"vary":
+            tokens = {token.strip().lower() for token in value.split(b",")}
+            if b"origin" not in tokens and b"*" not in tokens:
+                headers[i] = (name, value + b", Origin")
+            return headers
+    headers.append((b"vary", b"Origin"))
+    return headers
+
+
+def _remember(cache: Dict, key, value):
+    if len(cache) >= MAX_CACHED_ORIGINS:
+        cache.clear()
+    cache[key] = value
+
+
+class CorsMiddleware:
+    """Adds CORS headers for allowed origins and answers preflight requests"""
+
+    def __init__(self, app, policy: CorsPolicy):
+        self.app = app
+        self.policy = policy
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        origin = request_method = None
+        request_headers = b""
+        for name, value in scope["headers"]:
+            if name == b"origin":
+                origin = value
+            elif name == b"access-control-request-method":
+                request_method = value
+            elif name == b"access-control-request-headers":
+                request_headers = value
+
+        if origin is None:
+            await self.app(scope, receive, send)
+            return
+
+        if scope["method"] == "OPTIONS" and request_method is not None:
+            await self._preflight(origin, request_headers, send)
+            return
+
+        cors_headers = self.policy.simple_headers(origin)
+        if cors_headers is None:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cors(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = with_vary_origin(list(message.get("headers", [])) + list(cors_headers))
+            await send(message)
+
+        await self.app(scope, receive, send_with_cors)
+
+    async def _preflight(self, origin: bytes, request_headers: bytes, send):
+        headers = self.policy.preflight_headers(origin, request_headers)
+        if headers is None:
+            body = b"Disallowed CORS origin"
+            await send({
+                "type": "http.response.start",
+                "status": 400,
+                "headers": [(b"content-type", b"text/plain; charset=utf-8"),
+                            (b"content-length", str(len(body)).encode())],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": list(headers) + [(b"content-length", b"0")],
+        })
+        await send({"type": "http.response.body", "body": b""})
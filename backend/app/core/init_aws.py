@@ -1,6 +1,8 @@
 import boto3
 from botocore.exceptions import ClientError
 import logging
+from datetime import datetime
+from typing import List, Tuple
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
@@ -96,5 +98,250 @@ def create_s3_bucket():
         logger.error(f"Unexpected error in create_s3_bucket: {str(e)}")
         raise e
 
+def _create_index(name: str, hash_key: Tuple[str, str], range_key: Tuple[str, str], attributes: List[str]):
+    """Add a GSI with the given (name, type) keys and projected attributes to the sessions table if it is missing"""
+    from app.services.dynamodb import TABLE_NAME
+
+    dynamodb_client = boto3.client(
+        'dynamodb',
+        region_name=settings.AWS_DEFAULT_REGION,
+        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY
+    )
+
+    table = dynamodb_client.describe_table(TableName=TABLE_NAME)['Table']
+    existing = [index['IndexName'] for index in table.get('GlobalSecondaryIndexes', [])]
+    if name in existing:
+        logger.info(f"Index {name} already exists on {TABLE_NAME}")
+        return
+
+    index = {
+        'IndexName': name,
+        'KeySchema': [
+            {'AttributeName': hash_key[0], 'KeyType': 'HASH'},
+            {'AttributeName': range_key[0], 'KeyType': 'RANGE'}
+        ],
+        'Projection': {
+            'ProjectionType': 'INCLUDE',
+            'NonKeyAttributes': attributes
+        }
+    }
+    billing_mode = table.get('BillingModeSummary', {}).get('BillingMode', 'PROVISIONED')
+    if billing_mode == 'PROVISIONED':
+        throughput = table['ProvisionedThroughput']
+        index['ProvisionedThroughput'] = {
+            'ReadCapacityUnits': throughput['ReadCapacityUnits'],
+            'WriteCapacityUnits': throughput['WriteCapacityUnits']
+        }
+
+    logger.info(f"Creating index {name} on {TABLE_NAME}")
+    dynamodb_client.update_table(
+        TableName=TABLE_NAME,
+        AttributeDefinitions=[
+            {'AttributeName': hash_key[0], 'AttributeType': hash_key[1]},
+            {'AttributeName': range_key[0], 'AttributeType': range_key[1]}
+        ],
+        GlobalSecondaryIndexUpdates=[{'Create': index}]
+    )
+    logger.info(f"Index {name} is being built; it becomes queryable once ACTIVE")
+
+def create_event_index():
+    """Add the (event_id, created_at) GSI to the sessions table if it is missing"""
+    from app.services.dynamodb import EVENT_INDEX_NAME, EVENT_INDEX_ATTRIBUTES
+
+    _create_index(EVENT_INDEX_NAME, ('event_id', 'S'), ('created_at', 'N'), EVENT_INDEX_ATTRIBUTES)
+
+def create_expiry_index():
+    """
+    Add the sparse (expiry_shard, expires_at) GSI the sweeper queries to the
+    sessions table if it is missing. Sessions created before it need
+    backfill_session_expiry to get an expiry_shard.
+    """
+    from app.services.dynamodb import EXPIRY_INDEX_NAME, EXPIRY_INDEX_ATTRIBUTES
+
+    _create_index(EXPIRY_INDEX_NAME, ('expiry_shard', 'N'), ('expires_at', 'N'), EXPIRY_INDEX_ATTRIBUTES)
+
+def enable_session_ttl():
+    """
+    Enable DynamoDB TTL on the sessions table using the purge_at attribute.
+    Not expires_at: TTL could then delete an item before the sweeper has
+    removed its photos.
+    """
+    from app.services.dynamodb import TABLE_NAME
+
+    dynamodb_client = boto3.client(
+        'dynamodb',
+        region_name=settings.AWS_DEFAULT_REGION,
+        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY
+    )
+
+    ttl = dynamodb_client.describe_time_to_live(TableName=TABLE_NAME)['TimeToLiveDescription']
+    if ttl.get('TimeToLiveStatus') in ('ENABLED', 'ENABLING'):
+        if ttl.get('AttributeName') == 'purge_at':
+            logger.info(f"TTL already enabled on {TABLE_NAME} (purge_at)")
+        else:
+            # The attribute can't be switched in place; disable TTL, wait for it
+            # to settle (up to an hour) and run this again
+            logger.warning(
+                f"TTL on {TABLE_NAME} uses {ttl.get('AttributeName')}, not purge_at; "
+                f"disable it and run enable_session_ttl again"
+            )
+        return
+
+    dynamodb_client.update_time_to_live(
+        TableName=TABLE_NAME,
+        TimeToLiveSpecification={'Enabled': True, 'AttributeName': 'purge_at'}
+    )
+    logger.info(f"Enabled TTL on {TABLE_NAME} using purge_at")
+
+def backfill_session_summaries():
+    """
+    One-off backfill of photo_count/selection_count/last_activity for sessions
+    created before the event index existed. This is the last full table scan.
+    It leaves expiry alone; see backfill_session_expiry.
+    """
+    from app.services.dynamodb import TABLE_NAME
+    from app.services.photo_meta import is_index_key
+
+    dynamodb = boto3.resource(
+        'dynamodb',
+        region_name=settings.AWS_DEFAULT_REGION,
+        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY
+    )
+    table = dynamodb.Table(TABLE_NAME)
+
+    scan_args = {
+        'ProjectionExpression': 'session_id, photo_urls, selected_photos, created_at, updated_at, photo_count'
+    }
+    updated = 0
+    while True:
+        response = table.scan(**scan_args)
+        for item in response.get('Items', []):
+            if 'photo_count' in item or is_index_key(item['session_id']):
+                continue
+            table.update_item(
+                Key={'session_id': item['session_id']},
+                UpdateExpression="SET photo_count = :photos, selection_count = :selected, last_activity = :activity",
+                ExpressionAttributeValues={
+                    ':photos': len(item.get('photo_urls', [])),
+                    ':selected': len(item.get('selected_photos', [])),
+                    ':activity': item.get('updated_at', item.get('created_at', 0))
+                }
+            )
+            updated += 1
+        if 'LastEvaluatedKey' not in response:
+            break
+        scan_args['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    logger.info(f"Backfilled summary attributes on {updated} sessions")
+
+def backfill_session_expiry(expire_old: bool = False):
+    """
+    Give sessions created before expiry existed an expires_at and purge_at,
+    and every session an expiry_shard so the sweeper's expiry index sees it.
+    Sessions without expires_at expire SESSION_TTL_DAYS from now (or from
+    created_at, if later), so running this never makes a session expire at
+    once. With expire_old=True the TTL counts from created_at instead: the
+    next sweep then deletes the photos of every such session older than
+    SESSION_TTL_DAYS.
+    """
+    from app.services.dynamodb import TABLE_NAME, expiry_shard
+    from app.services.sessions import SESSION_TTL_DAYS, SESSION_PURGE_GRACE_DAYS
+    from app.services.photo_meta import is_index_key
+
+    dynamodb = boto3.resource(
+        'dynamodb',
+        region_name=settings.AWS_DEFAULT_REGION,
+        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY
+    )
+    table = dynamodb.Table(TABLE_NAME)
+
+    now = int(datetime.now().timestamp())
+    scan_args = {'ProjectionExpression': 'session_id, created_at, expires_at, purge_at, expiry_shard'}
+    updated = 0
+    while True:
+        response = table.scan(**scan_args)
+        for item in response.get('Items', []):
+            if ('purge_at' in item and 'expiry_shard' in item) or is_index_key(item['session_id']):
+                continue
+            if 'expires_at' in item:
+                expires_at = int(item['expires_at'])
+            else:
+                created_at = int(item.get('created_at', now))
+                start = created_at if expire_old else max(created_at, now)
+                expires_at = start + SESSION_TTL_DAYS * 24 * 60 * 60
+            table.update_item(
+                Key={'session_id': item['session_id']},
+                UpdateExpression="SET expires_at = :expires, purge_at = :purge, expiry_shard = :shard",
+                ExpressionAttributeValues={
+                    ':expires': expires_at,
+                    ':purge': int(item.get('purge_at', expires_at + SESSION_PURGE_GRACE_DAYS * 24 * 60 * 60)),
+                    ':shard': expiry_shard(item['session_id'])
+                }
+            )
+            updated += 1
+        if 'LastEvaluatedKey' not in response:
+            break
+        scan_args['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    logger.info(f"Backfilled expiry on {updated} sessions (expire_old={expire_old})")
+
+def backfill_photo_meta():
+    """
+    Build the photo metadata index of sessions created before it existed, or
+    whose indexing failed, reading the first PHOTO_META_HEADER_KB of each of
+    their photos. Indexes stored inline on the session (photo_meta) are moved
+    to index items of their own without reading any photos.
+    """
+    from app.services.dynamodb import TABLE_NAME
+    from app.services.s3 import BUCKET_NAME, get_s3_client
+    from app.services.photo_meta import extract_photo_meta_sync, photo_index_state, store_photo_index
+    from app.services.session_cache import META_PENDING
+    from boto3.dynamodb.conditions import Attr
+
+    dynamodb = boto3.resource(
+        'dynamodb',
+        region_name=settings.AWS_DEFAULT_REGION,
+        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY
+    )
+    table = dynamodb.Table(TABLE_NAME)
+    s3_client = get_s3_client()
+
+    scan_args = {
+        'ProjectionExpression': 'session_id, photo_urls, photo_version, photo_meta, photo_index, created_at, purge_at',
+        # Sessions (index items have no event_id) without a ready index
+        'FilterExpression': Attr('event_id').exists() & (
+            Attr('photo_index').not_exists() | Attr('photo_index').ne('ready'))
+    }
+    updated = 0
+    while True:
+        response = table.scan(**scan_args)
+        for item in response.get('Items', []):
+            if 'photo_meta' in item:
+                meta = item['photo_meta']
+            elif photo_index_state(item) == META_PENDING:
+                # Still being built by the app
+                continue
+            else:
+                meta = extract_photo_meta_sync(s3_client, BUCKET_NAME, item.get('photo_urls', []))
+            try:
+                store_photo_index(table, item['session_id'], item.get('photo_version'), meta, item.get('purge_at'))
+                updated += 1
+            except ClientError as e:
+                # photo_urls changed while its photos were being read
+                logger.warning(f"Skipped photo index of session {item['session_id']}: {str(e)}")
+        if 'LastEvaluatedKey' not in response:
+            break
+        scan_args['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    logger.info(f"Backfilled the photo metadata index of {updated} sessions")
+
 if __name__ == "__main__":
-    create_s3_bucket()
\ No newline at end of file
+    create_s3_bucket()
+    create_event_index()
+    create_expiry_index()
+    enable_session_ttl()
\ No newline at end of file
@@ -0,0 +1,169 @@
+"""
+Structured, off-thread logging.
+
+Handlers on the request path only put records on a queue; a QueueListener
+thread applies redaction, formats them (JSON by default) and writes them out.
+
+Each request decides once whether it is sampled, using the rate for its route
+from LOG_SAMPLE_RATES (e.g. "direct-access=0.05,photos=0.2,default=1"), as
+soon as routing has picked the route.
+INFO/DEBUG records emitted while handling an unsampled request are dropped
+before they reach the queue; warnings and errors are always kept.
+"""
+from contextvars import ContextVar
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import re
+from datetime import datetime, timezone
+from typing import Optional
+
+from app.core.config import get_settings
+from app.core.routes import route_label
+
+LOG_LEVEL = get_settings().LOG_LEVEL.upper()
+LOG_FORMAT = get_settings().LOG_FORMAT
+LOG_SAMPLE_RATES = get_settings().LOG_SAMPLE_RATES
+
+# The current request's RequestSampling; INFO logs outside requests are kept
+log_sampled: ContextVar[Optional["RequestSampling"]] = ContextVar("log_sampled", default=None)
+
+REDACTED = "[REDACTED]"
+SENSITIVE_KEYS = {"authorization", "cookie", "set-cookie", "password", "hashed_password",
+                  "access_token", "token", "x-amz-security-token", "aws_secret_access_key"}
+SENSITIVE_PATTERNS = [
+    (re.compile(r"(?i)(bearer\s+)[A-Za-z0-9._~+/=-]+"), r"\1" + REDACTED),
+    (re.compile(r"(?i)((?:password|hashed_password|token)['\"]?\s*[:=]\s*['\"]?)[^'\",\s}]+"), r"\1" + REDACTED),
+    (re.compile(r"(X-Amz-(?:Signature|Credential|Security-Token)=)[^&\s'\"]+"), r"\1" + REDACTED),
+]
+
+
+def parse_sample_rates(spec: str) -> dict:
+    rates = {}
+    for part in spec.split(","):
+        if "=" in part:
+            route, rate = part.split("=", 1)
+            rates[route.strip()] = max(0.0, min(1.0, float(rate)))
+    return rates
+
+
+sample_rates = parse_sample_rates(LOG_SAMPLE_RATES)
+
+
+def should_sample(route: str) -> bool:
+    rate = sample_rates.get(route, sample_rates.get("default", 1.0))
+    return rate >= 1.0 or random.random() < rate
+
+
+class RequestSampling:
+    """Whether a request's INFO logs are kept, decided once its route is known"""
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.decision: Optional[bool] = None
+
+    def sampled(self, final: bool = False) -> bool:
+        # Lines logged before routing are kept; `final` decides for requests
+        # that no route served
+        if self.decision is None:
+            if "route" not in self.scope and not final:
+                return True
+            self.decision = should_sample(route_label(self.scope))
+        return self.decision
+
+
+def redact_text(text: str) -> str:
+    for pattern, replacement in SENSITIVE_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def redact_fields(value):
+    if isinstance(value, dict):
+        return {k: REDACTED if str(k).lower() in SENSITIVE_KEYS else redact_fields(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact_fields(v) for v in value]
+    if isinstance(value, str):
+        return redact_text(value)
+    return value
+
+
+class SamplingFilter(logging.Filter):
+    """Drops INFO and below for requests that were not sampled (runs on the caller's thread)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        sampling = log_sampled.get()
+        return record.levelno >= logging.WARNING or sampling is None or sampling.sampled()
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves message formatting to the listener thread.
+    Only exception tracebacks are rendered here, since they can't outlive the frame.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; structured data goes in extra={"fields": {...}}"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": redact_text(record.getMessage()),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(redact_fields(fields))
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class RedactingTextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            text += " " + json.dumps(redact_fields(fields), default=str)
+        return redact_text(text)
+
+
+_listener = None
+
+
+def configure_logging():
+    """Route all logging through a queue to a background writer thread (idempotent)"""
+    global _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler()
+    if LOG_FORMAT == "json":
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(RedactingTextFormatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
@@ -0,0 +1,342 @@
+"""
+Minimal Prometheus metrics with lock-free hot paths.
+
+Every metric child keeps one cell per thread that touches it. A thread only
+ever writes its own cell, so inc()/observe() need no lock; a scrape sums the
+cells (a value may be one update stale, which Prometheus tolerates). Locks are
+only taken when a new label combination or a new thread appears.
+"""
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import math
+import threading
+import time
+
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{_escape(extra[1])}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _PerThreadCells:
+    """One list of `width` floats per thread; sum() adds them up"""
+
+    def __init__(self, width: int):
+        self._width = width
+        self._local = threading.local()
+        self._cells: List[List[float]] = []
+        self._lock = threading.Lock()
+
+    def cell(self) -> List[float]:
+        cell = getattr(self._local, "cell", None)
+        if cell is None:
+            cell = [0.0] * self._width
+            with self._lock:
+                self._cells.append(cell)
+            self._local.cell = cell
+        return cell
+
+    def sum(self) -> List[float]:
+        totals = [0.0] * self._width
+        with self._lock:
+            cells = list(self._cells)
+        for cell in cells:
+            for i, value in enumerate(cell):
+                totals[i] += value
+        return totals
+
+
+class _CounterChild:
+    def __init__(self):
+        self._cells = _PerThreadCells(1)
+
+    def inc(self, amount: float = 1.0):
+        self._cells.cell()[0] += amount
+
+    def value(self) -> float:
+        return self._cells.sum()[0]
+
+
+class _GaugeChild(_CounterChild):
+    def dec(self, amount: float = 1.0):
+        self._cells.cell()[0] -= amount
+
+
+class _HistogramChild:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        # One slot per bucket, then +Inf, sum and count
+        self._cells = _PerThreadCells(len(self.buckets) + 3)
+
+    def observe(self, value: float):
+        cell = self._cells.cell()
+        cell[bisect_left(self.buckets, value)] += 1
+        cell[-2] += value
+        cell[-1] += 1
+
+    def snapshot(self) -> Tuple[List[float], float, float]:
+        totals = self._cells.sum()
+        return totals[:-2], totals[-2], totals[-1]
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def collect(self) -> List[str]:
+        lines = self.header()
+        for key, child in list(self._children.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value())}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._default.dec(amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        self.bucket_bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.bucket_bounds)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def collect(self) -> List[str]:
+        lines = self.header()
+        for key, child in list(self._children.items()):
+            counts, total, count = child.snapshot()
+            cumulative = 0.0
+            for bound, bucket_count in zip(self.bucket_bounds + (math.inf,), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {_format_value(cumulative)}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {_format_value(count)}")
+        return lines
+
+
+class CallbackGauge(_Metric):
+    """Gauge whose samples are read from a callback at scrape time"""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str],
+                 callback: Callable[[], Dict[Tuple[str, ...], float]]):
+        self.callback = callback
+        super().__init__(name, documentation, labelnames)
+
+    def collect(self) -> List[str]:
+        lines = self.header()
+        for key, value in self.callback().items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class CallbackCounter(CallbackGauge):
+    """Counter whose samples are read from a callback at scrape time (e.g. a cache's hit count)"""
+    kind = "counter"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def expose(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUEST_LATENCY = registry.register(Histogram(
+    "photoshare_request_duration_seconds", "Request latency by route", ["route", "method", "status"]
+))
+REQUESTS_IN_FLIGHT = registry.register(Gauge(
+    "photoshare_requests_in_flight", "Requests currently being handled", ["route"]
+))
+REQUEST_BYTES = registry.register(Counter(
+    "photoshare_request_bytes_total", "Request body bytes received", ["route"]
+))
+RESPONSE_BYTES = registry.register(Counter(
+    "photoshare_response_bytes_total", "Response body bytes sent", ["route"]
+))
+DOWNSTREAM_LATENCY = registry.register(Histogram(
+    "photoshare_downstream_duration_seconds", "Latency of calls to S3, DynamoDB and other services",
+    ["service", "operation"]
+))
+
+# Caches report their own hit/miss counts; registered via register_cache()
+_caches: Dict[str, object] = {}
+
+
+def register_cache(name: str, cache):
+    """Expose a cache with `hits` and `misses` attributes in the cache metrics"""
+    _caches[name] = cache
+
+
+def _cache_counts(attribute: str) -> Dict[Tuple[str, ...], float]:
+    return {(name,): getattr(cache, attribute) for name, cache in _caches.items()}
+
+
+def _cache_ratios() -> Dict[Tuple[str, ...], float]:
+    ratios = {}
+    for name, cache in _caches.items():
+        lookups = cache.hits + cache.misses
+        ratios[(name,)] = cache.hits / lookups if lookups else 0.0
+    return ratios
+
+
+registry.register(CallbackCounter(
+    "photoshare_cache_hits_total", "Cache hits since start", ["cache"], lambda: _cache_counts("hits")
+))
+registry.register(CallbackCounter(
+    "photoshare_cache_misses_total", "Cache misses since start", ["cache"], lambda: _cache_counts("misses")
+))
+registry.register(CallbackGauge(
+    "photoshare_cache_hit_ratio", "Cache hit ratio since start", ["cache"], _cache_ratios
+))
+
+
+class _RouteMetrics:
+    """The per-route metrics of one request; relabel() moves them to the route the router chose"""
+
+    def __init__(self, route: str):
+        self._label(route)
+        self.in_flight.inc()
+
+    def _label(self, route: str):
+        self.route = route
+        self.in_flight = REQUESTS_IN_FLIGHT.labels(route)
+        self.request_bytes = REQUEST_BYTES.labels(route)
+        self.response_bytes = RESPONSE_BYTES.labels(route)
+
+    def relabel(self, route: str):
+        if route != self.route:
+            self.in_flight.dec()
+            self._label(route)
+            self.in_flight.inc()
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording latency, in-flight requests and body bytes
+    per route. It wraps receive/send instead of buffering, so streaming
+    responses are measured until their last byte.
+
+    A request is in flight from the moment it arrives. Its route is matched
+    up front where the app's routes allow it; otherwise it is counted as
+    "other" until the router has run (the endpoint's first receive or send),
+    then moved to its route.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        from app.core.routes import match_route_label, route_label
+        matched = match_route_label(scope)
+        metrics = _RouteMetrics(matched or "other")
+        settled = [matched is not None]
+        status = ["500"]
+
+        def settle():
+            if not settled[0] and "route" in scope:
+                settled[0] = True
+                metrics.relabel(route_label(scope))
+
+        async def counting_receive():
+            message = await receive()
+            settle()
+            if message["type"] == "http.request":
+                metrics.request_bytes.inc(len(message.get("body", b"")))
+            return message
+
+        async def counting_send(message):
+            settle()
+            if message["type"] == "http.response.start":
+                status[0] = str(message["status"])
+            elif message["type"] == "http.response.body":
+                metrics.response_bytes.inc(len(message.get("body", b"")))
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            settle()
+            metrics.in_flight.dec()
+            REQUEST_LATENCY.labels(metrics.route, scope["method"], status[0]).observe(time.perf_counter() - start)
@@ -0,0 +1,282 @@
+"""
+On-demand sampling profiler for single requests (staging/debugging).
+
+Disabled unless PROFILING_ENABLED=true and PROFILING_TOKEN is set; when
+disabled neither the middleware nor the /debug routes are installed. A request
+opts in with
+
+    X-Profile: wall|cpu          X-Profile-Token: <PROFILING_TOKEN>
+or  ?_profile=wall|cpu&_profile_token=<PROFILING_TOKEN>
+
+and the response carries an X-Profile-Id. The profile is stored in folded-stack
+format (flamegraph.pl, speedscope, inferno) and served by GET /debug/profiles/{id}.
+
+A sampler thread records, every PROFILING_INTERVAL_MS:
+  - the request's task: its running stack on the event loop thread, or the
+    chain of coroutines it is suspended in (so wall profiles show where the
+    request is waiting on S3/DynamoDB);
+  - pool threads that are not idle (bcrypt, run_in_threadpool, s3transfer),
+    which may include work for other requests running at the same time.
+Wall mode counts samples. CPU mode weights each sample by the CPU time the
+thread used since the previous sample (microseconds, per-thread CPU clocks)
+and skips the task while it is suspended.
+"""
+from collections import Counter
+from typing import Dict, List, Optional
+import asyncio
+import hmac
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+PROFILING_ENABLED = get_settings().PROFILING_ENABLED
+PROFILING_TOKEN = get_settings().PROFILING_TOKEN
+PROFILING_INTERVAL_MS = get_settings().PROFILING_INTERVAL_MS
+PROFILING_MAX_SECONDS = get_settings().PROFILING_MAX_SECONDS
+PROFILING_DIR = get_settings().PROFILING_DIR
+PROFILING_MAX_FILES = get_settings().PROFILING_MAX_FILES
+
+MODES = ("wall", "cpu")
+PROFILE_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+# A thread whose innermost Python frame is one of these is waiting for work
+IDLE_MODULES = ("threading.py", "queue.py", "selectors.py")
+IDLE_FUNCTIONS = {("thread.py", "_worker"), ("handlers.py", "dequeue")}
+
+# One profile at a time keeps the overhead bounded
+_active = threading.Lock()
+
+
+def profiling_enabled() -> bool:
+    return PROFILING_ENABLED and bool(PROFILING_TOKEN)
+
+
+def token_matches(token: Optional[str]) -> bool:
+    return bool(token) and hmac.compare_digest(token.encode(), PROFILING_TOKEN.encode())
+
+
+def _label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _thread_frames(frame) -> List:
+    """Frames from the outermost call to `frame`"""
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+
+def _coroutine_stack(coro) -> List[str]:
+    """Labels for a suspended coroutine chain, ending with what it awaits"""
+    labels = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None) or getattr(coro, "ag_frame", None)
+        if frame is None:
+            labels.append(f"<awaiting {type(coro).__name__}>")
+            break
+        labels.append(_label(frame.f_code))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None) or getattr(coro, "ag_await", None)
+    return labels
+
+
+def _is_idle(frame) -> bool:
+    filename = os.path.basename(frame.f_code.co_filename)
+    return filename in IDLE_MODULES or (filename, frame.f_code.co_name) in IDLE_FUNCTIONS
+
+
+def _thread_cpu_clock(ident: int) -> Optional[int]:
+    try:
+        return time.pthread_getcpuclockid(ident)
+    except (AttributeError, OSError):
+        return None
+
+
+class RequestSampler(threading.Thread):
+    """Samples one request's task plus busy pool threads until stopped"""
+
+    def __init__(self, task: asyncio.Task, loop_thread: int, mode: str):
+        super().__init__(name="request-profiler", daemon=True)
+        self.task = task
+        self.loop_thread = loop_thread
+        self.mode = mode
+        self.interval = PROFILING_INTERVAL_MS / 1000
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+        self._cpu_seen: Dict[int, int] = {}
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def _cpu_delta_us(self, ident: int) -> int:
+        clock = _thread_cpu_clock(ident)
+        if clock is None:
+            return 0
+        try:
+            now = time.clock_gettime_ns(clock)
+        except OSError:
+            return 0
+        previous = self._cpu_seen.get(ident, now)
+        self._cpu_seen[ident] = now
+        return (now - previous) // 1000
+
+    def _weight(self, ident: int) -> int:
+        return self._cpu_delta_us(ident) if self.mode == "cpu" else 1
+
+    def _sample_task(self, frames: Dict[int, object]):
+        loop_frames = _thread_frames(frames.get(self.loop_thread))
+        weight = self._weight(self.loop_thread)
+        coro = self.task.get_coro()
+        root = getattr(coro, "cr_frame", None)
+        for index, frame in enumerate(loop_frames):
+            if frame is root:
+                stack = [_label(f.f_code) for f in loop_frames[index:]]
+                break
+        else:
+            if self.mode == "cpu":
+                # Loop CPU while the task is suspended belongs to other requests
+                return
+            stack = ["<suspended>"] + _coroutine_stack(coro)
+        if weight > 0:
+            self.stacks[";".join(["request"] + stack)] += weight
+
+    def _sample_threads(self, frames: Dict[int, object]):
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in frames.items():
+            if ident in (self.loop_thread, self.ident) or _is_idle(frame):
+                # Keep CPU clocks current so the next busy sample has the right delta
+                if self.mode == "cpu" and ident != self.ident:
+                    self._cpu_delta_us(ident)
+                continue
+            weight = self._weight(ident)
+            if weight > 0:
+                thread = names.get(ident, str(ident))
+                stack = [_label(f.f_code) for f in _thread_frames(frame)]
+                self.stacks[";".join([f"thread {thread}"] + stack)] += weight
+
+    def run(self):
+        deadline = time.monotonic() + PROFILING_MAX_SECONDS
+        while not self._stop_event.wait(self.interval):
+            if time.monotonic() > deadline:
+                logger.warning("Request profile stopped after PROFILING_MAX_SECONDS")
+                return
+            frames = sys._current_frames()
+            self._sample_task(frames)
+            self._sample_threads(frames)
+            self.samples += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def profile_path(profile_id: str) -> str:
+    return os.path.join(PROFILING_DIR, f"{profile_id}.folded")
+
+
+def save_profile(profile_id: str, folded: str):
+    os.makedirs(PROFILING_DIR, exist_ok=True)
+    with open(profile_path(profile_id), "w") as f:
+        f.write(folded)
+    profiles = sorted(
+        (os.path.join(PROFILING_DIR, name) for name in os.listdir(PROFILING_DIR) if name.endswith(".folded")),
+        key=os.path.getmtime
+    )
+    for path in profiles[:-PROFILING_MAX_FILES]:
+        os.remove(path)
+
+
+def _save_folded(profile_id: str, sampler: RequestSampler):
+    save_profile(profile_id, sampler.folded())
+
+
+def load_profile(profile_id: str) -> Optional[str]:
+    if not PROFILE_ID_PATTERN.match(profile_id):
+        return None
+    try:
+        with open(profile_path(profile_id)) as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _requested_mode(scope) -> Optional[str]:
+    headers = dict(scope.get("headers") or [])
+    mode = headers.get(b"x-profile", b"").decode("latin-1").lower()
+    token = headers.get(b"x-profile-token", b"").decode("latin-1")
+    if not mode:
+        from urllib.parse import parse_qs
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        mode = query.get("_profile", [""])[0].lower()
+        token = query.get("_profile_token", [""])[0]
+    if not mode or not token_matches(token):
+        return None
+    return mode if mode in MODES else "wall"
+
+
+class ProfilingMiddleware:
+    """
+    Pure ASGI middleware that profiles opted-in requests. Install it innermost,
+    so the task it runs in is the one running the endpoint.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        mode = _requested_mode(scope) if scope["type"] == "http" else None
+        if mode is None:
+            await self.app(scope, receive, send)
+            return
+        if not _active.acquire(blocking=False):
+            logger.warning("Profile requested while another profile is running; skipped")
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-id", profile_id.encode())
+                ]
+            await send(message)
+
+        sampler = RequestSampler(asyncio.current_task(), threading.get_ident(), mode)
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            try:
+                # Joining the sampler thread and writing the profile both block
+                await run_in_threadpool(sampler.stop)
+            finally:
+                _active.release()
+            try:
+                await run_in_threadpool(_save_folded, profile_id, sampler)
+            except OSError as e:
+                logger.error(f"Could not store profile {profile_id}: {str(e)}")
+            else:
+                # WARNING so the line survives log sampling
+                logger.warning("request profiled", extra={"fields": {
+                    "profile_id": profile_id,
+                    "mode": mode,
+                    "path": scope["path"],
+                    "duration_ms": round(elapsed_ms, 2),
+                    "samples": sampler.samples,
+                }})
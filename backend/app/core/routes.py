@@ -0,0 +1,74 @@
+from functools import lru_cache
+from typing import Optional
+import re
+
+from starlette.routing import Match
+
+# Short, stable names for the routes we sample logs for and label metrics with,
+# by route template. Other routes are named after their template
+# (/debug/profiles/{profile_id} -> debug-profiles); requests no route served are "other".
+ROUTE_LABELS = {
+    "/api/v1/upload-photo": "upload",
+    "/api/v1/upload-multiple-photos": "upload-multiple",
+    "/api/v1/proxy-upload": "proxy-upload",
+    "/api/v1/generate-upload-urls": "presign",
+    "/api/v1/generate-multipart-upload-urls": "multipart",
+    "/api/v1/get-presigned-upload-part-url": "multipart",
+    "/api/v1/complete-multipart-upload": "multipart",
+    "/api/v1/session/create": "create-session",
+    "/api/v1/session/{session_id}/auth": "auth",
+    "/api/v1/session/{session_id}/photos": "photos",
+    "/api/v1/session/{session_id}/select": "select",
+    "/api/v1/session/{session_id}/download": "download",
+    "/api/v1/event/{event_id}/sessions": "event-sessions",
+    "/api/v1/direct-access": "direct-access",
+    "/api/v1/progress": "progress",
+    "/api/v1/progress/{channel}": "progress",
+    "/api/v1/proxy-image": "image",
+    "/api/v1/refresh-image-url": "image",
+    "/local-s3/{bucket}/{key:path}": "local-s3",
+    "/metrics": "metrics",
+}
+
+
+@lru_cache(maxsize=None)
+def label_for_template(template: str) -> str:
+    """Label of a route template, e.g. /api/v1/session/{session_id}/auth -> auth"""
+    label = ROUTE_LABELS.get(template)
+    if label is None:
+        parts = re.sub(r"^/api/v1", "", template).split("/")
+        label = "-".join(part for part in parts if part and not part.startswith("{")) or "root"
+    return label
+
+
+def route_label(scope) -> str:
+    """
+    Label of the route that served a request. Middleware runs before routing,
+    so this is only known once the router has set scope["route"]; until then
+    (and for paths no route matches) it is "other".
+    """
+    template = getattr(scope.get("route"), "path", None)
+    return label_for_template(template) if template is not None else "other"
+
+
+def match_route_label(scope) -> Optional[str]:
+    """
+    The label of the route that will serve a request, matched against the
+    app's routes before routing. None when the app nests its routers (newer
+    FastAPI), where only the router can tell.
+    """
+    app = scope.get("app")
+    partial = None
+    for route in getattr(getattr(app, "router", None), "routes", ()):
+        match, child_scope = route.matches(scope)
+        if match == Match.NONE:
+            continue
+        template = getattr(child_scope.get("route", route), "path", None)
+        if template is None:
+            return None
+        if match == Match.FULL:
+            return label_for_template(template)
+        if partial is None:
+            partial = template
+    # No route matched fully: a 405 for the first partial match, else a 404
+    return label_for_template(partial) if partial is not None else "other"
@@ -34,7 +34,7 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Security(security))
         return payload
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token has expired")
-    except jwt.JWTError:
+    except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Could not validate token")
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
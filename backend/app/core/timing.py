@@ -0,0 +1,117 @@
+"""
+Per-request timing of downstream calls (S3, DynamoDB, presigned PUTs).
+
+Botocore's before-call/after-call events time every AWS API call made through
+boto3; other calls are wrapped in time_downstream(). Each call is added to the
+current request's totals and to the photoshare_downstream_duration_seconds
+histogram. ServerTimingMiddleware returns the totals to the client as a
+Server-Timing header, e.g.
+
+    Server-Timing: s3;dur=41.2;desc="2 calls", dynamodb;dur=8.3;desc="1 call", app;dur=5.1, total;dur=54.6
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+import logging
+import time
+
+from app.core.metrics import DOWNSTREAM_LATENCY
+
+logger = logging.getLogger(__name__)
+
+# service -> [calls, seconds] for the request being handled. The dict is created
+# per request and shared (not copied) with tasks and threads it spawns.
+_request_timings: ContextVar[Optional[Dict[str, List[float]]]] = ContextVar("request_timings", default=None)
+
+_START_KEY = "photoshare_call_start"
+
+
+def record_downstream(service: str, operation: str, seconds: float):
+    DOWNSTREAM_LATENCY.labels(service, operation).observe(seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        entry = timings.setdefault(service, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+
+@contextmanager
+def time_downstream(service: str, operation: str):
+    """Time a downstream call that doesn't go through botocore"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_downstream(service, operation, time.perf_counter() - start)
+
+
+def _before_call(model, context, **kwargs):
+    context[_START_KEY] = time.perf_counter()
+
+
+def _after_call(model, context, **kwargs):
+    start = context.pop(_START_KEY, None)
+    if start is not None:
+        record_downstream(model.service_model.service_name, model.name, time.perf_counter() - start)
+
+
+_instrumented = False
+
+
+def instrument_boto3():
+    """
+    Register the timing hooks on boto3's default session. Every client and
+    resource created from it afterwards inherits them.
+    """
+    global _instrumented
+    if _instrumented:
+        return
+    import boto3
+
+    if boto3.DEFAULT_SESSION is None:
+        boto3.setup_default_session()
+    events = boto3.DEFAULT_SESSION.events
+    events.register("before-call.*.*", _before_call, unique_id="photoshare-timing-before")
+    events.register("after-call.*.*", _after_call, unique_id="photoshare-timing-after")
+    # Connection errors and timeouts never reach after-call
+    events.register("after-call-error.*.*", _after_call, unique_id="photoshare-timing-error")
+    _instrumented = True
+
+
+def _server_timing_header(timings: Dict[str, List[float]], total: float) -> bytes:
+    parts = []
+    downstream = 0.0
+    for service, (calls, seconds) in sorted(timings.items()):
+        downstream += seconds
+        label = "call" if calls == 1 else "calls"
+        parts.append(f'{service};dur={seconds * 1000:.1f};desc="{int(calls)} {label}"')
+    parts.append(f"app;dur={max(total - downstream, 0.0) * 1000:.1f}")
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts).encode("latin-1")
+
+
+class ServerTimingMiddleware:
+    """Adds a Server-Timing header with the downstream time spent so far in the request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings: Dict[str, List[float]] = {}
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                header = _server_timing_header(timings, time.perf_counter() - start)
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", header)]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
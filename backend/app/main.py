@@ -2,48 +2,30 @@
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 import logging
-from fastapi.middleware.cors import CORSMiddleware
+import asyncio
 from fastapi.openapi.docs import get_swagger_ui_html
 from app.api.sessions import router as session_router
 from app.api.jwt import router as jwt_router
-import os
-from dotenv import load_dotenv
-import boto3
-from pydantic import BaseModel
-from pydantic_settings import BaseSettings
-from urllib.parse import urlparse
+import time
+from app.core.logging_config import configure_logging, log_sampled, RequestSampling
+from app.core.routes import route_label
+from app.core.metrics import MetricsMiddleware, registry, register_cache
+from app.core.config import get_settings
+from app.core.cors import CorsMiddleware, CorsPolicy
+from app.core.timing import ServerTimingMiddleware
+from app.core.profiling import ProfilingMiddleware, profiling_enabled
+from fastapi.responses import PlainTextResponse
 
 # Import the photo upload router - adjust the import path as needed
 from app.api.uploads import router as photo_router
+from app.api.progress import router as progress_router
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging (structured, written from a background thread)
+configure_logging()
 logger = logging.getLogger(__name__)
+access_logger = logging.getLogger("app.access")
 
-# Load environment variables
-load_dotenv()
-
-# Function to get the base domain from a URL (for CORS comparison)
-def get_domain_from_url(url):
-    """Extract just the base domain from a URL for CORS comparison."""
-    try:
-        parsed = urlparse(url)
-        return f"{parsed.scheme}://{parsed.netloc}"
-    except:
-        return url
-
-# Configuration class
-class Settings(BaseSettings):
-    AWS_ACCESS_KEY_ID: str = os.getenv("AWS_ACCESS_KEY_ID", "")
-    AWS_SECRET_ACCESS_KEY: str = os.getenv("AWS_SECRET_ACCESS_KEY", "")
-    AWS_DEFAULT_REGION: str = os.getenv("AWS_DEFAULT_REGION", "ap-south-1")
-    AWS_BUCKET_NAME: str = "screenmirror-canvas-storage"
-    ENVIRONMENT: str = os.getenv("ENVIRONMENT", "production")
-    ALLOWED_ORIGINS: str = os.getenv("ALLOWED_ORIGINS", "https://photo-share-app-id.web.app")
-
-    class Config:
-        env_file = ".env"
-        extra = "allow"
+settings = get_settings()
 
 app = FastAPI(
     title="Photo Upload API",
@@ -51,117 +33,137 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# Get allowed origins from environment variable and extract just the domains
-allowed_origin_strings = os.getenv("ALLOWED_ORIGINS", "https://photo-share-app-id.web.app").split(",")
-allowed_origins = [get_domain_from_url(origin.strip()) for origin in allowed_origin_strings if origin.strip()]
+# Per-request profiling for staging. Added first so it sits innermost, in the
+# same task as the endpoint; not installed at all unless enabled.
+if profiling_enabled():
+    app.add_middleware(ProfilingMiddleware)
 
-# In development, add localhost
-if os.getenv("ENVIRONMENT") == "development":
-    allowed_origins.append("http://localhost:3000")
+# Add startup event to initialize app state
+@app.on_event("startup")
+async def startup_event():
+    logger.info("Initializing application state...")
+    app.state.config = settings
+
+    # Create the AWS clients off the event loop so the server starts accepting
+    # requests without waiting for boto3 to load
+    if not settings.use_local_storage:
+        app.state.aws_warmup = asyncio.get_running_loop().run_in_executor(None, warm_up_aws_clients)
+
+    # This worker's image cache directory; removed again on shutdown
+    from app.services.image_cache import image_cache
+    await asyncio.get_running_loop().run_in_executor(None, image_cache.open)
+
+    # Periodically delete expired sessions, their photos and stale multipart uploads
+    if settings.SWEEPER_ENABLED:
+        from app.services.sweeper import run_periodically
+        app.state.sweeper_task = asyncio.create_task(
+            run_periodically(dry_run=settings.SWEEPER_DRY_RUN)
+        )
+        logger.info("Session sweeper started")
 
-# For testing or debugging, uncomment to allow all origins
-# allowed_origins.append("*")
+    logger.info(f"Application initialized in {settings.ENVIRONMENT} mode")
+    logger.info(f"Using AWS region: {settings.AWS_DEFAULT_REGION}")
 
-print(f"CORS allowed origins: {allowed_origins}")
+def warm_up_aws_clients():
+    try:
+        from app.services.s3 import get_s3_client
+        from app.services.dynamodb import get_dynamodb_client
+        get_s3_client()
+        get_dynamodb_client()
+    except Exception as e:
+        # Requests create the clients themselves if this fails
+        logger.warning(f"Could not pre-create AWS clients: {str(e)}")
 
-# Save the allowed domains for use in middleware
-app.state.allowed_domains = allowed_origins
+@app.on_event("shutdown")
+async def shutdown_event():
+    sweeper_task = getattr(app.state, "sweeper_task", None)
+    if sweeper_task:
+        sweeper_task.cancel()
 
-# Add custom middleware to handle CORS with dynamic session-based URLs
-@app.middleware("http")
-async def cors_middleware(request: Request, call_next):
-    # Get the request origin
-    origin = request.headers.get("origin")
-
-    # If no origin, just pass through
-    if not origin:
-        return await call_next(request)
-
-    # Extract just the domain from origin
-    origin_domain = get_domain_from_url(origin)
-
-    # Store the full origin and its domain in request state for use in the endpoint
-    request.state.origin = origin
-    request.state.origin_domain = origin_domain
-    request.state.allowed_domains = app.state.allowed_domains
-
-    # Process the request
-    response = await call_next(request)
-
-    # If we have an origin, check if its domain is allowed
-    if origin_domain in app.state.allowed_domains or "*" in app.state.allowed_domains:
-        # If domain is allowed, set full origin as allowed
-        response.headers["Access-Control-Allow-Origin"] = origin
-    elif app.state.allowed_domains:
-        # If domain is not allowed but we have allowed domains, use first one
-        response.headers["Access-Control-Allow-Origin"] = app.state.allowed_domains[0]
-    else:
-        # Fallback to wildcard
-        response.headers["Access-Control-Allow-Origin"] = "*"
-
-    # Add other CORS headers
-    response.headers["Access-Control-Allow-Credentials"] = "true"
-    response.headers["Access-Control-Allow-Methods"] = "GET, POST, PUT, DELETE, OPTIONS"
-    response.headers["Access-Control-Allow-Headers"] = "*"
+    from app.services.password_hasher import password_hasher
+    password_hasher.shutdown()
 
-    return response
+    from app.services.image_cache import image_cache
+    image_cache.close()
 
-# Add startup event to initialize app state
-@app.on_event("startup")
-async def startup_event():
-    logger.info("Initializing application state...")
-    # Create and store settings
-    app.state.config = Settings()
-
-    # Initialize S3 client
-    app.state.s3_client = boto3.client(
-        's3',
-        region_name=app.state.config.AWS_DEFAULT_REGION,
-        aws_access_key_id=app.state.config.AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=app.state.config.AWS_SECRET_ACCESS_KEY
-    )
-
-    logger.info(f"Application initialized in {app.state.config.ENVIRONMENT} mode")
-    logger.info(f"Using AWS region: {app.state.config.AWS_DEFAULT_REGION}")
-
-# Add CORS middleware - only used as fallback, our custom middleware handles most cases
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=allowed_origins + ["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-    expose_headers=["Content-Type", "Content-Length", "Content-Disposition"],
-    max_age=3600,
-)
+    from app.services import photo_meta
+    photo_meta.shutdown()
+
+# CORS for every route, including preflights, which are answered here
+# (in development the allowed origins include localhost)
+app.add_middleware(CorsMiddleware, policy=CorsPolicy.from_settings(settings))
 
 # Include the photo router
 # The router already has the prefix "/api/v1"
 app.include_router(photo_router, tags=["photos"])
 app.include_router(session_router, tags=["sessions"])
 app.include_router(jwt_router, tags=["jwt"])
+app.include_router(progress_router, tags=["progress"])
+
+# Serve presigned URLs from the local storage stand-in
+if settings.use_local_storage:
+    from app.api.local_s3 import router as local_s3_router
+    app.include_router(local_s3_router, tags=["local-s3"])
 
+if profiling_enabled():
+    from app.api.debug import router as debug_router
+    app.include_router(debug_router, tags=["debug"])
+
+
+# Slow requests are always logged, whatever their route's sample rate
+SLOW_REQUEST_MS = settings.SLOW_REQUEST_MS
 
 # Middleware for logging requests and handling errors
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    logger.info(f"Request path: {request.url.path}")
-    logger.info(f"Request method: {request.method}")
-    logger.info(f"Request headers: {request.headers}")
-    logger.info(f"Query params: {request.query_params}")
+    # Decides for every log line emitted while handling this request
+    sampling = RequestSampling(request.scope)
+    log_sampled.set(sampling)
+    start = time.perf_counter()
 
     try:
         response = await call_next(request)
-        logger.info(f"Response status: {response.status_code}")
-        logger.info(f"Response headers: {response.headers}")
-        return response
     except Exception as e:
-        logger.error(f"Error in middleware: {str(e)}")
+        logger.exception(f"Error in middleware: {str(e)}")
         return JSONResponse(
             status_code=500,
             content={"detail": f"Internal Server Error: {str(e)}"}
         )
 
+    duration_ms = (time.perf_counter() - start) * 1000
+    route = route_label(request.scope)
+    if sampling.sampled(final=True) or response.status_code >= 500 or duration_ms >= SLOW_REQUEST_MS:
+        level = logging.WARNING if response.status_code >= 500 or duration_ms >= SLOW_REQUEST_MS else logging.INFO
+        access_logger.log(level, "request", extra={"fields": {
+            "method": request.method,
+            "path": request.url.path,
+            "route": route,
+            "status": response.status_code,
+            "duration_ms": round(duration_ms, 2),
+            "client": request.client.host if request.client else None,
+            "response_bytes": response.headers.get("content-length"),
+        }})
+    return response
+
+# Report downstream call time per request in a Server-Timing header
+if settings.SERVER_TIMING_ENABLED:
+    app.add_middleware(ServerTimingMiddleware)
+
+# Outermost, so latency covers every other middleware too
+app.add_middleware(MetricsMiddleware)
+
+from app.services.jwt import token_cache
+from app.services.session_cache import photo_list_cache
+register_cache("token", token_cache)
+register_cache("photo_list", photo_list_cache)
+from app.services.image_cache import image_cache
+register_cache("image", image_cache)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics"""
+    return PlainTextResponse(registry.expose(), media_type="text/plain; version=0.0.4")
+
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -171,17 +173,11 @@ async def root():
 @app.get("/api/v1/test-s3-connection")
 async def test_s3_connection():
     """Test S3 connection"""
-    import boto3
     from botocore.exceptions import ClientError
-    import os
+    from app.core.aws import s3_client as get_aws_s3_client
 
     try:
-        s3_client = boto3.client(
-            's3',
-            region_name='ap-south-1',
-            aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-            aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY')
-        )
+        s3_client = get_aws_s3_client()
 
         # List buckets to test connection
         response = s3_client.list_buckets()
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 
 class PasswordAuth(BaseModel):
     password: str
@@ -11,6 +11,23 @@ class Token(BaseModel):
 class PhotoList(BaseModel):
     photos: List[str]
 
+class PhotoMeta(BaseModel):
+    width: int
+    height: int
+    # EXIF orientation (1-8); 5-8 are displayed with width and height swapped
+    orientation: int = 1
+    # EXIF capture time, ISO 8601, with the UTC offset when known
+    taken_at: Optional[str] = None
+    # BlurHash of the photo as displayed, to paint while it loads
+    placeholder: Optional[str] = None
+
+class SessionPhotos(PhotoList):
+    # One entry per photo, in the same order (null where unknown); empty while
+    # the session's metadata index is still being built
+    meta: List[Optional[PhotoMeta]] = []
+    # With collapse=bursts, the number of frames each photo stands for
+    bursts: Optional[List[int]] = None
+
 class SelectionResponse(BaseModel):
     success: bool
     message: str
@@ -1,11 +1,28 @@
-from pydantic import BaseModel
-from typing import List
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+# Progress channels (/progress/{channel}): batch ids and session ids both match this
+CHANNEL_PATTERN = r"^[A-Za-z0-9_-]{8,64}$"
 
 class CreateSessionRequest(BaseModel):
     event_id: str
     photo_urls: List[str]
+    # Also publish the photo indexing progress to /progress/{batch_id} (issued by POST /progress)
+    batch_id: Optional[str] = Field(None, pattern=CHANNEL_PATTERN)
 
 class SessionResponse(BaseModel):
     session_id: str
     session_link: str
     password: str
+
+class SessionSummary(BaseModel):
+    session_id: str
+    event_id: str
+    created_at: int
+    photo_count: Optional[int] = None
+    selection_count: Optional[int] = None
+    last_activity: Optional[int] = None
+
+class SessionSummaryPage(BaseModel):
+    sessions: List[SessionSummary]
+    next_cursor: Optional[str] = None
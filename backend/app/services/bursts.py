@@ -0,0 +1,73 @@
+"""
+Burst detection over a session's photo metadata index.
+
+Each indexed photo carries a 64-bit difference hash (dHash) of its preview
+sample. Photos are put in capture order and a new burst starts wherever the
+next frame was taken more than BURST_MAX_GAP_SECONDS later or its hash differs
+from the previous frame's in more than BURST_MAX_DISTANCE bits. Both tests run
+over the whole session at once with NumPy (a few milliseconds for thousands
+of photos), and /photos keeps the grouping in the photo list cache.
+
+Photos without a capture time or a hash are never grouped with others.
+"""
+from typing import List, Optional
+
+from app.core.config import get_settings
+
+BURST_MAX_DISTANCE = get_settings().BURST_MAX_DISTANCE
+BURST_MAX_GAP_SECONDS = get_settings().BURST_MAX_GAP_SECONDS
+
+# Index entry positions (see app.services.photo_meta)
+TAKEN_AT = 3
+DHASH = 5
+
+
+def dhash(sample) -> str:
+    """64-bit difference hash of an image, as 16 hex digits"""
+    from PIL import Image
+    import numpy as np
+
+    pixels = np.asarray(sample.convert("L").resize((9, 8), Image.Resampling.BOX), dtype=np.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return np.packbits(bits).tobytes().hex()
+
+
+def hamming_distances(hashes):
+    """Bits that differ between each pair of neighbours in a uint64 array"""
+    import numpy as np
+
+    diff = hashes[1:] ^ hashes[:-1]
+    return np.unpackbits(diff.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+def group_bursts(meta: Optional[List[Optional[list]]], count: int,
+                 max_distance: int = BURST_MAX_DISTANCE, max_gap: float = BURST_MAX_GAP_SECONDS) -> List[List[int]]:
+    """
+    Indices of the `count` photos grouped into bursts, each in capture order.
+    Bursts are ordered by the position of their first frame, which stands
+    for the burst.
+    """
+    import numpy as np
+
+    grouped = [
+        i for i, entry in enumerate(meta or [])
+        if i < count and entry and len(entry) > DHASH and entry[TAKEN_AT] and entry[DHASH]
+    ]
+    if len(grouped) < 2:
+        return [[i] for i in range(count)]
+
+    # Camera clock time; the UTC offset, when there is one, is the same within a burst
+    times = np.array([meta[i][TAKEN_AT][:19] for i in grouped], dtype="datetime64[s]").astype(np.int64)
+    hashes = np.array([int(meta[i][DHASH], 16) for i in grouped], dtype=np.uint64)
+    order = np.argsort(times, kind="stable")
+    times, hashes = times[order], hashes[order]
+    indices = np.array(grouped)[order].tolist()
+
+    starts = (np.diff(times) > max_gap) | (hamming_distances(hashes) > max_distance)
+    cuts = [0] + (np.flatnonzero(starts) + 1).tolist() + [len(indices)]
+    bursts = [indices[start:end] for start, end in zip(cuts, cuts[1:])]
+
+    grouped_set = set(grouped)
+    bursts += [[i] for i in range(count) if i not in grouped_set]
+    bursts.sort(key=lambda burst: burst[0])
+    return bursts
@@ -1,17 +1,35 @@
-import boto3
-import os
-from dotenv import load_dotenv
+import zlib
 
-# Load environment variables
-load_dotenv()
+from app.core.config import get_settings
+
+# Table name for sessions
+TABLE_NAME = "photo_sessions_share"
+
+# GSI on (event_id, created_at). It only projects the summary attributes so
+# listing an event never reads the photo_urls lists.
+EVENT_INDEX_NAME = "event_id-created_at-index"
+EVENT_INDEX_ATTRIBUTES = ["photo_count", "selection_count", "last_activity"]
+
+# Sparse GSI on (expiry_shard, expires_at): only session items carry
+# expiry_shard, so the sweeper queries the expired sessions instead of scanning
+# the table. Sessions are spread over EXPIRY_SHARDS partition keys so the
+# index has no single hot key; the sweeper queries each of them.
+EXPIRY_INDEX_NAME = "expiry_shard-expires_at-index"
+EXPIRY_INDEX_ATTRIBUTES = ["event_id", "photo_urls", "photo_version", "photo_index_chunks"]
+EXPIRY_SHARDS = 8
+
+def expiry_shard(session_id: str) -> int:
+    """The expiry index partition a session goes in"""
+    return zlib.crc32(session_id.encode()) % EXPIRY_SHARDS
 
 def get_dynamodb_client():
     """
-    Get a DynamoDB client with AWS credentials from environment variables
+    Get a DynamoDB resource with the configured AWS credentials.
+    With STORAGE_BACKEND=local this is a SQLite-backed stand-in instead.
     """
-    return boto3.resource(
-        'dynamodb',
-        region_name='ap-south-1',
-        aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-        aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY')
-    )
\ No newline at end of file
+    if get_settings().use_local_storage:
+        from app.services.local_storage import get_local_dynamodb
+        return get_local_dynamodb()
+
+    from app.core.aws import dynamodb_resource
+    return dynamodb_resource()
@@ -0,0 +1,362 @@
+"""
+Download every photo of an event or a session, for archiving:
+
+    cd backend
+    python -m app.services.export --event-id wedding-2024 -o /archive/wedding-2024
+    python -m app.services.export --event-id wedding-2024 -o wedding-2024.tar
+    python -m app.services.export --session-id <session_id> --selected -o - > selection.tar
+
+An event is everything under its `event_id/` prefix, listed with
+list_objects_v2 a page at a time while the first pages already download. A
+session is its photo_urls, or its selected_photos with --selected. Up to
+--concurrency requests are in flight at once, and objects larger than
+--part-size-mb are fetched as parallel ranged GETs pinned to the object's
+ETag, so a photo replaced mid-download fails rather than mixing versions.
+
+Every object is checked once downloaded: against the SHA-256 the ingest tool
+stores in x-amz-meta-sha256, or else its ETag (the MD5 of a single-part
+upload, the MD5 of the part MD5s of a multipart one, with part sizes from HEAD
+?partNumber). Objects with nothing to check against are counted as unverified.
+
+Output is a directory with one file per key (files already there that still
+match are skipped), or a tar archive (-o name.tar, or - for stdout) written as
+objects complete.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from functools import partial
+from typing import AsyncIterator, List, Optional
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+from app.services.ingest import build_s3_client, sha256_file
+from app.utils.s3 import object_key_from_url
+
+logger = logging.getLogger(__name__)
+
+MIB = 1024 * 1024
+CHUNK_SIZE = MIB
+
+
+@dataclass
+class ExportObject:
+    key: str
+    size: Optional[int] = None
+    etag: Optional[str] = None
+    last_modified: Optional[datetime] = None
+    metadata: Optional[dict] = None
+
+
+@dataclass
+class ExportReport:
+    objects: int = 0
+    downloaded: int = 0
+    skipped: int = 0
+    failed: int = 0
+    unverified: int = 0
+    bytes_received: int = 0
+    seconds: float = 0.0
+    megabits_per_second: float = 0.0
+    errors: List[str] = field(default_factory=list)
+
+
+class ChecksumMismatch(Exception):
+    pass
+
+
+def md5_parts(path: str, part_sizes: List[int]) -> List[bytes]:
+    """MD5 digests of consecutive slices of a file"""
+    digests = []
+    with open(path, "rb") as f:
+        for size in part_sizes:
+            digest = hashlib.md5()
+            while size > 0:
+                chunk = f.read(min(CHUNK_SIZE, size))
+                if not chunk:
+                    break
+                digest.update(chunk)
+                size -= len(chunk)
+            digests.append(digest.digest())
+    return digests
+
+
+def multipart_etag(path: str, part_sizes: List[int]) -> str:
+    return f"{hashlib.md5(b''.join(md5_parts(path, part_sizes))).hexdigest()}-{len(part_sizes)}"
+
+
+def safe_name(key: str) -> Optional[str]:
+    """`key` as a relative path, or None if it would point outside the output"""
+    parts = key.split("/")
+    if any(part in ("", ".", "..") for part in parts):
+        return None
+    return os.path.join(*parts)
+
+
+class BulkExport:
+    """Downloads a set of objects into a directory or a tar stream"""
+
+    def __init__(self, s3_client, bucket: str, concurrency: int, part_size: int,
+                 directory: Optional[str] = None, tar: Optional[tarfile.TarFile] = None):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.concurrency = concurrency
+        self.part_size = max(part_size, CHUNK_SIZE)
+        self.directory = directory
+        self.tar = tar
+        self.report = ExportReport()
+        self._pool = ThreadPoolExecutor(concurrency + 1, thread_name_prefix="export")
+        self._spool_dir = tempfile.mkdtemp(prefix="photoshare-export-") if tar is not None else None
+
+    async def _run(self, fn, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(self._pool, partial(fn, *args, **kwargs))
+
+    async def run(self, objects: AsyncIterator[ExportObject]) -> ExportReport:
+        # Requests in flight, and objects being downloaded (bounds the spooled tar members)
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._objects = asyncio.Semaphore(self.concurrency)
+        self._tar_lock = asyncio.Lock()
+        start = time.perf_counter()
+        tasks = []
+        try:
+            async for export_object in objects:
+                self.report.objects += 1
+                tasks.append(asyncio.create_task(self._export(export_object)))
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            if self._spool_dir is not None:
+                shutil.rmtree(self._spool_dir, ignore_errors=True)
+        self.report.seconds = round(time.perf_counter() - start, 2)
+        if self.report.seconds:
+            self.report.megabits_per_second = round(self.report.bytes_received * 8 / 1e6 / self.report.seconds, 1)
+        return self.report
+
+    async def _export(self, export_object: ExportObject):
+        async with self._objects:
+            try:
+                downloaded = await self._export_object(export_object)
+            except (BotoCoreError, ClientError, OSError, ChecksumMismatch) as e:
+                logger.error(f"Exporting {export_object.key} failed: {str(e)}")
+                self.report.failed += 1
+                self.report.errors.append(f"{export_object.key}: {str(e)}")
+                return
+        if downloaded:
+            self.report.downloaded += 1
+            logger.info(f"Exported {export_object.key} ({self.report.downloaded + self.report.skipped}/{self.report.objects})")
+        else:
+            self.report.skipped += 1
+
+    async def _export_object(self, export_object: ExportObject) -> bool:
+        """Download one object unless a matching copy is already there; False if it was"""
+        name = safe_name(export_object.key)
+        if name is None:
+            raise OSError(f"Refusing to write key {export_object.key!r}")
+        if export_object.size is None:
+            async with self._slots:
+                await self._run(self._head, export_object)
+
+        if self.directory is not None:
+            target = os.path.join(self.directory, name)
+            if os.path.isfile(target) and os.path.getsize(target) == export_object.size:
+                if export_object.metadata is None:
+                    async with self._slots:
+                        await self._run(self._head, export_object)
+                if await self._run(self._checksum_matches, export_object, target):
+                    return False
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            path = target + ".part"
+        else:
+            fd, path = tempfile.mkstemp(dir=self._spool_dir)
+            os.close(fd)
+
+        try:
+            await self._download(export_object, path)
+            verified = await self._run(self._checksum_matches, export_object, path)
+            if verified is False:
+                raise ChecksumMismatch("downloaded content doesn't match its checksum")
+            if verified is None:
+                self.report.unverified += 1
+
+            if self.directory is not None:
+                os.replace(path, target)
+                if export_object.last_modified is not None:
+                    timestamp = export_object.last_modified.timestamp()
+                    os.utime(target, (timestamp, timestamp))
+            else:
+                async with self._tar_lock:
+                    await self._run(self._add_to_tar, export_object, name, path)
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+        return True
+
+    def _head(self, export_object: ExportObject):
+        response = self.s3.head_object(Bucket=self.bucket, Key=export_object.key)
+        export_object.size = response["ContentLength"]
+        export_object.etag = response.get("ETag")
+        export_object.last_modified = response.get("LastModified")
+        export_object.metadata = response.get("Metadata", {})
+
+    def _get_range(self, export_object: ExportObject, path: str, start: int, end: int) -> int:
+        """Write bytes start..end (inclusive) of the object into `path`; the count written"""
+        get_args = {"Bucket": self.bucket, "Key": export_object.key, "Range": f"bytes={start}-{end}"}
+        if export_object.etag:
+            get_args["IfMatch"] = export_object.etag
+        response = self.s3.get_object(**get_args)
+        if export_object.metadata is None:
+            export_object.metadata = response.get("Metadata", {})
+        body = response["Body"]
+        written = 0
+        try:
+            with open(path, "r+b") as f:
+                f.seek(start)
+                for chunk in body.iter_chunks(CHUNK_SIZE):
+                    f.write(chunk)
+                    written += len(chunk)
+        finally:
+            body.close()
+        if written != end - start + 1:
+            raise OSError(f"got {written} of {end - start + 1} bytes at offset {start}")
+        return written
+
+    async def _download(self, export_object: ExportObject, path: str):
+        size = export_object.size
+        with open(path, "wb") as f:
+            f.truncate(size)
+        if size == 0:
+            return
+
+        async def fetch(start: int):
+            async with self._slots:
+                end = min(start + self.part_size, size) - 1
+                received = await self._run(self._get_range, export_object, path, start, end)
+            self.report.bytes_received += received
+
+        await asyncio.gather(*(fetch(start) for start in range(0, size, self.part_size)))
+
+    def _checksum_matches(self, export_object: ExportObject, path: str) -> Optional[bool]:
+        """Whether the file matches the object's checksum; None if there is none to compare"""
+        sha256 = (export_object.metadata or {}).get("sha256")
+        if sha256:
+            return sha256_file(path) == sha256
+        etag = (export_object.etag or "").strip('"')
+        if not etag:
+            return None
+        if "-" not in etag:
+            return md5_parts(path, [export_object.size])[0].hex() == etag
+
+        part_count = int(etag.rsplit("-", 1)[1])
+        response = self.s3.head_object(Bucket=self.bucket, Key=export_object.key, PartNumber=1)
+        if response.get("PartsCount") != part_count:
+            # The backend doesn't report part sizes
+            return None
+        # Uploaders use one part size for all but the last part; else ask for each part
+        first = response["ContentLength"]
+        part_sizes = [first] * (part_count - 1) + [export_object.size - first * (part_count - 1)]
+        if part_sizes[-1] > 0 and multipart_etag(path, part_sizes) == etag:
+            return True
+        part_sizes = [first] + [
+            self.s3.head_object(Bucket=self.bucket, Key=export_object.key, PartNumber=n)["ContentLength"]
+            for n in range(2, part_count + 1)
+        ]
+        return multipart_etag(path, part_sizes) == etag
+
+    def _add_to_tar(self, export_object: ExportObject, name: str, path: str):
+        member = tarfile.TarInfo(name.replace(os.sep, "/"))
+        member.size = export_object.size
+        member.mode = 0o644
+        if export_object.last_modified is not None:
+            member.mtime = int(export_object.last_modified.timestamp())
+        with open(path, "rb") as f:
+            self.tar.addfile(member, f)
+
+
+async def list_event_objects(s3_client, bucket: str, event_id: str) -> AsyncIterator[ExportObject]:
+    """Every object under `event_id/`, one list_objects_v2 page at a time"""
+    list_args = {"Bucket": bucket, "Prefix": f"{event_id}/"}
+    while True:
+        response = await asyncio.to_thread(partial(s3_client.list_objects_v2, **list_args))
+        for item in response.get("Contents", []):
+            yield ExportObject(item["Key"], item["Size"], item.get("ETag"), item.get("LastModified"))
+        if not response.get("IsTruncated"):
+            return
+        list_args["ContinuationToken"] = response["NextContinuationToken"]
+
+
+async def list_session_objects(table, bucket: str, session_id: str, selected: bool) -> AsyncIterator[ExportObject]:
+    """The photos of a session, or only its selected ones"""
+    attribute = "selected_photos" if selected else "photo_urls"
+    response = await asyncio.to_thread(
+        table.get_item, Key={"session_id": session_id}, ProjectionExpression=f"event_id, {attribute}"
+    )
+    if "Item" not in response:
+        raise SystemExit(f"Session {session_id} not found")
+    # Only the session's own event; photo_urls are whatever the client sent
+    prefix = f"{response['Item'].get('event_id', '')}/"
+    seen = set()
+    for url in response["Item"].get(attribute) or []:
+        key = object_key_from_url(url, bucket, prefix)
+        if key and key not in seen:
+            seen.add(key)
+            yield ExportObject(key)
+
+
+async def export_photos(output: str, event_id: Optional[str] = None, session_id: Optional[str] = None,
+                        selected: bool = False, concurrency: int = 16, part_size: int = 16 * MIB) -> ExportReport:
+    """Export an event or a session to a directory, a .tar file, or a tar stream on stdout ("-")"""
+    from app.services.s3 import BUCKET_NAME
+
+    s3_client = build_s3_client(concurrency)
+    if session_id is not None:
+        from app.services.dynamodb import get_dynamodb_client, TABLE_NAME
+
+        objects = list_session_objects(get_dynamodb_client().Table(TABLE_NAME), BUCKET_NAME, session_id, selected)
+    else:
+        objects = list_event_objects(s3_client, BUCKET_NAME, event_id)
+
+    if output != "-" and not output.endswith(".tar"):
+        os.makedirs(output, exist_ok=True)
+        return await BulkExport(s3_client, BUCKET_NAME, concurrency, part_size, directory=output).run(objects)
+
+    stream = sys.stdout.buffer if output == "-" else open(output, "wb")
+    try:
+        with tarfile.open(fileobj=stream, mode="w|") as tar:
+            return await BulkExport(s3_client, BUCKET_NAME, concurrency, part_size, tar=tar).run(objects)
+    finally:
+        if stream is not sys.stdout.buffer:
+            stream.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download the photos of an event or a session")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--event-id")
+    source.add_argument("--session-id")
+    parser.add_argument("--selected", action="store_true", help="only the session's selected photos")
+    parser.add_argument("-o", "--output", required=True, help="directory, file ending in .tar, or - for a tar on stdout")
+    parser.add_argument("--concurrency", type=int, default=16, help="requests in flight at once")
+    parser.add_argument("--part-size-mb", type=int, default=16, help="objects larger than this use ranged GETs")
+    args = parser.parse_args()
+
+    # The report goes to stderr when the archive is on stdout
+    logging.basicConfig(level=logging.INFO)
+    result = asyncio.run(export_photos(
+        args.output, event_id=args.event_id, session_id=args.session_id, selected=args.selected,
+        concurrency=args.concurrency, part_size=args.part_size_mb * MIB
+    ))
+    print(json.dumps(asdict(result), indent=2), file=sys.stderr if args.output == "-" else sys.stdout)
+    raise SystemExit(1 if result.failed else 0)
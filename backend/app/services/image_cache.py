@@ -0,0 +1,291 @@
+"""
+Two-tier cache of S3 image bytes for direct-access.
+
+The memory tier is an LRU bounded by total bytes. Everything put in it is
+also written to a disk tier (a per-process directory, bounded the same way)
+from a background thread, so images evicted from memory are still served
+without going to S3. Entries expire after IMAGE_CACHE_TTL_SECONDS, which
+bounds how long a deleted photo can still be served.
+
+Importing this module has no side effects: the API opens the disk tier in
+its startup event and removes it on shutdown (along with directories left
+behind by workers that died), so scripts importing it never touch the disk.
+
+warm_gallery() loads the first photos of a gallery in the background right
+after a guest authenticates, before the client asks for them.
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Set
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import get_settings
+from app.utils.s3 import object_key_from_url
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+
+@dataclass
+class CachedImage:
+    body: bytes
+    content_type: str
+    stored_at: float
+
+
+class ImageCache:
+    """Byte-bounded memory LRU with a write-through disk tier"""
+
+    def __init__(self, memory_bytes: int, disk_bytes: int, max_item_bytes: int, ttl: float,
+                 disk_dir: Optional[str] = None):
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes if disk_dir else 0
+        self.max_item_bytes = max_item_bytes
+        self.ttl = ttl
+        # Parent of the per-process directories; this process's is set by open()
+        self.disk_dir = disk_dir
+        self._disk_path: Optional[str] = None
+        self._memory: "OrderedDict[str, CachedImage]" = OrderedDict()
+        self._memory_used = 0
+        # key -> (size, content_type, stored_at) of files in the disk tier
+        self._disk: "OrderedDict[str, tuple]" = OrderedDict()
+        self._disk_used = 0
+        self._lock = threading.Lock()
+        self._writer: Optional[ThreadPoolExecutor] = None
+        # Keys being fetched by a warm-up; lookups wait for them instead of missing
+        self._loading: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+    def open(self):
+        """Start the disk tier in a fresh directory for this process"""
+        if self.disk_bytes <= 0 or self._writer is not None:
+            return
+        _remove_stale_dirs(self.disk_dir)
+        self._disk_path = os.path.join(self.disk_dir, str(os.getpid()))
+        shutil.rmtree(self._disk_path, ignore_errors=True)
+        os.makedirs(self._disk_path, exist_ok=True)
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="image_cache")
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_item_bytes > 0 and self.memory_bytes > 0
+
+    def accepts(self, size: Optional[int]) -> bool:
+        return self.enabled and size is not None and size <= self.max_item_bytes
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self._disk_path, hashlib.sha256(key.encode()).hexdigest())
+
+    def _expired(self, stored_at: float) -> bool:
+        return time.time() - stored_at > self.ttl
+
+    def contains(self, key: str) -> bool:
+        with self._lock:
+            return key in self._memory or key in self._disk
+
+    def begin_load(self, key: str) -> bool:
+        """Claim a key for a warm-up fetch; False if it's cached or already claimed"""
+        if key in self._loading or self.contains(key):
+            return False
+        self._loading[key] = asyncio.get_running_loop().create_future()
+        return True
+
+    def end_load(self, key: str):
+        self._loading.pop(key).set_result(None)
+
+    async def get(self, key: str) -> Optional[CachedImage]:
+        if not self.enabled:
+            return None
+        loading = self._loading.get(key)
+        if loading is not None:
+            await asyncio.shield(loading)
+        with self._lock:
+            image = self._memory.get(key)
+            if image is not None and not self._expired(image.stored_at):
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return image
+            on_disk = self._disk.get(key)
+
+        if on_disk is not None and not self._expired(on_disk[2]):
+            body = await run_in_threadpool(self._read_file, key)
+            if body is not None:
+                image = CachedImage(body, on_disk[1], on_disk[2])
+                self._put_memory(key, image)
+                with self._lock:
+                    self.hits += 1
+                    self.disk_hits += 1
+                return image
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, body: bytes, content_type: str):
+        if not self.accepts(len(body)):
+            return
+        image = CachedImage(body, content_type, time.time())
+        self._put_memory(key, image)
+        if self._writer is not None:
+            self._writer.submit(self._write_file, key, image)
+
+    def _put_memory(self, key: str, image: CachedImage):
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memory_used -= len(old.body)
+            self._memory[key] = image
+            self._memory_used += len(image.body)
+            while self._memory_used > self.memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_used -= len(evicted.body)
+
+    def _read_file(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except OSError:
+            with self._lock:
+                entry = self._disk.pop(key, None)
+                if entry is not None:
+                    self._disk_used -= entry[0]
+            return None
+
+    def _write_file(self, key: str, image: CachedImage):
+        path = self._path(key)
+        try:
+            with open(path + ".tmp", "wb") as f:
+                f.write(image.body)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            logger.warning(f"Could not write {key} to the image cache: {str(e)}")
+            return
+        evicted = []
+        with self._lock:
+            old = self._disk.pop(key, None)
+            if old is not None:
+                self._disk_used -= old[0]
+            self._disk[key] = (len(image.body), image.content_type, image.stored_at)
+            self._disk_used += len(image.body)
+            while self._disk_used > self.disk_bytes:
+                evicted_key, entry = self._disk.popitem(last=False)
+                self._disk_used -= entry[0]
+                evicted.append(evicted_key)
+        for evicted_key in evicted:
+            try:
+                os.remove(self._path(evicted_key))
+            except OSError:
+                pass
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.shutdown(wait=True)
+            self._writer = None
+            with self._lock:
+                self._disk.clear()
+                self._disk_used = 0
+            shutil.rmtree(self._disk_path, ignore_errors=True)
+
+
+def _remove_stale_dirs(root: str):
+    """Remove the directories of processes that exited without closing their cache"""
+    try:
+        names = os.listdir(root)
+    except OSError:
+        return
+    for name in names:
+        if not name.isdigit() or int(name) == os.getpid():
+            continue
+        try:
+            os.kill(int(name), 0)
+        except ProcessLookupError:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+        except OSError:
+            # Alive, owned by another user
+            pass
+
+
+def _build_cache() -> ImageCache:
+    settings = get_settings()
+    enabled = settings.IMAGE_CACHE_ENABLED
+    return ImageCache(
+        memory_bytes=settings.IMAGE_CACHE_MEMORY_MB * MB if enabled else 0,
+        disk_bytes=settings.IMAGE_CACHE_DISK_MB * MB,
+        max_item_bytes=int(settings.IMAGE_CACHE_MAX_ITEM_MB * MB),
+        ttl=settings.IMAGE_CACHE_TTL_SECONDS,
+        # One directory per worker process under it, created by open()
+        disk_dir=settings.IMAGE_CACHE_DIR if enabled and settings.IMAGE_CACHE_DIR else None,
+    )
+
+
+image_cache = _build_cache()
+
+# Shared by every warm-up, so many guests signing in at once don't flood S3
+_warm_semaphore: Optional[asyncio.Semaphore] = None
+_warm_tasks: Set[asyncio.Task] = set()
+
+
+async def _warm_one(s3_client, bucket: str, key: str, budget: list):
+    global _warm_semaphore
+    if _warm_semaphore is None:
+        _warm_semaphore = asyncio.Semaphore(get_settings().IMAGE_PREFETCH_CONCURRENCY)
+    cache_key = f"{bucket}/{key}"
+    async with _warm_semaphore:
+        if budget[0] <= 0 or not image_cache.begin_load(cache_key):
+            return
+        try:
+            response = await run_in_threadpool(s3_client.get_object, Bucket=bucket, Key=key)
+            body = response["Body"]
+            try:
+                size = response["ContentLength"]
+                if not image_cache.accepts(size) or size > budget[0]:
+                    return
+                budget[0] -= size
+                data = await run_in_threadpool(body.read)
+            finally:
+                body.close()
+            image_cache.put(cache_key, data, response.get("ContentType", "application/octet-stream"))
+        finally:
+            image_cache.end_load(cache_key)
+
+
+async def _warm(get_client: Callable, bucket: str, photo_urls: List[str], label: str):
+    settings = get_settings()
+    keys = [key for key in (object_key_from_url(url, bucket) for url in photo_urls) if key]
+    keys = keys[:settings.IMAGE_PREFETCH_PHOTOS]
+    # Bytes this warm-up may still load, shared by its fetches
+    budget = [settings.IMAGE_PREFETCH_MAX_MB * MB]
+    start = time.perf_counter()
+    s3_client = await run_in_threadpool(get_client)
+    results = await asyncio.gather(
+        *(_warm_one(s3_client, bucket, key, budget) for key in keys), return_exceptions=True
+    )
+    failures = [r for r in results if isinstance(r, Exception)]
+    if failures:
+        logger.warning(f"Image cache warm-up for {label}: {len(failures)} of {len(keys)} failed: {failures[0]}")
+    logger.info(f"Warmed image cache for {label}: {len(keys)} photos in {time.perf_counter() - start:.2f}s")
+
+
+def warm_gallery(get_client: Callable, bucket: str, photo_urls: List[str], label: str = "session"):
+    """
+    Load the first IMAGE_PREFETCH_PHOTOS photos of a gallery into the cache in
+    the background. `get_client` returns the S3 client and is called off the
+    event loop, since creating one can be slow.
+    """
+    if not image_cache.enabled or get_settings().IMAGE_PREFETCH_PHOTOS <= 0 or not photo_urls:
+        return
+    task = asyncio.get_running_loop().create_task(_warm(get_client, bucket, list(photo_urls), label))
+    # Keep a reference until it finishes
+    _warm_tasks.add(task)
+    task.add_done_callback(_warm_tasks.discard)
@@ -0,0 +1,374 @@
+"""
+Upload a directory of photos (a memory card, say) into an event and create a
+viewing session for them:
+
+    cd backend
+    python -m app.services.ingest /media/card/DCIM --event-id wedding-2024
+    python -m app.services.ingest /media/card/DCIM --event-id wedding-2024 --part-size-mb 16 --concurrency 32
+
+Files larger than one part are sent as multipart uploads. The parts of all
+files share --concurrency upload slots, so a few large files and many small
+ones both keep the uplink busy; the defaults fill a gigabit uplink at usual
+round-trip times. Memory use is about --concurrency x --part-size-mb.
+
+Progress is kept in a state file (<directory>/.photoshare-ingest.json unless
+--state says otherwise). Running the same command again continues where the
+last run stopped: finished files are skipped, and multipart uploads that were
+cut off resume after the parts S3 already has (list_parts). Every object
+carries the SHA-256 of its file as x-amz-meta-sha256, and a file whose object
+already has that hash isn't sent again, even without the state file as long as
+the batch is the same (--batch-id).
+
+Once every file is stored, the session is created the way POST /session/create
+does it and its link and password are printed.
+"""
+import argparse
+import asyncio
+import fnmatch
+import hashlib
+import json
+import logging
+import math
+import mimetypes
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from functools import partial
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+STATE_FILE_NAME = ".photoshare-ingest.json"
+DEFAULT_PATTERNS = ["*.jpg", "*.jpeg", "*.png", "*.heic", "*.heif", "*.webp", "*.tif", "*.tiff"]
+
+MIB = 1024 * 1024
+MIN_PART_SIZE = 5 * MIB  # S3's minimum for all parts but the last
+MAX_PARTS = 10000
+HASH_WORKERS = 4
+# The state file is rewritten at most this often, and whenever a multipart upload starts
+STATE_SAVE_INTERVAL = 2.0
+
+
+def sha256_file(path: str, chunk_size: int = MIB) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def find_photos(root: str, patterns: List[str]) -> List[Tuple[str, str]]:
+    """(relative path, path) of the matching files under `root`, in path order, skipping hidden ones"""
+    found = []
+    for directory, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(name for name in dirnames if not name.startswith("."))
+        for name in sorted(filenames):
+            if name.startswith(".") or not any(fnmatch.fnmatch(name.lower(), pattern) for pattern in patterns):
+                continue
+            path = os.path.join(directory, name)
+            found.append((os.path.relpath(path, root).replace(os.sep, "/"), path))
+    return found
+
+
+class IngestState:
+    """The state file: the batch the keys are under and how far each file got"""
+
+    def __init__(self, path: str, data: dict):
+        self.path = path
+        self.data = data
+        self._saved_at = 0.0
+
+    @classmethod
+    def load(cls, path: str, event_id: str, batch_id: Optional[str]) -> "IngestState":
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            data = {"event_id": event_id, "batch_id": batch_id or str(uuid.uuid4()), "files": {}, "session_id": None}
+        if data["event_id"] != event_id:
+            raise SystemExit(f"{path} is for event {data['event_id']}; pass another --state")
+        if batch_id and data["batch_id"] != batch_id:
+            raise SystemExit(f"{path} is for batch {data['batch_id']}; pass another --state")
+        return cls(path, data)
+
+    @property
+    def files(self) -> Dict[str, dict]:
+        return self.data["files"]
+
+    def save(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._saved_at < STATE_SAVE_INTERVAL:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.data, f)
+        os.replace(tmp_path, self.path)
+        self._saved_at = now
+
+
+@dataclass
+class IngestReport:
+    event_id: str
+    batch_id: str
+    files: int = 0
+    uploaded: int = 0
+    skipped: int = 0
+    failed: int = 0
+    bytes_sent: int = 0
+    seconds: float = 0.0
+    megabits_per_second: float = 0.0
+    session_id: Optional[str] = None
+    session_link: Optional[str] = None
+    password: Optional[str] = None
+    errors: List[str] = field(default_factory=list)
+
+
+class DirectoryIngest:
+    """Uploads the photos of a directory, keeping an IngestState up to date"""
+
+    def __init__(self, s3_client, bucket: str, root: str, state: IngestState, part_size: int,
+                 concurrency: int, patterns: List[str] = DEFAULT_PATTERNS):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.root = root
+        self.state = state
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.concurrency = concurrency
+        self.patterns = patterns
+        self.report = IngestReport(event_id=state.data["event_id"], batch_id=state.data["batch_id"])
+        self._pool = ThreadPoolExecutor(concurrency + HASH_WORKERS, thread_name_prefix="ingest")
+
+    async def _run(self, fn, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(self._pool, partial(fn, *args, **kwargs))
+
+    def key_for(self, relative_path: str) -> str:
+        return f"{self.state.data['event_id']}/{self.state.data['batch_id']}/{relative_path}"
+
+    def url_for(self, key: str) -> str:
+        # Same form as the upload endpoints return
+        return f"https://{self.bucket}.s3.ap-south-1.amazonaws.com/{quote(key)}"
+
+    async def run(self) -> IngestReport:
+        photos = find_photos(self.root, self.patterns)
+        self.report.files = len(photos)
+        logger.info(f"Ingesting {len(photos)} files from {self.root} as batch {self.report.batch_id}")
+
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._hashing = asyncio.Semaphore(HASH_WORKERS)
+        start = time.perf_counter()
+        try:
+            await asyncio.gather(*(self._ingest_file(relative_path, path) for relative_path, path in photos))
+        finally:
+            self.state.save(force=True)
+            self._pool.shutdown(wait=False, cancel_futures=True)
+        self.report.seconds = round(time.perf_counter() - start, 2)
+        if self.report.seconds:
+            self.report.megabits_per_second = round(self.report.bytes_sent * 8 / 1e6 / self.report.seconds, 1)
+        return self.report
+
+    async def _ingest_file(self, relative_path: str, path: str):
+        try:
+            uploaded = await self._upload_file(relative_path, path)
+        except (BotoCoreError, ClientError, OSError) as e:
+            logger.error(f"Uploading {relative_path} failed: {str(e)}")
+            self.report.failed += 1
+            self.report.errors.append(f"{relative_path}: {str(e)}")
+            return
+        if uploaded:
+            self.report.uploaded += 1
+            logger.info(f"Uploaded {relative_path} ({self.report.uploaded + self.report.skipped}/{self.report.files})")
+        else:
+            self.report.skipped += 1
+
+    async def _upload_file(self, relative_path: str, path: str) -> bool:
+        """Store one file unless it's already stored; False if it was"""
+        stat = os.stat(path)
+        entry = self.state.files.get(relative_path)
+        if entry is not None and (entry["size"] != stat.st_size or entry["mtime_ns"] != stat.st_mtime_ns):
+            # Changed since the last run: start over
+            entry = None
+        if entry is not None and entry["done"]:
+            return False
+
+        if entry is None:
+            async with self._hashing:
+                digest = await self._run(sha256_file, path)
+            entry = self.state.files[relative_path] = {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": digest,
+                "key": self.key_for(relative_path),
+                # Kept per file, so a resumed upload keeps its part boundaries
+                "part_size": max(self.part_size, math.ceil(stat.st_size / MAX_PARTS)),
+                "upload_id": None,
+                "done": False,
+            }
+
+        if entry["upload_id"] is None:
+            async with self._slots:
+                stored = await self._run(self._stored_hash, entry["key"])
+            if stored == entry["sha256"]:
+                self._finish(entry)
+                return False
+
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if entry["size"] <= entry["part_size"]:
+            async with self._slots:
+                await self._run(self._put, path, entry, content_type)
+            self.report.bytes_sent += entry["size"]
+        else:
+            await self._multipart(path, entry, content_type)
+        self._finish(entry)
+        return True
+
+    def _finish(self, entry: dict):
+        entry["done"] = True
+        entry["upload_id"] = None
+        self.state.save()
+
+    def _stored_hash(self, key: str) -> Optional[str]:
+        try:
+            response = self.s3.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response.get("ResponseMetadata", {}).get("HTTPStatusCode") == 404:
+                return None
+            raise
+        return response.get("Metadata", {}).get("sha256")
+
+    def _put(self, path: str, entry: dict, content_type: str):
+        with open(path, "rb") as f:
+            self.s3.put_object(
+                Bucket=self.bucket, Key=entry["key"], Body=f,
+                ContentType=content_type, Metadata={"sha256": entry["sha256"]}
+            )
+
+    def _stored_parts(self, key: str, upload_id: str) -> Optional[Dict[int, str]]:
+        """ETags of the parts an unfinished upload already has; None if the upload is gone"""
+        parts = {}
+        list_args = {"Bucket": self.bucket, "Key": key, "UploadId": upload_id}
+        while True:
+            try:
+                response = self.s3.list_parts(**list_args)
+            except ClientError as e:
+                if e.response.get("Error", {}).get("Code") == "NoSuchUpload":
+                    return None
+                raise
+            parts.update((part["PartNumber"], part["ETag"]) for part in response.get("Parts", []))
+            if not response.get("IsTruncated"):
+                return parts
+            list_args["PartNumberMarker"] = response["NextPartNumberMarker"]
+
+    def _upload_part(self, path: str, entry: dict, upload_id: str, part_number: int) -> Tuple[str, int]:
+        with open(path, "rb") as f:
+            f.seek((part_number - 1) * entry["part_size"])
+            data = f.read(entry["part_size"])
+        response = self.s3.upload_part(
+            Bucket=self.bucket, Key=entry["key"], UploadId=upload_id, PartNumber=part_number, Body=data
+        )
+        return response["ETag"], len(data)
+
+    async def _multipart(self, path: str, entry: dict, content_type: str):
+        key = entry["key"]
+        stored: Dict[int, str] = {}
+        if entry["upload_id"] is not None:
+            async with self._slots:
+                stored = await self._run(self._stored_parts, key, entry["upload_id"])
+            if stored is None:
+                entry["upload_id"], stored = None, {}
+            elif stored:
+                logger.info(f"Resuming {key} after {len(stored)} stored parts")
+        if entry["upload_id"] is None:
+            async with self._slots:
+                response = await self._run(
+                    self.s3.create_multipart_upload,
+                    Bucket=self.bucket, Key=key, ContentType=content_type, Metadata={"sha256": entry["sha256"]}
+                )
+            entry["upload_id"] = response["UploadId"]
+            self.state.save(force=True)
+        upload_id = entry["upload_id"]
+
+        async def send(part_number: int):
+            async with self._slots:
+                stored[part_number], sent = await self._run(self._upload_part, path, entry, upload_id, part_number)
+            self.report.bytes_sent += sent
+
+        part_count = max(1, math.ceil(entry["size"] / entry["part_size"]))
+        await asyncio.gather(*(send(n) for n in range(1, part_count + 1) if n not in stored))
+        async with self._slots:
+            await self._run(
+                self.s3.complete_multipart_upload,
+                Bucket=self.bucket, Key=key, UploadId=upload_id,
+                MultipartUpload={"Parts": [{"PartNumber": n, "ETag": stored[n]} for n in range(1, part_count + 1)]}
+            )
+
+    def photo_urls(self) -> List[str]:
+        return [self.url_for(entry["key"]) for _, entry in sorted(self.state.files.items()) if entry["done"]]
+
+
+def build_s3_client(concurrency: int):
+    """The API's storage backend, with a connection pool for `concurrency` requests on S3"""
+    if get_settings().use_local_storage:
+        from app.services.local_storage import get_local_s3_client
+        return get_local_s3_client()
+
+    from app.core.aws import s3_bulk_client
+    return s3_bulk_client(concurrency)
+
+
+async def ingest_directory(root: str, event_id: str, state_path: Optional[str] = None,
+                           batch_id: Optional[str] = None, part_size: int = 16 * MIB,
+                           concurrency: int = 16, patterns: List[str] = DEFAULT_PATTERNS) -> IngestReport:
+    """Upload the photos under `root` and create their session once all of them are stored"""
+    from app.services.dynamodb import get_dynamodb_client, TABLE_NAME
+    from app.services.s3 import BUCKET_NAME
+    from app.services.photo_meta import wait_for_indexing
+    from app.services.sessions import create_photo_session
+
+    state = IngestState.load(state_path or os.path.join(root, STATE_FILE_NAME), event_id, batch_id)
+    ingest = DirectoryIngest(build_s3_client(concurrency), BUCKET_NAME, root, state, part_size, concurrency, patterns)
+    report = await ingest.run()
+
+    if state.data["session_id"]:
+        logger.info(f"Session {state.data['session_id']} was already created for this batch")
+        report.session_id = state.data["session_id"]
+    elif report.failed:
+        logger.error(f"{report.failed} files failed; run again to retry them before the session is created")
+    elif report.files:
+        table = get_dynamodb_client().Table(TABLE_NAME)
+        session = await create_photo_session(table, event_id, ingest.photo_urls(), report.batch_id)
+        state.data["session_id"] = session.session_id
+        state.save(force=True)
+        report.session_id = session.session_id
+        report.session_link = session.session_link
+        report.password = session.password
+        # The photo index is built in the background; let it finish before exiting
+        await wait_for_indexing()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Upload a directory of photos into an event and create its session")
+    parser.add_argument("directory")
+    parser.add_argument("--event-id", required=True)
+    parser.add_argument("--part-size-mb", type=int, default=16, help="multipart part size (at least 5)")
+    parser.add_argument("--concurrency", type=int, default=16, help="requests in flight at once")
+    parser.add_argument("--state", help=f"state file (default: <directory>/{STATE_FILE_NAME})")
+    parser.add_argument("--batch-id", help="reuse the key prefix of an earlier run")
+    parser.add_argument("--pattern", action="append", help="file name pattern to upload (repeatable)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    result = asyncio.run(ingest_directory(
+        args.directory, args.event_id, state_path=args.state, batch_id=args.batch_id,
+        part_size=args.part_size_mb * MIB, concurrency=args.concurrency,
+        patterns=[pattern.lower() for pattern in args.pattern] if args.pattern else DEFAULT_PATTERNS
+    ))
+    print(json.dumps(asdict(result), indent=2))
+    raise SystemExit(1 if result.failed else 0)
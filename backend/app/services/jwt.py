@@ -1,20 +1,22 @@
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
 from typing import Optional
+import hashlib
+import time
 import jwt
-import bcrypt
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
-import os
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
+from app.core.config import get_settings
+from app.utils.password import verify_password as utils_verify_password
 
 # JWT Settings
-SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-change-in-production")
+SECRET_KEY = get_settings().JWT_SECRET_KEY
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
+# Number of verified tokens kept in memory (0 disables the cache)
+TOKEN_CACHE_SIZE = get_settings().TOKEN_CACHE_SIZE
+
 # OAuth2 scheme for JWT
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
 
@@ -31,8 +33,51 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_session(token: str = Depends(oauth2_scheme)):
-    """Verify the JWT token and return the session_id"""
+class TokenCache:
+    """
+    LRU of already verified tokens, keyed by SHA-256 of the token.
+
+    A hit skips decoding and HMAC verification. Entries are only served until
+    the token's own `exp`, so caching never extends a token's lifetime.
+    """
+
+    def __init__(self, max_size: int = TOKEN_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[bytes, dict]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    def get(self, token: str) -> Optional[dict]:
+        key = self._key(token)
+        claims = self._entries.get(key)
+        if claims is None:
+            self.misses += 1
+            return None
+        if claims["exp"] <= time.time():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return claims
+
+    def put(self, token: str, claims: dict):
+        if self.max_size <= 0:
+            return
+        key = self._key(token)
+        self._entries[key] = claims
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+token_cache = TokenCache()
+
+async def get_current_claims(token: str = Depends(oauth2_scheme)) -> dict:
+    """Verify the JWT token (or find it in the verified-token cache) and return its claims"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Invalid authentication credentials",
@@ -42,12 +87,12 @@ async def get_current_session(token: str = Depends(oauth2_scheme)):
     if token is None:
         raise credentials_exception
 
+    claims = token_cache.get(token)
+    if claims is not None:
+        return claims
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        session_id: str = payload.get("sub")
-        if session_id is None:
-            raise credentials_exception
-        return session_id
     except jwt.ExpiredSignatureError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -57,16 +102,20 @@ async def get_current_session(token: str = Depends(oauth2_scheme)):
     except jwt.InvalidTokenError:
         raise credentials_exception
 
+    if payload.get("sub") is None or payload.get("exp") is None:
+        raise credentials_exception
+
+    token_cache.put(token, payload)
+    return payload
+
+async def get_current_session(claims: dict = Depends(get_current_claims)):
+    """Verify the JWT token and return the session_id"""
+    return claims["sub"]
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
-    Verify a password against its hash using bcrypt
-
-    IMPORTANT NOTE: Password hashing is temporarily disabled, using plain text comparison instead.
-    This function will compare the plain passwords directly.
-    This is ONLY FOR TESTING purposes and should be reverted in production.
+    Verify a password against its bcrypt hash (or a legacy plain text password).
+    Blocks for the length of a bcrypt check; async code should use
+    app.services.password_hasher.password_hasher.verify instead.
     """
-    # Since password hashing is disabled, just compare plain text passwords
-    import logging
-    logger = logging.getLogger(__name__)
-    logger.info(f"JWT SERVICE: Password verification using plain text comparison: comparing '{plain_password}' with '{hashed_password}'")
-    return plain_password == hashed_password
+    return utils_verify_password(plain_password, hashed_password)
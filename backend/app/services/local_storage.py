@@ -0,0 +1,674 @@
+"""
+Local stand-ins for S3 and DynamoDB.
+
+LocalS3Client keeps objects on the filesystem and LocalDynamoDBResource keeps
+tables in SQLite. Both mimic the subset of the boto3 client/resource API the
+app uses (including ClientError codes), so the API, the sweeper, load tests and
+the benchmark suite run unchanged on a machine with no network.
+
+Select them with STORAGE_BACKEND=local. Files go under LOCAL_STORAGE_DIR and
+presigned URLs point at the /local-s3 routes served from LOCAL_STORAGE_URL.
+"""
+import base64
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timezone
+from decimal import Decimal
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+from urllib.parse import quote, urlencode
+
+from boto3.dynamodb.conditions import ConditionBase, AttributeBase
+from botocore.exceptions import ClientError
+from botocore.response import StreamingBody
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+LOCAL_STORAGE_DIR = get_settings().LOCAL_STORAGE_DIR
+LOCAL_STORAGE_URL = get_settings().LOCAL_STORAGE_URL
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def _client_error(code: str, message: str, operation: str, status: int = 400) -> ClientError:
+    return ClientError(
+        {"Error": {"Code": code, "Message": message}, "ResponseMetadata": {"HTTPStatusCode": status}},
+        operation,
+    )
+
+
+class _RangeReader:
+    """File wrapper that stops after `length` bytes"""
+
+    def __init__(self, f, length: int):
+        self._f = f
+        self._remaining = length
+
+    def read(self, amt: Optional[int] = None) -> bytes:
+        if self._remaining <= 0:
+            return b""
+        if amt is None or amt > self._remaining:
+            amt = self._remaining
+        data = self._f.read(amt)
+        self._remaining -= len(data)
+        return data
+
+    def close(self):
+        self._f.close()
+
+
+def _parse_range(range_header: str, size: int) -> Tuple[int, int]:
+    """Parse `bytes=a-b` / `bytes=a-` / `bytes=-n` into an inclusive (start, end)"""
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", range_header.strip())
+    if not match or (not match.group(1) and not match.group(2)):
+        raise _client_error("InvalidRange", "The requested range is not satisfiable", "GetObject", 416)
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        start = max(size - int(last), 0)
+        end = size - 1
+    if start > end or start >= size:
+        raise _client_error("InvalidRange", "The requested range is not satisfiable", "GetObject", 416)
+    return start, end
+
+
+class LocalS3Client:
+    """Filesystem-backed S3 client: <root>/buckets/<bucket>/<key>, metadata under <root>/meta"""
+
+    def __init__(self, root_dir: str = LOCAL_STORAGE_DIR, base_url: str = LOCAL_STORAGE_URL):
+        self.root = os.path.abspath(root_dir)
+        self.base_url = base_url.rstrip("/")
+
+    # Paths
+
+    def _safe_join(self, *parts: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, *parts))
+        if not path.startswith(self.root + os.sep):
+            raise _client_error("InvalidArgument", "Invalid key", "LocalS3")
+        return path
+
+    def _object_path(self, bucket: str, key: str) -> str:
+        if not key or key.endswith("/") or ".." in key.split("/"):
+            raise _client_error("InvalidArgument", f"Invalid key: {key}", "LocalS3")
+        return self._safe_join("buckets", bucket, key)
+
+    def _meta_path(self, bucket: str, key: str) -> str:
+        return self._safe_join("meta", bucket, key + ".json")
+
+    def _upload_dir(self, upload_id: str) -> str:
+        if not re.fullmatch(r"[0-9a-f]{32}", upload_id or ""):
+            raise _client_error("NoSuchUpload", "The specified upload does not exist", "LocalS3", 404)
+        return self._safe_join("multipart", upload_id)
+
+    def _read_meta(self, bucket: str, key: str, operation: str) -> dict:
+        try:
+            with open(self._meta_path(bucket, key)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            if operation == "HeadObject":
+                raise _client_error("404", "Not Found", operation, 404)
+            raise _client_error("NoSuchKey", "The specified key does not exist.", operation, 404)
+
+    @staticmethod
+    def _write_stream(fileobj, path: str, md5=None, callback=None) -> int:
+        """Copy a file-like object to `path` atomically, returning the size"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        size = 0
+        with open(tmp_path, "wb") as out:
+            while True:
+                chunk = fileobj.read(COPY_CHUNK_SIZE)
+                if not chunk:
+                    break
+                if md5 is not None:
+                    md5.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+                if callback is not None:
+                    callback(len(chunk))
+        os.replace(tmp_path, path)
+        return size
+
+    def _store(self, bucket: str, key: str, fileobj, content_type: Optional[str], metadata: Optional[dict],
+               callback=None) -> str:
+        md5 = hashlib.md5()
+        size = self._write_stream(fileobj, self._object_path(bucket, key), md5, callback)
+        etag = f'"{md5.hexdigest()}"'
+        self._write_meta(bucket, key, size, etag, content_type, metadata)
+        return etag
+
+    def _write_meta(self, bucket, key, size, etag, content_type, metadata):
+        meta_path = self._meta_path(bucket, key)
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        with open(meta_path, "w") as f:
+            json.dump({
+                "ContentLength": size,
+                "ETag": etag,
+                "ContentType": content_type or "binary/octet-stream",
+                "Metadata": metadata or {},
+                "LastModified": datetime.now(timezone.utc).isoformat(),
+            }, f)
+
+    # Buckets
+
+    def list_buckets(self, **kwargs):
+        buckets_dir = os.path.join(self.root, "buckets")
+        names = sorted(os.listdir(buckets_dir)) if os.path.isdir(buckets_dir) else []
+        return {"Buckets": [{"Name": name} for name in names]}
+
+    def head_bucket(self, Bucket, **kwargs):
+        os.makedirs(self._safe_join("buckets", Bucket), exist_ok=True)
+        return {}
+
+    # Objects
+
+    def put_object(self, Bucket, Key, Body=b"", ContentType=None, Metadata=None, **kwargs):
+        if isinstance(Body, (bytes, bytearray)):
+            Body = io.BytesIO(Body)
+        etag = self._store(Bucket, Key, Body, ContentType, Metadata)
+        return {"ETag": etag}
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None, Callback=None, **kwargs):
+        extra = ExtraArgs or {}
+        self._store(Bucket, Key, Fileobj, extra.get("ContentType"), extra.get("Metadata"), Callback)
+
+    def head_object(self, Bucket, Key, **kwargs):
+        meta = self._read_meta(Bucket, Key, "HeadObject")
+        return {**meta, "LastModified": datetime.fromisoformat(meta["LastModified"])}
+
+    def get_object(self, Bucket, Key, Range=None, **kwargs):
+        meta = self._read_meta(Bucket, Key, "GetObject")
+        size = meta["ContentLength"]
+        f = open(self._object_path(Bucket, Key), "rb")
+        response = {
+            "ContentType": meta["ContentType"],
+            "ETag": meta["ETag"],
+            "Metadata": meta["Metadata"],
+            "LastModified": datetime.fromisoformat(meta["LastModified"]),
+            "AcceptRanges": "bytes",
+        }
+        if Range:
+            start, end = _parse_range(Range, size)
+            f.seek(start)
+            length = end - start + 1
+            response.update({
+                "Body": StreamingBody(_RangeReader(f, length), length),
+                "ContentLength": length,
+                "ContentRange": f"bytes {start}-{end}/{size}",
+            })
+        else:
+            response.update({"Body": StreamingBody(f, size), "ContentLength": size})
+        return response
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        for path in (self._object_path(Bucket, Key), self._meta_path(Bucket, Key)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        return {}
+
+    def delete_objects(self, Bucket, Delete, **kwargs):
+        deleted = []
+        for obj in Delete.get("Objects", []):
+            self.delete_object(Bucket=Bucket, Key=obj["Key"])
+            deleted.append({"Key": obj["Key"]})
+        return {} if Delete.get("Quiet") else {"Deleted": deleted}
+
+    def list_objects_v2(self, Bucket, Prefix="", MaxKeys=1000, ContinuationToken=None, StartAfter=None, **kwargs):
+        bucket_dir = self._safe_join("buckets", Bucket)
+        keys = []
+        for dirpath, _, filenames in os.walk(bucket_dir):
+            for filename in filenames:
+                if filename.endswith(".tmp"):
+                    continue
+                key = os.path.relpath(os.path.join(dirpath, filename), bucket_dir).replace(os.sep, "/")
+                if key.startswith(Prefix):
+                    keys.append(key)
+        keys.sort()
+
+        after = ContinuationToken and base64.urlsafe_b64decode(ContinuationToken).decode() or StartAfter
+        if after:
+            keys = [key for key in keys if key > after]
+        page, rest = keys[:MaxKeys], keys[MaxKeys:]
+
+        contents = []
+        for key in page:
+            meta = self._read_meta(Bucket, key, "ListObjectsV2")
+            contents.append({
+                "Key": key,
+                "Size": meta["ContentLength"],
+                "ETag": meta["ETag"],
+                "LastModified": datetime.fromisoformat(meta["LastModified"]),
+            })
+        response = {"Contents": contents, "KeyCount": len(contents), "IsTruncated": bool(rest), "Prefix": Prefix}
+        if rest:
+            response["NextContinuationToken"] = base64.urlsafe_b64encode(page[-1].encode()).decode()
+        return response
+
+    # Multipart uploads
+
+    def create_multipart_upload(self, Bucket, Key, ContentType=None, Metadata=None, **kwargs):
+        self._object_path(Bucket, Key)  # validate the key up front
+        upload_id = uuid.uuid4().hex
+        upload_dir = self._upload_dir(upload_id)
+        os.makedirs(upload_dir)
+        with open(os.path.join(upload_dir, "upload.json"), "w") as f:
+            json.dump({
+                "Bucket": Bucket,
+                "Key": Key,
+                "ContentType": ContentType,
+                "Metadata": Metadata or {},
+                "Initiated": datetime.now(timezone.utc).isoformat(),
+            }, f)
+        return {"Bucket": Bucket, "Key": Key, "UploadId": upload_id}
+
+    def _read_upload(self, upload_id: str, operation: str) -> dict:
+        try:
+            with open(os.path.join(self._upload_dir(upload_id), "upload.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise _client_error("NoSuchUpload", "The specified upload does not exist", operation, 404)
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, **kwargs):
+        self._read_upload(UploadId, "UploadPart")
+        if isinstance(Body, (bytes, bytearray)):
+            Body = io.BytesIO(Body)
+        md5 = hashlib.md5()
+        part_path = os.path.join(self._upload_dir(UploadId), f"{int(PartNumber):05d}.part")
+        self._write_stream(Body, part_path, md5)
+        with open(part_path + ".etag", "w") as f:
+            f.write(md5.hexdigest())
+        return {"ETag": f'"{md5.hexdigest()}"'}
+
+    def list_parts(self, Bucket, Key, UploadId, **kwargs):
+        self._read_upload(UploadId, "ListParts")
+        upload_dir = self._upload_dir(UploadId)
+        parts = []
+        for name in sorted(os.listdir(upload_dir)):
+            if not name.endswith(".part"):
+                continue
+            path = os.path.join(upload_dir, name)
+            with open(path + ".etag") as f:
+                etag = f.read()
+            parts.append({"PartNumber": int(name[:-5]), "ETag": f'"{etag}"', "Size": os.path.getsize(path)})
+        return {"Parts": parts, "IsTruncated": False}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **kwargs):
+        upload = self._read_upload(UploadId, "CompleteMultipartUpload")
+        upload_dir = self._upload_dir(UploadId)
+        digests = []
+        object_path = self._object_path(Bucket, Key)
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        tmp_path = f"{object_path}.{uuid.uuid4().hex}.tmp"
+        size = 0
+        with open(tmp_path, "wb") as out:
+            for part in MultipartUpload["Parts"]:
+                part_path = os.path.join(upload_dir, f"{int(part['PartNumber']):05d}.part")
+                try:
+                    with open(part_path + ".etag") as f:
+                        etag = f.read()
+                except FileNotFoundError:
+                    etag = None
+                if etag is None or part["ETag"].strip('"') != etag:
+                    out.close()
+                    os.remove(tmp_path)
+                    raise _client_error("InvalidPart", "One or more of the specified parts could not be found.",
+                                        "CompleteMultipartUpload")
+                digests.append(bytes.fromhex(etag))
+                with open(part_path, "rb") as f:
+                    shutil.copyfileobj(f, out, COPY_CHUNK_SIZE)
+                size += os.path.getsize(part_path)
+        os.replace(tmp_path, object_path)
+        etag = f'"{hashlib.md5(b"".join(digests)).hexdigest()}-{len(digests)}"'
+        self._write_meta(Bucket, Key, size, etag, upload.get("ContentType"), upload.get("Metadata"))
+        shutil.rmtree(upload_dir, ignore_errors=True)
+        return {
+            "Bucket": Bucket,
+            "Key": Key,
+            "ETag": etag,
+            # Same shape as S3 so the URL can be stored in sessions and proxied
+            "Location": f"https://{Bucket}.s3.amazonaws.com/{quote(Key)}",
+        }
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        self._read_upload(UploadId, "AbortMultipartUpload")
+        shutil.rmtree(self._upload_dir(UploadId), ignore_errors=True)
+        return {}
+
+    def list_multipart_uploads(self, Bucket, KeyMarker=None, UploadIdMarker=None, MaxUploads=1000, Prefix="", **kwargs):
+        multipart_dir = os.path.join(self.root, "multipart")
+        uploads = []
+        if os.path.isdir(multipart_dir):
+            for upload_id in os.listdir(multipart_dir):
+                try:
+                    upload = self._read_upload(upload_id, "ListMultipartUploads")
+                except ClientError:
+                    continue
+                if upload["Bucket"] == Bucket and upload["Key"].startswith(Prefix):
+                    uploads.append({
+                        "UploadId": upload_id,
+                        "Key": upload["Key"],
+                        "Initiated": datetime.fromisoformat(upload["Initiated"]),
+                    })
+        uploads.sort(key=lambda u: (u["Key"], u["UploadId"]))
+        if KeyMarker:
+            uploads = [u for u in uploads if (u["Key"], u["UploadId"]) > (KeyMarker, UploadIdMarker or "")]
+        page, rest = uploads[:MaxUploads], uploads[MaxUploads:]
+        response = {"Bucket": Bucket, "Uploads": page, "IsTruncated": bool(rest)}
+        if rest:
+            response["NextKeyMarker"] = page[-1]["Key"]
+            response["NextUploadIdMarker"] = page[-1]["UploadId"]
+        return response
+
+    # Presigned URLs
+
+    def generate_presigned_url(self, ClientMethod, Params=None, ExpiresIn=3600, **kwargs):
+        params = Params or {}
+        url = f"{self.base_url}/local-s3/{params.get('Bucket', '')}/{quote(params.get('Key', ''))}"
+        query = {}
+        if ClientMethod == "upload_part":
+            query = {"uploadId": params["UploadId"], "partNumber": params["PartNumber"]}
+        elif ClientMethod == "put_object" and params.get("ContentType"):
+            query = {"Content-Type": params["ContentType"]}
+        query["X-Amz-Expires"] = ExpiresIn
+        return f"{url}?{urlencode(query)}"
+
+
+# DynamoDB
+
+def _to_json(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, set):
+        return sorted(value)
+    raise TypeError(f"Unsupported type: {type(value)}")
+
+
+def _resolve_name(name: str, names: Optional[dict]) -> str:
+    return (names or {}).get(name, name)
+
+
+def _evaluate(condition, item: dict):
+    """Evaluate a boto3 Key()/Attr() condition against a plain item"""
+    if isinstance(condition, AttributeBase):
+        return item.get(condition.name)
+    if not isinstance(condition, ConditionBase):
+        return _to_json(condition) if isinstance(condition, Decimal) else condition
+
+    operator = condition.expression_operator
+    values = condition._values
+
+    if operator == "AND":
+        return _evaluate(values[0], item) and _evaluate(values[1], item)
+    if operator == "OR":
+        return _evaluate(values[0], item) or _evaluate(values[1], item)
+    if operator == "NOT":
+        return not _evaluate(values[0], item)
+    if operator == "attribute_exists":
+        return values[0].name in item
+    if operator == "attribute_not_exists":
+        return values[0].name not in item
+
+    left = _evaluate(values[0], item)
+    rest = [_evaluate(v, item) for v in values[1:]]
+    if operator == "=":
+        return left == rest[0]
+    if operator == "<>":
+        return left != rest[0]
+    if left is None:
+        return False
+    try:
+        if operator == "<":
+            return left < rest[0]
+        if operator == "<=":
+            return left <= rest[0]
+        if operator == ">":
+            return left > rest[0]
+        if operator == ">=":
+            return left >= rest[0]
+        if operator == "BETWEEN":
+            return rest[0] <= left <= rest[1]
+    except TypeError:
+        return False
+    if operator == "IN":
+        return left in rest[0]
+    if operator == "begins_with":
+        return isinstance(left, str) and left.startswith(rest[0])
+    if operator == "contains":
+        return rest[0] in left
+    raise NotImplementedError(f"Condition operator not supported locally: {operator}")
+
+
+def _split_top_level(text: str, sep: str = ","):
+    parts, depth, current = [], 0, ""
+    for char in text:
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        if char == sep and depth == 0:
+            parts.append(current.strip())
+            current = ""
+        else:
+            current += char
+    if current.strip():
+        parts.append(current.strip())
+    return parts
+
+
+class LocalTable:
+    """SQLite-backed table with the get/put/update/delete/query/scan subset of boto3's Table"""
+
+    def __init__(self, resource: "LocalDynamoDBResource", name: str, hash_key: str, indexes: Dict[str, Tuple[str, str]]):
+        self.resource = resource
+        self.name = name
+        self.hash_key = hash_key
+        self.indexes = indexes
+        self._sql_name = re.sub(r"[^A-Za-z0-9_]", "_", name)
+        with resource.lock:
+            resource.conn.execute(
+                f'CREATE TABLE IF NOT EXISTS "{self._sql_name}" (pk TEXT PRIMARY KEY, item TEXT NOT NULL)'
+            )
+            for index_name, (hash_attr, range_attr) in indexes.items():
+                index_sql_name = re.sub(r"[^A-Za-z0-9_]", "_", f"{name}_{index_name}")
+                resource.conn.execute(
+                    f'CREATE INDEX IF NOT EXISTS "{index_sql_name}" ON "{self._sql_name}" '
+                    f"(json_extract(item, '$.{hash_attr}'), json_extract(item, '$.{range_attr}'))"
+                )
+            resource.conn.commit()
+
+    def _load(self, key_value) -> Optional[dict]:
+        row = self.resource.conn.execute(
+            f'SELECT item FROM "{self._sql_name}" WHERE pk = ?', (str(key_value),)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _save(self, item: dict):
+        self.resource.conn.execute(
+            f'INSERT OR REPLACE INTO "{self._sql_name}" (pk, item) VALUES (?, ?)',
+            (str(item[self.hash_key]), json.dumps(item, default=_to_json)),
+        )
+
+    def _check(self, condition, item: Optional[dict], operation: str):
+        if condition is None:
+            return
+        if isinstance(condition, str):
+            raise NotImplementedError("String condition expressions are not supported locally; use boto3 conditions")
+        if not _evaluate(condition, item or {}):
+            raise _client_error("ConditionalCheckFailedException", "The conditional request failed", operation)
+
+    @staticmethod
+    def _project(item: dict, projection: Optional[str], names: Optional[dict]) -> dict:
+        if not projection:
+            return item
+        wanted = {_resolve_name(name.strip(), names) for name in projection.split(",")}
+        return {k: v for k, v in item.items() if k in wanted}
+
+    def get_item(self, Key, ProjectionExpression=None, ExpressionAttributeNames=None, **kwargs):
+        with self.resource.lock:
+            item = self._load(Key[self.hash_key])
+        if item is None:
+            return {}
+        return {"Item": self._project(item, ProjectionExpression, ExpressionAttributeNames)}
+
+    def put_item(self, Item, ConditionExpression=None, **kwargs):
+        item = json.loads(json.dumps(Item, default=_to_json))
+        with self.resource.lock:
+            self._check(ConditionExpression, self._load(item[self.hash_key]), "PutItem")
+            self._save(item)
+            self.resource.conn.commit()
+        return {}
+
+    def delete_item(self, Key, ConditionExpression=None, **kwargs):
+        with self.resource.lock:
+            self._check(ConditionExpression, self._load(Key[self.hash_key]), "DeleteItem")
+            self.resource.conn.execute(f'DELETE FROM "{self._sql_name}" WHERE pk = ?', (str(Key[self.hash_key]),))
+            self.resource.conn.commit()
+        return {}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues=None, ExpressionAttributeNames=None,
+                    ConditionExpression=None, ReturnValues="NONE", **kwargs):
+        values = json.loads(json.dumps(ExpressionAttributeValues or {}, default=_to_json))
+        names = ExpressionAttributeNames or {}
+        with self.resource.lock:
+            existing = self._load(Key[self.hash_key])
+            self._check(ConditionExpression, existing, "UpdateItem")
+            item = dict(existing or {}, **Key)
+            self._apply_update(item, UpdateExpression, values, names)
+            self._save(item)
+            self.resource.conn.commit()
+        return {"Attributes": item} if ReturnValues == "ALL_NEW" else {}
+
+    def _apply_update(self, item: dict, expression: str, values: dict, names: dict):
+        clauses = re.split(r"\b(SET|ADD|REMOVE)\b", expression.strip())
+        for action, body in zip(clauses[1::2], clauses[2::2]):
+            for assignment in _split_top_level(body):
+                if action == "SET":
+                    path, expr = (part.strip() for part in assignment.split("=", 1))
+                    item[_resolve_name(path, names)] = self._operand(expr, item, values, names)
+                elif action == "ADD":
+                    path, value = assignment.split(None, 1)
+                    name = _resolve_name(path, names)
+                    addend = values[value.strip()]
+                    if isinstance(addend, list):
+                        item[name] = sorted(set(item.get(name, [])) | set(addend))
+                    else:
+                        item[name] = item.get(name, 0) + addend
+                else:
+                    item.pop(_resolve_name(assignment, names), None)
+
+    def _operand(self, expr: str, item: dict, values: dict, names: dict):
+        expr = expr.strip()
+        match = re.fullmatch(r"(if_not_exists|list_append)\s*\((.*)\)", expr)
+        if match:
+            args = _split_top_level(match.group(2))
+            if match.group(1) == "if_not_exists":
+                name = _resolve_name(args[0], names)
+                return item[name] if name in item else self._operand(args[1], item, values, names)
+            return self._operand(args[0], item, values, names) + self._operand(args[1], item, values, names)
+        for op in ("+", "-"):
+            left, sep, right = expr.partition(f" {op} ")
+            if sep:
+                left_value = self._operand(left, item, values, names)
+                right_value = self._operand(right, item, values, names)
+                return left_value + right_value if op == "+" else left_value - right_value
+        if expr.startswith(":"):
+            return values[expr]
+        return item.get(_resolve_name(expr, names))
+
+    def _page(self, items, Limit, ExclusiveStartKey, key_attrs, FilterExpression, ProjectionExpression, names):
+        if ExclusiveStartKey:
+            start_pk = str(ExclusiveStartKey[self.hash_key])
+            for position, item in enumerate(items):
+                if str(item[self.hash_key]) == start_pk:
+                    items = items[position + 1:]
+                    break
+        evaluated = items[:Limit] if Limit else items
+        response = {"ScannedCount": len(evaluated)}
+        if Limit and len(items) > Limit:
+            last = evaluated[-1]
+            response["LastEvaluatedKey"] = {attr: last[attr] for attr in key_attrs if attr in last}
+        if FilterExpression is not None:
+            evaluated = [item for item in evaluated if _evaluate(FilterExpression, item)]
+        response["Items"] = [self._project(item, ProjectionExpression, names) for item in evaluated]
+        response["Count"] = len(response["Items"])
+        return response
+
+    def query(self, KeyConditionExpression, IndexName=None, ScanIndexForward=True, Limit=None,
+              ExclusiveStartKey=None, FilterExpression=None, ProjectionExpression=None,
+              ExpressionAttributeNames=None, **kwargs):
+        if IndexName:
+            hash_attr, range_attr = self.indexes[IndexName]
+        else:
+            hash_attr, range_attr = self.hash_key, None
+        with self.resource.lock:
+            rows = self.resource.conn.execute(
+                f'SELECT item FROM "{self._sql_name}" WHERE json_extract(item, ?) IS NOT NULL',
+                (f"$.{hash_attr}",),
+            ).fetchall()
+        items = [item for item in (json.loads(row[0]) for row in rows) if _evaluate(KeyConditionExpression, item)]
+        if range_attr:
+            items = [item for item in items if range_attr in item]
+            items.sort(key=lambda item: (item[range_attr], str(item[self.hash_key])), reverse=not ScanIndexForward)
+        key_attrs = [self.hash_key] + ([hash_attr, range_attr] if range_attr else [])
+        return self._page(items, Limit, ExclusiveStartKey, key_attrs, FilterExpression,
+                          ProjectionExpression, ExpressionAttributeNames)
+
+    def scan(self, FilterExpression=None, ProjectionExpression=None, Limit=None, ExclusiveStartKey=None,
+             ExpressionAttributeNames=None, **kwargs):
+        with self.resource.lock:
+            rows = self.resource.conn.execute(f'SELECT item FROM "{self._sql_name}" ORDER BY pk').fetchall()
+        items = [json.loads(row[0]) for row in rows]
+        return self._page(items, Limit, ExclusiveStartKey, [self.hash_key], FilterExpression,
+                          ProjectionExpression, ExpressionAttributeNames)
+
+
+class LocalDynamoDBResource:
+    """Stand-in for boto3.resource('dynamodb'); `schemas` maps table -> (hash key, {index: (hash, range)})"""
+
+    def __init__(self, db_path: str, schemas: Dict[str, Tuple[str, Dict[str, Tuple[str, str]]]]):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.lock = threading.Lock()
+        self.schemas = schemas
+        self._tables: Dict[str, LocalTable] = {}
+
+    def Table(self, name: str) -> LocalTable:
+        if name not in self._tables:
+            hash_key, indexes = self.schemas.get(name, ("id", {}))
+            self._tables[name] = LocalTable(self, name, hash_key, indexes)
+        return self._tables[name]
+
+
+@lru_cache(maxsize=None)
+def get_local_s3_client() -> LocalS3Client:
+    logger.info(f"Using local S3 storage in {os.path.abspath(LOCAL_STORAGE_DIR)}")
+    return LocalS3Client(LOCAL_STORAGE_DIR, LOCAL_STORAGE_URL)
+
+
+@lru_cache(maxsize=None)
+def get_local_dynamodb() -> LocalDynamoDBResource:
+    from app.services.dynamodb import TABLE_NAME, EVENT_INDEX_NAME, EXPIRY_INDEX_NAME
+
+    db_path = os.path.join(LOCAL_STORAGE_DIR, "dynamodb.sqlite3")
+    logger.info(f"Using local DynamoDB tables in {os.path.abspath(db_path)}")
+    return LocalDynamoDBResource(db_path, {
+        TABLE_NAME: ("session_id", {
+            EVENT_INDEX_NAME: ("event_id", "created_at"),
+            EXPIRY_INDEX_NAME: ("expiry_shard", "expires_at"),
+        }),
+    })
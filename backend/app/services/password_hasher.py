@@ -0,0 +1,69 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import logging
+
+from app.core.config import get_settings
+from app.utils.password import hash_password, verify_password, is_bcrypt_hash, bcrypt_rounds, BCRYPT_ROUNDS
+
+logger = logging.getLogger(__name__)
+
+# bcrypt releases the GIL while hashing, so a thread pool gives real
+# parallelism without the cost of shipping work to another process.
+PASSWORD_HASH_WORKERS = get_settings().PASSWORD_HASH_WORKERS
+# Hash/verify calls allowed to wait for a worker before we shed load
+PASSWORD_HASH_QUEUE_SIZE = get_settings().PASSWORD_HASH_QUEUE_SIZE
+
+
+class HasherBusy(Exception):
+    """Raised when the hashing queue is full; callers should answer 503"""
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt off the event loop on a dedicated thread pool.
+
+    At most `max_pending` operations may be running or queued; beyond that
+    hash() and verify() raise HasherBusy immediately instead of letting a login
+    rush build an unbounded backlog.
+    """
+
+    def __init__(self, rounds: int = BCRYPT_ROUNDS, workers: int = PASSWORD_HASH_WORKERS,
+                 max_pending: int = PASSWORD_HASH_QUEUE_SIZE):
+        self.rounds = rounds
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        # Only touched from the event loop thread, so no lock is needed
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    async def _run(self, fn, *args):
+        if self._pending >= self.max_pending:
+            logger.warning(f"Password hashing queue full ({self._pending} pending)")
+            raise HasherBusy()
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password, self.rounds)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        if not is_bcrypt_hash(hashed_password):
+            # Legacy plain text: cheap, no need to queue
+            return verify_password(password, hashed_password)
+        return await self._run(verify_password, password, hashed_password)
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        """True for plain text passwords and hashes made with a different work factor"""
+        return not is_bcrypt_hash(hashed_password) or bcrypt_rounds(hashed_password) != self.rounds
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+password_hasher = PasswordHasher()
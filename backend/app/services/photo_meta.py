@@ -0,0 +1,503 @@
+"""
+Per-session photo metadata index: pixel size, EXIF orientation, capture time,
+a BlurHash placeholder and a perceptual hash for grouping bursts.
+
+Only the first PHOTO_META_HEADER_KB of each photo is read (a ranged GET), which
+holds the EXIF block and the frame header of a JPEG or the IHDR/eXIf chunks of
+a PNG. Parsing is plain Python on those bytes. The placeholder and the hash
+are computed from the EXIF preview found in those bytes; only photos without
+one are read whole, up to PHOTO_PLACEHOLDER_MAX_MB and PHOTO_PLACEHOLDER_FULL_READS
+at a time per process (see app.services.placeholders and app.services.bursts).
+A photo that can't be read or decoded gets a null entry (or null placeholder
+and dhash); it never fails the rest of the session's index.
+
+The index has one entry per photo_urls entry, in the same order. It is stored
+in items of its own in the sessions table, PHOTO_INDEX_CHUNK_SIZE entries each
+under `entries`, keyed {session_id}#photo_meta#{photo_version}#{chunk}, so
+sessions stay well below DynamoDB's 400 KB item limit and reading a session
+doesn't read its index. They have no event_id or expires_at, so the event
+index and the sweeper never see them, and expire with the session's purge_at.
+The session item records the index's state as `photo_index` (pending, ready
+or failed) and its chunk count as `photo_index_chunks`. Sessions indexed
+before this have the whole index inline as `photo_meta`, which is still read.
+
+Each entry is a compact list
+[width, height, orientation, taken_at, placeholder, dhash], or null when the
+photo couldn't be read.
+width and height are as stored; orientations 5-8 are displayed rotated by 90
+degrees. taken_at is the EXIF DateTimeOriginal as an ISO 8601 string, with the
+UTC offset when the camera recorded one. placeholder is a BlurHash of the
+photo as displayed and dhash its 64-bit difference hash in hex; either may be
+null. Entries written before these existed are shorter.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Sequence, Set, Tuple
+import asyncio
+import logging
+import re
+import struct
+import threading
+import time
+
+from botocore.exceptions import BotoCoreError, ClientError
+from starlette.concurrency import run_in_threadpool
+
+from app.core.breaker import DependencyUnavailable
+from app.core.config import get_settings
+from app.services.bursts import dhash
+from app.services.placeholders import decode_sample, placeholder
+from app.services.progress import progress_hub
+from app.services.session_cache import META_ABSENT, META_PENDING, META_READY
+from app.utils.s3 import object_key_from_url
+
+logger = logging.getLogger(__name__)
+
+PHOTO_META_HEADER_BYTES = get_settings().PHOTO_META_HEADER_KB * 1024
+# Second, larger read when the frame header wasn't in the first one
+# (e.g. a JPEG with a big ICC profile or preview ahead of it)
+PHOTO_META_MAX_HEADER_BYTES = 8 * PHOTO_META_HEADER_BYTES
+PHOTO_PLACEHOLDERS_ENABLED = get_settings().PHOTO_PLACEHOLDERS_ENABLED
+BURST_INDEX_ENABLED = get_settings().BURST_INDEX_ENABLED
+PHOTO_PLACEHOLDER_MAX_BYTES = int(get_settings().PHOTO_PLACEHOLDER_MAX_MB * 1024 * 1024)
+# Whole photos held in memory at once for placeholders, whatever PHOTO_META_WORKERS is
+PHOTO_PLACEHOLDER_FULL_READS = 2
+
+# Entries per index item: a full entry is about 80 bytes, so ~100 KB per item
+PHOTO_INDEX_CHUNK_SIZE = 1000
+PHOTO_INDEX_KEY_MARKER = "#photo_meta#"
+# An index still pending this long after its session was created was never
+# written (the process building it went away) and is treated as absent
+PHOTO_INDEX_PENDING_SECONDS = 600
+
+# JPEG start-of-frame markers (baseline, progressive, lossless, arithmetic)
+SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+TAG_ORIENTATION = 0x0112
+TAG_DATETIME = 0x0132
+TAG_EXIF_IFD = 0x8769
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_DATETIME_DIGITIZED = 0x9004
+TAG_OFFSET_TIME_ORIGINAL = 0x9011
+TAG_THUMBNAIL_OFFSET = 0x0201
+TAG_THUMBNAIL_LENGTH = 0x0202
+
+EXIF_DATETIME = re.compile(r"(\d{4}):(\d{2}):(\d{2})[ T](\d{2}):(\d{2}):(\d{2})")
+EXIF_OFFSET = re.compile(r"[+-]\d{2}:\d{2}")
+
+
+def _ifd(tiff: bytes, offset: int, order: str, wanted: Set[int]) -> dict:
+    """The `wanted` SHORT, LONG and ASCII tags of one TIFF image file directory"""
+    tags = {}
+    if offset + 2 > len(tiff):
+        return tags
+    count = struct.unpack_from(order + "H", tiff, offset)[0]
+    for entry in range(offset + 2, min(offset + 2 + 12 * count, len(tiff) - 11), 12):
+        tag, kind, n = struct.unpack_from(order + "HHI", tiff, entry)
+        if tag not in wanted:
+            continue
+        if kind == 3:
+            tags[tag] = struct.unpack_from(order + "H", tiff, entry + 8)[0]
+        elif kind == 4:
+            tags[tag] = struct.unpack_from(order + "I", tiff, entry + 8)[0]
+        elif kind == 2:
+            # Strings of up to 4 bytes are stored in the entry itself
+            start = entry + 8 if n <= 4 else struct.unpack_from(order + "I", tiff, entry + 8)[0]
+            raw = tiff[start:start + n]
+            if len(raw) == n:
+                tags[tag] = raw.split(b"\0", 1)[0].decode("ascii", "replace").strip()
+    return tags
+
+
+def _exif_datetime(value: Optional[str], offset: Optional[str]) -> Optional[str]:
+    match = EXIF_DATETIME.match(value or "")
+    if not match or match.group(1) == "0000":
+        return None
+    taken_at = "{}-{}-{}T{}:{}:{}".format(*match.groups())
+    if offset and EXIF_OFFSET.fullmatch(offset):
+        taken_at += offset
+    return taken_at
+
+
+def parse_exif(tiff: bytes):
+    """(orientation, taken_at) from a TIFF-structured EXIF block"""
+    order = {b"II": "<", b"MM": ">"}.get(tiff[:2])
+    if order is None or len(tiff) < 8:
+        return 1, None
+    ifd0 = _ifd(tiff, struct.unpack_from(order + "I", tiff, 4)[0], order,
+                {TAG_ORIENTATION, TAG_DATETIME, TAG_EXIF_IFD})
+    exif = {}
+    if TAG_EXIF_IFD in ifd0:
+        exif = _ifd(tiff, ifd0[TAG_EXIF_IFD], order,
+                    {TAG_DATETIME_ORIGINAL, TAG_DATETIME_DIGITIZED, TAG_OFFSET_TIME_ORIGINAL})
+    orientation = ifd0.get(TAG_ORIENTATION, 1)
+    taken_at = _exif_datetime(
+        exif.get(TAG_DATETIME_ORIGINAL) or exif.get(TAG_DATETIME_DIGITIZED) or ifd0.get(TAG_DATETIME),
+        exif.get(TAG_OFFSET_TIME_ORIGINAL)
+    )
+    return orientation if 1 <= orientation <= 8 else 1, taken_at
+
+
+def _jpeg_segments(data: bytes):
+    """(marker, payload) of each JPEG segment up to the start of the image data"""
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            return
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            # Fill byte
+            pos += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            # Markers without a length
+            pos += 2
+            continue
+        if marker in (0xD9, 0xDA):
+            # End of image or start of scan
+            return
+        length = struct.unpack_from(">H", data, pos + 2)[0]
+        yield marker, data[pos + 4:pos + 2 + length]
+        pos += 2 + length
+
+
+def _parse_jpeg(data: bytes) -> Optional[list]:
+    orientation, taken_at = 1, None
+    for marker, segment in _jpeg_segments(data):
+        if marker == 0xE1 and segment.startswith(b"Exif\0\0"):
+            orientation, taken_at = parse_exif(segment[6:])
+        elif marker in SOF_MARKERS and len(segment) >= 5:
+            height, width = struct.unpack_from(">HH", segment, 1)
+            return [width, height, orientation, taken_at]
+    return None
+
+
+def exif_thumbnail(data: bytes) -> Optional[bytes]:
+    """The JPEG preview most cameras store in the EXIF block (IFD1), if it's in `data`"""
+    if not data.startswith(b"\xff\xd8"):
+        return None
+    try:
+        for marker, segment in _jpeg_segments(data):
+            if marker != 0xE1 or not segment.startswith(b"Exif\0\0"):
+                continue
+            tiff = segment[6:]
+            order = {b"II": "<", b"MM": ">"}.get(tiff[:2])
+            if order is None:
+                return None
+            ifd0 = struct.unpack_from(order + "I", tiff, 4)[0]
+            count = struct.unpack_from(order + "H", tiff, ifd0)[0]
+            ifd1 = struct.unpack_from(order + "I", tiff, ifd0 + 2 + 12 * count)[0]
+            if not ifd1:
+                return None
+            tags = _ifd(tiff, ifd1, order, {TAG_THUMBNAIL_OFFSET, TAG_THUMBNAIL_LENGTH})
+            start, length = tags.get(TAG_THUMBNAIL_OFFSET), tags.get(TAG_THUMBNAIL_LENGTH)
+            if not start or not length:
+                return None
+            thumbnail = tiff[start:start + length]
+            return thumbnail if len(thumbnail) == length and thumbnail.startswith(b"\xff\xd8") else None
+    except struct.error:
+        pass
+    return None
+
+
+def _parse_png(data: bytes) -> Optional[list]:
+    if len(data) < 24 or data[12:16] != b"IHDR":
+        return None
+    width, height = struct.unpack_from(">II", data, 16)
+    orientation, taken_at = 1, None
+    # eXIf is only honoured ahead of the image data
+    pos = 8
+    while pos + 8 <= len(data):
+        length, kind = struct.unpack_from(">I4s", data, pos)
+        if kind == b"IDAT":
+            break
+        if kind == b"eXIf":
+            orientation, taken_at = parse_exif(data[pos + 8:pos + 8 + length])
+            break
+        pos += 12 + length
+    return [width, height, orientation, taken_at]
+
+
+def parse_image_header(data: bytes) -> Optional[list]:
+    """
+    [width, height, orientation, taken_at] from the first bytes of a JPEG or
+    PNG, or None if it is another format or the frame header isn't in `data`
+    """
+    try:
+        if data.startswith(b"\xff\xd8"):
+            return _parse_jpeg(data)
+        if data.startswith(PNG_SIGNATURE):
+            return _parse_png(data)
+    except struct.error:
+        pass
+    return None
+
+
+# Ranged GETs spend their time waiting on S3 and parsing a header takes
+# microseconds, so threads are enough
+_pool = ThreadPoolExecutor(max_workers=get_settings().PHOTO_META_WORKERS, thread_name_prefix="photo_meta")
+_index_tasks: Set[asyncio.Task] = set()
+_full_reads = threading.BoundedSemaphore(PHOTO_PLACEHOLDER_FULL_READS)
+
+
+def _read_header(s3_client, bucket: str, key: str, size: int):
+    response = s3_client.get_object(Bucket=bucket, Key=key, Range=f"bytes=0-{size - 1}")
+    body = response["Body"]
+    try:
+        data = body.read()
+    finally:
+        body.close()
+    # "bytes 0-65535/1234567"
+    total = int(response.get("ContentRange", "").rpartition("/")[2] or len(data))
+    return data, total
+
+
+def read_photo_meta(s3_client, bucket: str, url: str) -> Optional[list]:
+    """Index entry for one photo URL, or None if it can't be read"""
+    key = object_key_from_url(url, bucket)
+    if not key:
+        return None
+    try:
+        data, total = _read_header(s3_client, bucket, key, PHOTO_META_HEADER_BYTES)
+        meta = parse_image_header(data)
+        if meta is None and total > len(data) and data.startswith(b"\xff\xd8"):
+            data, _ = _read_header(s3_client, bucket, key, PHOTO_META_MAX_HEADER_BYTES)
+            meta = parse_image_header(data)
+        if meta is not None and (PHOTO_PLACEHOLDERS_ENABLED or BURST_INDEX_ENABLED):
+            meta += _sample_fields(s3_client, bucket, key, data, total, meta)
+        return meta
+    except (ClientError, BotoCoreError, DependencyUnavailable) as e:
+        logger.warning(f"Could not read metadata of {key}: {str(e)}")
+        return None
+
+
+def _sample_fields(s3_client, bucket: str, key: str, header: bytes, total: int, meta: list) -> list:
+    """[placeholder, dhash], from the EXIF preview or the whole photo; nulls if neither works"""
+    try:
+        source = exif_thumbnail(header)
+        if source is not None or total <= len(header):
+            sample = decode_sample(source or header, meta[0], meta[1], meta[2])
+        elif total > PHOTO_PLACEHOLDER_MAX_BYTES:
+            return [None, None]
+        else:
+            with _full_reads:
+                sample = decode_sample(_read_header(s3_client, bucket, key, total)[0], meta[0], meta[1], meta[2])
+        if sample is None:
+            return [None, None]
+        return [
+            placeholder(sample) if PHOTO_PLACEHOLDERS_ENABLED else None,
+            dhash(sample) if BURST_INDEX_ENABLED else None,
+        ]
+    except Exception as e:
+        # Size, orientation and capture time are still worth keeping
+        logger.warning(f"Could not compute placeholder of {key}: {str(e)}")
+        return [None, None]
+
+
+async def extract_photo_meta(s3_client, bucket: str, photo_urls: List[str],
+                             on_progress: Optional[Callable[[int], None]] = None) -> List[Optional[list]]:
+    """
+    Index entries for `photo_urls`, in order, read on the metadata pool.
+    `on_progress(done)` is called as each photo finishes.
+    """
+    loop = asyncio.get_running_loop()
+    futures = [loop.run_in_executor(_pool, read_photo_meta, s3_client, bucket, url) for url in photo_urls]
+    if on_progress is not None:
+        done = 0
+
+        def finished(_):
+            nonlocal done
+            done += 1
+            on_progress(done)
+
+        for future in futures:
+            future.add_done_callback(finished)
+    meta = []
+    for url, result in zip(photo_urls, await asyncio.gather(*futures, return_exceptions=True)):
+        if isinstance(result, Exception):
+            logger.warning(f"Could not index {url}: {str(result)}")
+            result = None
+        meta.append(result)
+    return meta
+
+
+def extract_photo_meta_sync(s3_client, bucket: str, photo_urls: List[str]) -> List[Optional[list]]:
+    """extract_photo_meta for scripts without an event loop"""
+    return list(_pool.map(lambda url: read_photo_meta(s3_client, bucket, url), photo_urls))
+
+
+def _decode(stored: list) -> List[Optional[list]]:
+    """Stored index entries with DynamoDB's Decimals turned back into ints"""
+    return [
+        [int(entry[0]), int(entry[1]), int(entry[2])] + [entry[i] if len(entry) > i else None for i in (3, 4, 5)]
+        if entry else None
+        for entry in stored
+    ]
+
+
+def indexes_photos(photo_urls: Sequence[str]) -> bool:
+    """Whether index_session_photos builds an index for these photos"""
+    return get_settings().PHOTO_META_ENABLED and bool(photo_urls)
+
+
+def index_key(session_id: str, version: Optional[int], chunk: int) -> str:
+    return f"{session_id}{PHOTO_INDEX_KEY_MARKER}{version or 0}#{chunk}"
+
+
+def is_index_key(key: str) -> bool:
+    """Whether a sessions table key is an index item rather than a session"""
+    return PHOTO_INDEX_KEY_MARKER in key
+
+
+def _version_condition(version: Optional[int]):
+    from boto3.dynamodb.conditions import Attr
+
+    return Attr("photo_version").eq(version) if version is not None else Attr("photo_version").not_exists()
+
+
+def store_photo_index(table, session_id: str, version: Optional[int], meta: List[Optional[list]],
+                      purge_at: Optional[int] = None) -> int:
+    """
+    Write a session's index items and mark it ready, if photo_urls is still
+    at `version` (ConditionalCheckFailedException otherwise). Returns the
+    number of items written.
+    """
+    chunks = [meta[i:i + PHOTO_INDEX_CHUNK_SIZE] for i in range(0, len(meta), PHOTO_INDEX_CHUNK_SIZE)] or [[]]
+    for n, entries in enumerate(chunks):
+        item = {"session_id": index_key(session_id, version, n), "entries": entries}
+        if purge_at is not None:
+            item["purge_at"] = int(purge_at)
+        table.put_item(Item=item)
+    table.update_item(
+        Key={"session_id": session_id},
+        UpdateExpression="SET photo_index = :ready, photo_index_chunks = :chunks REMOVE photo_meta",
+        ConditionExpression=_version_condition(version),
+        ExpressionAttributeValues={":ready": "ready", ":chunks": len(chunks)}
+    )
+    return len(chunks)
+
+
+def mark_photo_index_failed(table, session_id: str, version: Optional[int]):
+    table.update_item(
+        Key={"session_id": session_id},
+        UpdateExpression="SET photo_index = :failed",
+        ConditionExpression=_version_condition(version),
+        ExpressionAttributeValues={":failed": "failed"}
+    )
+
+
+def photo_index_state(session: dict, now: Optional[int] = None) -> str:
+    """META_READY, META_PENDING or META_ABSENT, from a session item alone"""
+    if "photo_meta" in session:
+        return META_READY
+    state = session.get("photo_index")
+    if state == "ready":
+        return META_READY
+    if state == "pending":
+        now = int(time.time()) if now is None else now
+        if now - int(session.get("created_at", 0)) < PHOTO_INDEX_PENDING_SECONDS:
+            return META_PENDING
+    return META_ABSENT
+
+
+def read_photo_index(table, session: dict) -> Tuple[str, Optional[List[Optional[list]]]]:
+    """(state, index) of a session item, reading its index items when it's ready"""
+    if "photo_meta" in session:
+        return META_READY, _decode(session["photo_meta"])
+    state = photo_index_state(session)
+    if state != META_READY:
+        return state, None
+    meta = []
+    for n in range(int(session.get("photo_index_chunks", 1))):
+        key = index_key(session["session_id"], session.get("photo_version"), n)
+        item = table.get_item(Key={"session_id": key}).get("Item")
+        if item is None:
+            logger.warning(f"Index item {key} is missing")
+            return META_ABSENT, None
+        meta.extend(_decode(item.get("entries", [])))
+    return META_READY, meta
+
+
+def _publisher(session_id: str, channels: Sequence[str]) -> Callable:
+    def publish(event_type: str, **data):
+        for channel in channels:
+            progress_hub.publish(channel, event_type, session_id=session_id, **data)
+    return publish
+
+
+async def _mark_failed(table, session_id: str, version: int):
+    try:
+        await run_in_threadpool(mark_photo_index_failed, table, session_id, version)
+    except (ClientError, BotoCoreError, DependencyUnavailable) as e:
+        # Readers give up on it after PHOTO_INDEX_PENDING_SECONDS anyway
+        logger.warning(f"Could not mark the index of session {session_id} failed: {str(e)}")
+
+
+async def _index(get_client: Callable, table, bucket: str, session_id: str, photo_urls: List[str],
+                 version: int, purge_at: Optional[int], on_indexed: Optional[Callable], publish: Callable):
+    start = time.perf_counter()
+    total = len(photo_urls)
+    step = max(1, total // 10)
+
+    def on_progress(done: int):
+        # About ten progress events per session
+        if done % step == 0 and done < total:
+            publish("derivatives_progress", done=done, total=total)
+
+    try:
+        s3_client = await run_in_threadpool(get_client)
+        meta = await extract_photo_meta(s3_client, bucket, photo_urls, on_progress)
+        # Only if photo_urls is still the list the index was built from
+        await run_in_threadpool(store_photo_index, table, session_id, version, meta, purge_at)
+    except Exception as e:
+        if isinstance(e, ClientError) and e.response.get("Error", {}).get("Code") == "ConditionalCheckFailedException":
+            logger.info(f"Photos of session {session_id} changed while indexing; index dropped")
+            return
+        await _mark_failed(table, session_id, version)
+        if on_indexed is not None:
+            on_indexed(None)
+        raise
+    if on_indexed is not None:
+        on_indexed(meta)
+    found = sum(1 for entry in meta if entry is not None)
+    publish("derivatives_ready", indexed=found, total=total)
+    logger.info(f"Indexed {found} of {len(meta)} photos of session {session_id} "
+                f"in {time.perf_counter() - start:.2f}s")
+
+
+def index_session_photos(get_client: Callable, table, bucket: str, session_id: str, photo_urls: List[str],
+                         version: int, purge_at: Optional[int] = None, on_indexed: Optional[Callable] = None,
+                         progress_channels: Sequence[str] = ()):
+    """
+    Build and store the metadata index of a session in the background; the
+    session item should have been written with photo_index "pending" (see
+    indexes_photos). `on_indexed(meta)` is called once it has been written,
+    or with None if that failed. Progress goes to each of
+    `progress_channels` as derivatives_* events.
+    """
+    if not indexes_photos(photo_urls):
+        return
+    publish = _publisher(session_id, progress_channels)
+    task = asyncio.get_running_loop().create_task(
+        _index(get_client, table, bucket, session_id, list(photo_urls), version, purge_at, on_indexed, publish)
+    )
+
+    def done(task: asyncio.Task):
+        _index_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Indexing photos of session {session_id} failed: {task.exception()}")
+            publish("derivatives_failed", error=str(task.exception()))
+
+    # Keep a reference until it finishes
+    _index_tasks.add(task)
+    task.add_done_callback(done)
+
+
+async def wait_for_indexing():
+    """Wait for the indexing started so far (for tools that exit right after creating a session)"""
+    if _index_tasks:
+        await asyncio.gather(*_index_tasks, return_exceptions=True)
+
+
+def shutdown():
+    _pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,123 @@
+"""
+BlurHash placeholders: a ~30 character string per photo that clients decode
+into a blurred preview to paint while the photo itself loads.
+
+Pixels come from the smallest source available, usually the photo's EXIF
+preview, decoded with Pillow in draft mode (JPEG scales down while decoding)
+and then shrunk to at most SAMPLE_SIZE pixels a side. The BlurHash DCT is
+computed over all of them at once with NumPy.
+
+Pillow and NumPy are imported on first use so they don't slow down startup.
+"""
+import io
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Longest side of the pixels the hash is computed from
+SAMPLE_SIZE = 32
+# Components along the long and the short side of the photo
+LONG_COMPONENTS = 4
+SHORT_COMPONENTS = 3
+
+BASE83 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+
+
+def _base83(value: int, length: int) -> str:
+    return "".join(BASE83[(value // 83 ** (length - i - 1)) % 83] for i in range(length))
+
+
+def blurhash(pixels, x_components: int = LONG_COMPONENTS, y_components: int = SHORT_COMPONENTS) -> str:
+    """BlurHash of an (height, width, 3) array of 8-bit sRGB pixels"""
+    import numpy as np
+
+    height, width = pixels.shape[:2]
+    srgb = pixels.astype(np.float64) / 255
+    linear = np.where(srgb <= 0.04045, srgb / 12.92, ((srgb + 0.055) / 1.055) ** 2.4)
+
+    cos_x = np.cos(np.pi * np.arange(x_components)[:, None] * np.arange(width)[None, :] / width)
+    cos_y = np.cos(np.pi * np.arange(y_components)[:, None] * np.arange(height)[None, :] / height)
+    # factors[j, i] = sum over pixels of cos_y[j, y] * cos_x[i, x] * linear[y, x]
+    factors = np.einsum("jy,ix,yxc->jic", cos_y, cos_x, linear) / (width * height)
+    factors[1:] *= 2
+    factors[0, 1:] *= 2
+    factors = factors.reshape(-1, 3)
+    dc, ac = factors[0], factors[1:]
+
+    result = _base83((x_components - 1) + (y_components - 1) * 9, 1)
+    if len(ac):
+        quantised_max = int(max(0, min(82, np.floor(np.abs(ac).max() * 166 - 0.5))))
+        maximum = (quantised_max + 1) / 166
+    else:
+        quantised_max, maximum = 0, 1
+    result += _base83(quantised_max, 1)
+
+    dc = np.clip(dc, 0, 1)
+    dc = np.where(dc <= 0.0031308, dc * 12.92, 1.055 * dc ** (1 / 2.4) - 0.055)
+    r, g, b = (dc * 255 + 0.5).astype(int)
+    result += _base83((r << 16) + (g << 8) + b, 4)
+
+    scaled = np.sign(ac) * np.abs(ac / maximum) ** 0.5
+    quantised = np.clip(np.floor(scaled * 9 + 9.5), 0, 18).astype(int)
+    for qr, qg, qb in quantised:
+        result += _base83(qr * 19 * 19 + qg * 19 + qb, 2)
+    return result
+
+
+def decode_sample(image_bytes: bytes, width: int, height: int, orientation: int = 1):
+    """
+    The photo as displayed, at most SAMPLE_SIZE pixels a side, from
+    `image_bytes` (the photo or a smaller preview of it). `width` and `height`
+    are the photo's stored size; a preview of another aspect ratio
+    (letterboxed) is cropped to match. None if the image can't be decoded.
+    """
+    from PIL import Image
+
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            image.draft("RGB", (SAMPLE_SIZE * 2, SAMPLE_SIZE * 2))
+            image = image.convert("RGB")
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        logger.debug(f"Could not decode image sample: {str(e)}")
+        return None
+
+    if width and height:
+        # Crop to the photo's aspect ratio around the centre
+        sample_width, sample_height = image.size
+        target = width / height
+        if sample_width / sample_height > target * 1.02:
+            crop = round(sample_height * target)
+            left = (sample_width - crop) // 2
+            image = image.crop((left, 0, left + crop, sample_height))
+        elif sample_width / sample_height < target / 1.02:
+            crop = round(sample_width / target)
+            top = (sample_height - crop) // 2
+            image = image.crop((0, top, sample_width, top + crop))
+
+    transpose = {
+        2: Image.Transpose.FLIP_LEFT_RIGHT,
+        3: Image.Transpose.ROTATE_180,
+        4: Image.Transpose.FLIP_TOP_BOTTOM,
+        5: Image.Transpose.TRANSPOSE,
+        6: Image.Transpose.ROTATE_270,
+        7: Image.Transpose.TRANSVERSE,
+        8: Image.Transpose.ROTATE_90,
+    }.get(orientation)
+    if transpose is not None:
+        image = image.transpose(transpose)
+
+    image.thumbnail((SAMPLE_SIZE, SAMPLE_SIZE), Image.Resampling.BOX)
+    return image
+
+
+def placeholder(sample) -> str:
+    """BlurHash of a sample from decode_sample(), with more components along its long side"""
+    import numpy as np
+
+    pixels = np.asarray(sample)
+    landscape = pixels.shape[1] >= pixels.shape[0]
+    return blurhash(
+        pixels,
+        LONG_COMPONENTS if landscape else SHORT_COMPONENTS,
+        SHORT_COMPONENTS if landscape else LONG_COMPONENTS
+    )
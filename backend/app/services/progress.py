@@ -0,0 +1,210 @@
+"""
+In-process pub/sub for upload and processing progress, streamed to clients
+as Server-Sent Events by /api/v1/progress/{channel}.
+
+A channel is an upload batch or a viewing session. Only the server opens
+channels: batch channels get a random, unguessable name (the `batch_id`
+handed out by POST /progress, which the client then sends with its uploads),
+session channels are named after the session_id when the session is created.
+Publishing to or subscribing to a channel that isn't open does nothing, so
+clients can't make the hub allocate anything. At most MAX_CHANNELS are open
+and MAX_SUBSCRIBERS watch each.
+
+Every event is encoded once when it is published and fanned out to each
+subscriber's bounded queue; a subscriber that falls behind loses its oldest
+events instead of slowing the publisher. The last PROGRESS_HISTORY_SIZE
+events of a channel are kept so a client that subscribes late, or reconnects
+with Last-Event-ID, still gets them. Idle channels nobody watches are dropped
+after PROGRESS_RETENTION_SECONDS; when MAX_CHANNELS are open and none of them
+can be dropped, no new channel is opened until one can.
+
+Channels live in one worker process; with several workers, a client's
+uploads and its event stream must reach the same one.
+"""
+from collections import OrderedDict, deque
+from typing import AsyncIterator, Optional, Set
+import asyncio
+import json
+import secrets
+import threading
+import time
+
+from app.core.config import get_settings
+
+PROGRESS_QUEUE_SIZE = get_settings().PROGRESS_QUEUE_SIZE
+PROGRESS_HISTORY_SIZE = get_settings().PROGRESS_HISTORY_SIZE
+PROGRESS_RETENTION_SECONDS = get_settings().PROGRESS_RETENTION_SECONDS
+MAX_CHANNELS = 10000
+MAX_SUBSCRIBERS = 8
+
+
+class ChannelLimitReached(Exception):
+    """MAX_CHANNELS are open and none of them can be dropped yet"""
+
+
+class Event:
+    __slots__ = ("id", "encoded")
+
+    def __init__(self, event_id: int, event_type: str, data: dict):
+        self.id = event_id
+        self.encoded = f"id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data)}\n\n".encode()
+
+
+class _Channel:
+    def __init__(self, history_size: int, batch: bool):
+        # Batch channels can be watched by anyone who knows their name
+        self.batch = batch
+        self.next_id = 1
+        self.history = deque(maxlen=history_size)
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.last_used = time.monotonic()
+
+
+class ProgressHub:
+    """Channels of progress events with any number of subscribers each"""
+
+    def __init__(self, queue_size: int = PROGRESS_QUEUE_SIZE, history_size: int = PROGRESS_HISTORY_SIZE,
+                 retention: float = PROGRESS_RETENTION_SECONDS):
+        self.queue_size = queue_size
+        self.history_size = history_size
+        self.retention = retention
+        # Least recently used first, so idle channels are found at the front
+        self._channels: "OrderedDict[str, _Channel]" = OrderedDict()
+        self.dropped = 0
+
+    def open_channel(self, name: Optional[str] = None) -> str:
+        """
+        Open a channel and return its name: with no name a new batch channel
+        with a random name, otherwise the channel of session `name`. Raises
+        ChannelLimitReached when there is no room.
+        """
+        batch = name is None
+        if batch:
+            name = secrets.token_urlsafe(18)
+        channel = self._channels.get(name)
+        if channel is None:
+            self._prune()
+            if len(self._channels) >= MAX_CHANNELS:
+                raise ChannelLimitReached()
+            channel = self._channels[name] = _Channel(self.history_size, batch)
+        self._touch(name, channel)
+        return name
+
+    def _touch(self, name: str, channel: _Channel):
+        self._channels.move_to_end(name)
+        channel.last_used = time.monotonic()
+
+    def is_batch(self, channel_name: str) -> bool:
+        channel = self._channels.get(channel_name)
+        return channel is not None and channel.batch
+
+    def has_channel(self, channel_name: str) -> bool:
+        return channel_name in self._channels
+
+    def _prune(self):
+        """
+        Drop channels nobody watches that have been idle for `retention`,
+        oldest first. Channels in use are never dropped to make room, even
+        at MAX_CHANNELS: open_channel refuses new ones instead.
+        """
+        now = time.monotonic()
+        for name in list(self._channels):
+            channel = self._channels[name]
+            if now - channel.last_used < self.retention:
+                break
+            if not channel.subscribers:
+                del self._channels[name]
+
+    def publish(self, channel_name: Optional[str], event_type: str, **data):
+        """
+        Send an event to a channel's subscribers; call from the event loop
+        thread. Events for channels that aren't open are dropped.
+        """
+        channel = self._channels.get(channel_name) if channel_name else None
+        if channel is None:
+            return
+        self._touch(channel_name, channel)
+        event = Event(channel.next_id, event_type, data)
+        channel.next_id += 1
+        channel.history.append(event)
+        for queue in channel.subscribers:
+            if queue.full():
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait(event)
+
+    def publish_threadsafe(self, loop: asyncio.AbstractEventLoop, channel_name: Optional[str], event_type: str, **data):
+        """publish() from another thread"""
+        if channel_name:
+            loop.call_soon_threadsafe(lambda: self.publish(channel_name, event_type, **data))
+
+    async def subscribe(self, channel_name: str, last_event_id: int = 0,
+                        heartbeat: Optional[float] = None) -> AsyncIterator[Optional[Event]]:
+        """
+        The channel's events after `last_event_id`, then new ones as they are
+        published. Yields None after `heartbeat` seconds without an event.
+        Ends at once if the channel isn't open.
+        """
+        channel = self._channels.get(channel_name)
+        if channel is None:
+            return
+        self._touch(channel_name, channel)
+        queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        # Subscribe before replaying, so nothing published meanwhile is missed
+        channel.subscribers.add(queue)
+        try:
+            seen = last_event_id
+            for event in list(channel.history):
+                if event.id > seen:
+                    seen = event.id
+                    yield event
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                if event.id > seen:
+                    seen = event.id
+                    yield event
+        finally:
+            channel.subscribers.discard(queue)
+            channel.last_used = time.monotonic()
+
+    def subscriber_count(self, channel_name: str) -> int:
+        channel = self._channels.get(channel_name)
+        return len(channel.subscribers) if channel else 0
+
+
+progress_hub = ProgressHub()
+
+
+class TransferProgress:
+    """
+    Callback for boto3 transfers (upload_fileobj's Callback) that publishes
+    `file_progress` events, at most one per PROGRESS_STEP of the file. It is
+    called on s3transfer's threads, several at once for multipart transfers.
+    """
+
+    PROGRESS_STEP = 0.1
+
+    def __init__(self, channel_name: Optional[str], filename: str, total: Optional[int]):
+        self.channel_name = channel_name
+        self.filename = filename
+        self.total = total
+        self.sent = 0
+        self._next_report = (total or 0) * self.PROGRESS_STEP
+        self._lock = threading.Lock()
+        self._loop = asyncio.get_running_loop()
+
+    def __call__(self, bytes_amount: int):
+        with self._lock:
+            self.sent += bytes_amount
+            if not self.channel_name or not self.total or self.sent < self._next_report:
+                return
+            self._next_report = self.sent + self.total * self.PROGRESS_STEP
+            sent = self.sent
+        progress_hub.publish_threadsafe(
+            self._loop, self.channel_name, "file_progress",
+            filename=self.filename, bytes=sent, total=self.total
+        )
@@ -0,0 +1,142 @@
+from collections import OrderedDict
+from fastapi import HTTPException, Request, Path
+from typing import Tuple
+import logging
+import math
+import sqlite3
+import threading
+import time
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# "memory" keeps buckets per process. "sqlite" shares them between the worker
+# processes on one host (gunicorn -w N) through a small SQLite file.
+AUTH_RATE_LIMIT_STORE = get_settings().AUTH_RATE_LIMIT_STORE
+AUTH_RATE_LIMIT_DB = get_settings().AUTH_RATE_LIMIT_DB
+
+# Attempts per (session, client IP): a guest who mistypes a few times is fine,
+# a brute-force loop against one session is not.
+AUTH_SESSION_BURST = get_settings().AUTH_SESSION_BURST
+AUTH_SESSION_REFILL_PER_MINUTE = get_settings().AUTH_SESSION_REFILL_PER_MINUTE
+# Attempts per client IP across all sessions
+AUTH_IP_BURST = get_settings().AUTH_IP_BURST
+AUTH_IP_REFILL_PER_MINUTE = get_settings().AUTH_IP_REFILL_PER_MINUTE
+
+MEMORY_STORE_MAX_KEYS = 100_000
+
+
+def _refill(tokens: float, updated: float, now: float, capacity: float, rate: float) -> float:
+    return min(capacity, tokens + (now - updated) * rate)
+
+
+def _retry_after(tokens: float, rate: float) -> int:
+    return max(1, math.ceil((1 - tokens) / rate)) if rate > 0 else 60
+
+
+class MemoryBucketStore:
+    """Token buckets in a bounded in-process LRU"""
+
+    def __init__(self, max_keys: int = MEMORY_STORE_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, capacity: float, rate: float) -> Tuple[bool, int]:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = _refill(tokens, updated, now, capacity, rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, 0 if allowed else _retry_after(tokens, rate)
+
+
+class SQLiteBucketStore:
+    """Token buckets in a SQLite file shared by every worker on the host"""
+
+    CLEANUP_EVERY = 1000
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, timeout=1.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        self._lock = threading.Lock()
+        self._operations = 0
+
+    def take(self, key: str, capacity: float, rate: float) -> Tuple[bool, int]:
+        # Wall clock, since monotonic clocks aren't comparable across processes
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+                tokens = _refill(row[0], row[1], now, capacity, rate) if row else capacity
+                allowed = tokens >= 1
+                if allowed:
+                    tokens -= 1
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)", (key, tokens, now)
+                )
+                self._operations += 1
+                if self._operations % self.CLEANUP_EVERY == 0:
+                    # Buckets idle this long have refilled completely anyway
+                    self._conn.execute("DELETE FROM buckets WHERE updated < ?", (now - 3600,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return allowed, 0 if allowed else _retry_after(tokens, rate)
+
+
+def create_bucket_store():
+    if AUTH_RATE_LIMIT_STORE == "sqlite":
+        logger.info(f"Auth rate limits shared through {AUTH_RATE_LIMIT_DB}")
+        return SQLiteBucketStore(AUTH_RATE_LIMIT_DB)
+    return MemoryBucketStore()
+
+
+bucket_store = create_bucket_store()
+
+
+def client_ip(request: Request) -> str:
+    """
+    The client address as seen by the ASGI server. Behind a proxy, run uvicorn
+    with --proxy-headers/--forwarded-allow-ips so this is the real client.
+    """
+    return request.client.host if request.client else "unknown"
+
+
+async def limit_auth_attempts(request: Request, session_id: str = Path(...)):
+    """
+    Dependency that rejects password attempts with 429 before any database
+    lookup or bcrypt work happens. Buckets are per (session, IP) and per IP,
+    so a flood from one address does not use up other guests' attempts.
+    """
+    ip = client_ip(request)
+    checks = (
+        (f"auth:{session_id}:{ip}", AUTH_SESSION_BURST, AUTH_SESSION_REFILL_PER_MINUTE / 60),
+        (f"auth-ip:{ip}", AUTH_IP_BURST, AUTH_IP_REFILL_PER_MINUTE / 60),
+    )
+    for key, capacity, rate in checks:
+        try:
+            allowed, retry_after = bucket_store.take(key, capacity, rate)
+        except sqlite3.Error as e:
+            # Fail open: a broken limiter must not lock every guest out
+            logger.error(f"Rate limit store error: {str(e)}")
+            return
+        if not allowed:
+            logger.warning(f"Rate limited auth attempt for session {session_id} from {ip}")
+            raise HTTPException(
+                status_code=429,
+                detail="Too many authentication attempts, please wait",
+                headers={"Retry-After": str(retry_after)}
+            )
@@ -0,0 +1,31 @@
+import logging
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Use your bucket name
+BUCKET_NAME = get_settings().AWS_BUCKET_NAME
+
+# Initialize S3 client as a dependency
+def get_s3_client():
+    settings = get_settings()
+    # STORAGE_BACKEND=local keeps objects on the local filesystem (dev, CI, benchmarks)
+    if settings.use_local_storage:
+        from app.services.local_storage import get_local_s3_client
+        return get_local_s3_client()
+
+    from app.core.aws import s3_client
+
+    # For local development, fall back to local storage if the real client can't be created
+    if settings.is_development:
+        try:
+            return s3_client()
+        except Exception as e:
+            logger.error(f"Failed to initialize S3 client: {str(e)}")
+            logger.info("Falling back to local S3 storage for local development")
+            from app.services.local_storage import get_local_s3_client
+            return get_local_s3_client()
+
+    # For production, use the real client
+    return s3_client()
@@ -0,0 +1,114 @@
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+import time
+
+from app.core.config import get_settings
+
+# Photo lists kept in memory per worker (0 disables the cache)
+PHOTO_LIST_CACHE_SIZE = get_settings().PHOTO_LIST_CACHE_SIZE
+
+# How long a list whose metadata index is still being built is served before
+# DynamoDB is read again to pick the index up
+PENDING_META_RECHECK_SECONDS = 5
+
+# States of a cached list's metadata index: loaded (META_READY), being built
+# (META_PENDING), never coming (META_ABSENT: failed, disabled or a session
+# from before the index) or not read yet (META_UNKNOWN)
+META_READY = "ready"
+META_PENDING = "pending"
+META_ABSENT = "absent"
+META_UNKNOWN = "unknown"
+
+
+class CachedPhotos:
+    __slots__ = ("photos", "meta", "meta_state", "bursts", "stored_at")
+
+    def __init__(self, photos: List[str], meta: Optional[list], meta_state: str):
+        self.photos = photos
+        self.meta = meta
+        self.meta_state = meta_state
+        # Burst grouping of the photos, filled in on first use
+        self.bursts: Optional[List[List[int]]] = None
+        self.stored_at = time.monotonic()
+
+
+class PhotoListCache:
+    """
+    LRU of session photo lists keyed by (session_id, photo_version).
+
+    A session's photo_urls never change without photo_version changing, and
+    tokens carry the version they were issued for (the `pv` claim). So a hit
+    for the token's (sub, pv) is authoritative and needs no DynamoDB read.
+    The session's metadata index is kept alongside, with its state.
+    """
+
+    def __init__(self, max_size: int = PHOTO_LIST_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[Tuple[str, int], CachedPhotos]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, session_id: str, version: Optional[int]) -> Optional[CachedPhotos]:
+        if version is None:
+            self.misses += 1
+            return None
+        entry = self._entries.get((session_id, version))
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end((session_id, version))
+        self.hits += 1
+        return entry
+
+    def get(self, session_id: str, version: Optional[int]) -> Optional[List[str]]:
+        entry = self._lookup(session_id, version)
+        return entry.photos if entry is not None else None
+
+    def get_with_meta(self, session_id: str, version: Optional[int]) -> Optional[CachedPhotos]:
+        """
+        Photos and metadata index of a session. Entries whose index wasn't
+        read yet are misses, and so are those whose index is being built
+        once they are PENDING_META_RECHECK_SECONDS old; an absent index is final.
+        """
+        entry = self._lookup(session_id, version)
+        if entry is None:
+            return None
+        if entry.meta_state == META_UNKNOWN or (
+                entry.meta_state == META_PENDING
+                and time.monotonic() - entry.stored_at > PENDING_META_RECHECK_SECONDS):
+            self.hits -= 1
+            self.misses += 1
+            return None
+        return entry
+
+    def peek(self, session_id: str, version: Optional[int]) -> Optional[CachedPhotos]:
+        """The cached entry even if it went stale, e.g. while DynamoDB can't be reached"""
+        if version is None:
+            return None
+        return self._entries.get((session_id, version))
+
+    def put(self, session_id: str, version: Optional[int], photos: List[str], meta: Optional[list] = None,
+            meta_state: Optional[str] = None):
+        """Cache a list; meta_state defaults to META_READY with `meta`, else META_UNKNOWN"""
+        if version is None or self.max_size <= 0:
+            return
+        if meta_state is None:
+            meta_state = META_READY if meta is not None else META_UNKNOWN
+        self._entries[(session_id, version)] = CachedPhotos(list(photos), meta, meta_state)
+        self._entries.move_to_end((session_id, version))
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def set_meta(self, session_id: str, version: Optional[int], meta: Optional[list]):
+        """Attach a freshly written index to a cached list, if it's cached (None: it failed)"""
+        entry = self._entries.get((session_id, version))
+        if entry is not None:
+            entry.meta = meta
+            entry.meta_state = META_READY if meta is not None else META_ABSENT
+            entry.bursts = None
+
+    def invalidate(self, session_id: str, version: Optional[int]):
+        self._entries.pop((session_id, version), None)
+
+
+photo_list_cache = PhotoListCache()
@@ -0,0 +1,96 @@
+"""
+Creating viewing sessions, shared by POST /session/create and the ingest tool.
+"""
+from datetime import datetime
+from typing import List, Optional
+import logging
+import uuid
+
+from app.core.config import get_settings
+from app.models.session import SessionResponse
+from app.services.password_hasher import password_hasher
+from app.services.photo_meta import index_session_photos, indexes_photos
+from app.services.dynamodb import expiry_shard
+from app.services.progress import progress_hub, ChannelLimitReached
+from app.services.s3 import get_s3_client, BUCKET_NAME
+from app.services.session_cache import photo_list_cache
+from app.utils.password import generate_random_password
+
+logger = logging.getLogger(__name__)
+
+# Sessions expire after this many days (expires_at). The sweeper
+# (app.services.sweeper) then removes their S3 objects and items; DynamoDB TTL
+# (purge_at) only catches what it missed, SESSION_PURGE_GRACE_DAYS later.
+SESSION_TTL_DAYS = get_settings().SESSION_TTL_DAYS
+SESSION_PURGE_GRACE_DAYS = get_settings().SESSION_PURGE_GRACE_DAYS
+
+# Base URL for session links
+# For local testing, default to localhost
+BASE_URL = get_settings().frontend_url
+
+
+async def create_photo_session(table, event_id: str, photo_urls: List[str],
+                               batch_id: Optional[str] = None) -> SessionResponse:
+    """
+    Store a new password-protected session for `photo_urls` and start
+    indexing its photos. Raises HasherBusy when the hashing pool is full and
+    ClientError when DynamoDB rejects the write.
+    """
+    # Generate a unique session ID
+    session_id = str(uuid.uuid4())
+
+    # Generate a random password
+    password = generate_random_password(6)
+
+    # Hash the password for storage (bcrypt runs on the hashing pool)
+    hashed_password = await password_hasher.hash(password)
+
+    # Create the session link
+    session_link = f"{BASE_URL}/session/{session_id}"
+
+    # Store session data in DynamoDB
+    created_at = int(datetime.now().timestamp())
+    expires_at = created_at + SESSION_TTL_DAYS * 24 * 60 * 60
+    purge_at = expires_at + SESSION_PURGE_GRACE_DAYS * 24 * 60 * 60
+    item = {
+        'session_id': session_id,
+        'event_id': event_id,
+        'hashed_password': hashed_password,
+        'photo_urls': photo_urls,
+        'created_at': created_at,
+        # Summary attributes projected into the event index
+        'photo_count': len(photo_urls),
+        'selection_count': 0,
+        'last_activity': created_at,
+        'expires_at': expires_at,
+        'purge_at': purge_at,
+        # Puts the session in the sweeper's expiry index
+        'expiry_shard': expiry_shard(session_id),
+        # Bumped whenever photo_urls changes; tokens carry it as the `pv` claim
+        'photo_version': 1
+    }
+    if indexes_photos(photo_urls):
+        item['photo_index'] = 'pending'
+    table.put_item(Item=item)
+
+    logger.info(f"Successfully created session with ID: {session_id}")
+
+    # Holders of the session's token can follow its indexing at /progress/{session_id}
+    try:
+        progress_hub.open_channel(session_id)
+    except ChannelLimitReached:
+        logger.info(f"No progress channel for session {session_id}: too many open")
+
+    # Size, orientation and capture time of each photo, so galleries can be
+    # laid out and sorted without downloading them
+    index_session_photos(
+        get_s3_client, table, BUCKET_NAME, session_id, photo_urls, version=1, purge_at=purge_at,
+        on_indexed=lambda meta: photo_list_cache.set_meta(session_id, 1, meta),
+        progress_channels=[channel for channel in (session_id, batch_id) if channel]
+    )
+
+    return SessionResponse(
+        session_id=session_id,
+        session_link=session_link,
+        password=password
+    )
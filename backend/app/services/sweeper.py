@@ -0,0 +1,370 @@
+"""
+Background cleanup of expired sessions.
+
+DynamoDB TTL removes expired session items on its own, but nothing removes the
+photos under their `event_id/...` prefixes or the multipart uploads that were
+started and never completed. The sweeper does both:
+
+1. Finds sessions whose expires_at has passed, by querying the sparse expiry
+   index (app.services.dynamodb.EXPIRY_INDEX_NAME), never scanning the table.
+2. Deletes every object under the prefixes their photos live in, 1000 keys per
+   delete_objects call, skipping prefixes still referenced by a live session.
+3. Deletes the session items. TTL uses purge_at, SESSION_PURGE_GRACE_DAYS after
+   expires_at, so it never removes an item before the sweeper has seen it.
+4. Aborts multipart uploads older than SWEEPER_MULTIPART_MAX_AGE_HOURS.
+
+Every AWS call goes through a simple rate limiter so a large sweep never eats
+into the capacity the API needs. An event whose cleanup fails is counted and
+retried on the next sweep. With dry_run=True nothing is deleted and the report
+lists what would have been.
+
+Run once from the command line (e.g. from cron):
+    python -m app.services.sweeper --dry-run
+or set SWEEPER_ENABLED=true to run it periodically inside the API process.
+Either way only the process holding SWEEPER_LOCK_FILE sweeps, so with several
+workers one of them does; with several hosts, enable it on one host only.
+"""
+import asyncio
+import fcntl
+import json
+import logging
+import time
+from dataclasses import dataclass, field, asdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Set
+
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.exceptions import BotoCoreError, ClientError
+
+from app.core.config import get_settings
+from app.services.dynamodb import EXPIRY_SHARDS
+from app.utils.s3 import object_key_from_url
+from app.services.photo_meta import index_key
+
+logger = logging.getLogger(__name__)
+
+DELETE_BATCH_SIZE = 1000  # delete_objects limit
+SAMPLE_SIZE = 100  # keys listed per category in a report
+
+SWEEPER_INTERVAL_SECONDS = get_settings().SWEEPER_INTERVAL_SECONDS
+SWEEPER_REQUESTS_PER_SECOND = get_settings().SWEEPER_REQUESTS_PER_SECOND
+SWEEPER_MULTIPART_MAX_AGE_HOURS = get_settings().SWEEPER_MULTIPART_MAX_AGE_HOURS
+SWEEPER_LOCK_FILE = get_settings().SWEEPER_LOCK_FILE
+
+
+@dataclass
+class SweepReport:
+    dry_run: bool
+    started_at: int
+    finished_at: Optional[int] = None
+    expired_sessions: int = 0
+    deleted_sessions: int = 0
+    failed_events: int = 0
+    prefixes: int = 0
+    skipped_prefixes: int = 0
+    deleted_objects: int = 0
+    aborted_uploads: int = 0
+    errors: List[str] = field(default_factory=list)
+    sample_sessions: List[str] = field(default_factory=list)
+    sample_objects: List[str] = field(default_factory=list)
+    sample_uploads: List[str] = field(default_factory=list)
+
+    def note(self, samples: List[str], value: str):
+        if len(samples) < SAMPLE_SIZE:
+            samples.append(value)
+
+
+class RateLimiter:
+    """Spaces out calls so at most `rate` start per second"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+
+    async def wait(self):
+        now = time.monotonic()
+        if self._next > now:
+            await asyncio.sleep(self._next - now)
+            now = self._next
+        self._next = now + self.interval
+
+
+def prefix_of(key: str) -> Optional[str]:
+    """`event_id/upload_id/file.jpg` -> `event_id/upload_id/`"""
+    parts = key.split("/")
+    if len(parts) < 3:
+        return None
+    return "/".join(parts[:2]) + "/"
+
+
+class SessionSweeper:
+    def __init__(
+        self,
+        s3_client,
+        dynamodb,
+        bucket: str,
+        table_name: str,
+        event_index_name: str,
+        expiry_index_name: str,
+        dry_run: bool = False,
+        requests_per_second: float = SWEEPER_REQUESTS_PER_SECOND,
+        multipart_max_age: timedelta = timedelta(hours=SWEEPER_MULTIPART_MAX_AGE_HOURS),
+    ):
+        self.s3 = s3_client
+        self.table = dynamodb.Table(table_name)
+        self.bucket = bucket
+        self.event_index_name = event_index_name
+        self.expiry_index_name = expiry_index_name
+        self.dry_run = dry_run
+        self.limiter = RateLimiter(requests_per_second)
+        self.multipart_max_age = multipart_max_age
+
+    async def _call(self, fn, **kwargs):
+        await self.limiter.wait()
+        return await asyncio.to_thread(fn, **kwargs)
+
+    async def sweep(self) -> SweepReport:
+        now = int(datetime.now(timezone.utc).timestamp())
+        report = SweepReport(dry_run=self.dry_run, started_at=now)
+
+        try:
+            expired = await self._expired_sessions(now)
+            report.expired_sessions = len(expired)
+
+            by_event: Dict[str, List[dict]] = {}
+            for session in expired:
+                by_event.setdefault(session.get("event_id", ""), []).append(session)
+
+            for event_id, sessions in by_event.items():
+                try:
+                    await self._sweep_event(event_id, sessions, now, report)
+                except (ClientError, BotoCoreError) as e:
+                    # The sessions stay expired, so the next sweep tries again
+                    logger.error(f"Sweeper error on event {event_id}: {str(e)}")
+                    report.failed_events += 1
+                    report.errors.append(f"event {event_id}: {str(e)}")
+        except ClientError as e:
+            logger.error(f"Sweeper DynamoDB error: {str(e)}")
+            report.errors.append(f"sessions: {str(e)}")
+
+        try:
+            await self._abort_stale_uploads(report)
+        except ClientError as e:
+            logger.error(f"Sweeper multipart error: {str(e)}")
+            report.errors.append(f"multipart: {str(e)}")
+
+        report.finished_at = int(datetime.now(timezone.utc).timestamp())
+        logger.info(
+            f"Sweep finished (dry_run={self.dry_run}): {report.expired_sessions} expired sessions, "
+            f"{report.deleted_objects} objects, {report.aborted_uploads} multipart uploads, "
+            f"{report.failed_events} failed events"
+        )
+        return report
+
+    async def _expired_sessions(self, now: int) -> List[dict]:
+        """Sessions past expires_at, read from each shard of the expiry index"""
+        sessions = []
+        for shard in range(EXPIRY_SHARDS):
+            query_args = {
+                "IndexName": self.expiry_index_name,
+                "KeyConditionExpression": Key("expiry_shard").eq(shard) & Key("expires_at").lt(now),
+                "ProjectionExpression": "session_id, event_id, photo_urls, expires_at, photo_version, photo_index_chunks",
+            }
+            while True:
+                response = await self._call(self.table.query, **query_args)
+                sessions.extend(response.get("Items", []))
+                if "LastEvaluatedKey" not in response:
+                    break
+                query_args["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+        return sessions
+
+    async def _live_prefixes(self, event_id: str, expired_ids: Set[str]) -> Set[str]:
+        """Prefixes referenced by sessions of this event that have not expired"""
+        query_args = {
+            "IndexName": self.event_index_name,
+            "KeyConditionExpression": Key("event_id").eq(event_id),
+        }
+        live_ids = []
+        while True:
+            response = await self._call(self.table.query, **query_args)
+            live_ids.extend(
+                item["session_id"] for item in response.get("Items", [])
+                if item["session_id"] not in expired_ids
+            )
+            if "LastEvaluatedKey" not in response:
+                break
+            query_args["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+        prefixes = set()
+        for session_id in live_ids:
+            response = await self._call(
+                self.table.get_item,
+                Key={"session_id": session_id},
+                ProjectionExpression="photo_urls",
+            )
+            for url in response.get("Item", {}).get("photo_urls", []):
+                key = object_key_from_url(url, self.bucket)
+                if key and prefix_of(key):
+                    prefixes.add(prefix_of(key))
+        return prefixes
+
+    async def _sweep_event(self, event_id: str, sessions: List[dict], now: int, report: SweepReport):
+        prefixes = set()
+        for session in sessions:
+            report.note(report.sample_sessions, session["session_id"])
+            for url in session.get("photo_urls", []):
+                key = object_key_from_url(url, self.bucket)
+                if key and key.startswith(f"{event_id}/") and prefix_of(key):
+                    prefixes.add(prefix_of(key))
+
+        if event_id:
+            live = await self._live_prefixes(event_id, {s["session_id"] for s in sessions})
+            report.skipped_prefixes += len(prefixes & live)
+            prefixes -= live
+
+        report.prefixes += len(prefixes)
+        for prefix in sorted(prefixes):
+            await self._delete_prefix(prefix, report)
+
+        for session in sessions:
+            if self.dry_run:
+                continue
+            try:
+                await self._call(
+                    self.table.delete_item,
+                    Key={"session_id": session["session_id"]},
+                    ConditionExpression=Attr("expires_at").lt(now),
+                )
+                report.deleted_sessions += 1
+            except ClientError as e:
+                if e.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+                    raise
+                # Extended while we were sweeping; leave it alone
+                continue
+            # Its photo metadata index (purge_at would catch these later)
+            for chunk in range(int(session.get("photo_index_chunks", 0))):
+                await self._call(
+                    self.table.delete_item,
+                    Key={"session_id": index_key(session["session_id"], session.get("photo_version"), chunk)},
+                )
+
+    async def _delete_prefix(self, prefix: str, report: SweepReport):
+        list_args = {"Bucket": self.bucket, "Prefix": prefix, "MaxKeys": DELETE_BATCH_SIZE}
+        while True:
+            response = await self._call(self.s3.list_objects_v2, **list_args)
+            keys = [obj["Key"] for obj in response.get("Contents", [])]
+            for key in keys:
+                report.note(report.sample_objects, key)
+
+            if keys and not self.dry_run:
+                result = await self._call(
+                    self.s3.delete_objects,
+                    Bucket=self.bucket,
+                    Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True},
+                )
+                errors = result.get("Errors", [])
+                for error in errors:
+                    report.errors.append(f"{error.get('Key')}: {error.get('Code')}")
+                report.deleted_objects += len(keys) - len(errors)
+            else:
+                report.deleted_objects += len(keys)
+
+            if not response.get("IsTruncated"):
+                return
+            list_args["ContinuationToken"] = response["NextContinuationToken"]
+
+    async def _abort_stale_uploads(self, report: SweepReport):
+        cutoff = datetime.now(timezone.utc) - self.multipart_max_age
+        list_args = {"Bucket": self.bucket}
+        while True:
+            response = await self._call(self.s3.list_multipart_uploads, **list_args)
+            for upload in response.get("Uploads", []):
+                if upload["Initiated"] >= cutoff:
+                    continue
+                report.note(report.sample_uploads, upload["Key"])
+                if not self.dry_run:
+                    try:
+                        await self._call(
+                            self.s3.abort_multipart_upload,
+                            Bucket=self.bucket,
+                            Key=upload["Key"],
+                            UploadId=upload["UploadId"],
+                        )
+                    except ClientError as e:
+                        report.errors.append(f"{upload['Key']}: {str(e)}")
+                        continue
+                report.aborted_uploads += 1
+
+            if not response.get("IsTruncated"):
+                return
+            list_args["KeyMarker"] = response["NextKeyMarker"]
+            list_args["UploadIdMarker"] = response["NextUploadIdMarker"]
+
+
+def build_sweeper(dry_run: bool = False) -> SessionSweeper:
+    """Create a sweeper wired to the same clients and tables the API uses"""
+    from app.services.s3 import get_s3_client, BUCKET_NAME
+    from app.services.dynamodb import get_dynamodb_client, TABLE_NAME, EVENT_INDEX_NAME, EXPIRY_INDEX_NAME
+
+    return SessionSweeper(
+        s3_client=get_s3_client(),
+        dynamodb=get_dynamodb_client(),
+        bucket=BUCKET_NAME,
+        table_name=TABLE_NAME,
+        event_index_name=EVENT_INDEX_NAME,
+        expiry_index_name=EXPIRY_INDEX_NAME,
+        dry_run=dry_run,
+    )
+
+
+def acquire_sweeper_lock(path: str = SWEEPER_LOCK_FILE):
+    """
+    Lock `path` for this process, or return None when another process on
+    this host holds it. The lock lasts as long as the returned file is open.
+    """
+    lock_file = open(path, "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+async def run_periodically(interval: int = SWEEPER_INTERVAL_SECONDS, dry_run: bool = False):
+    """
+    Sweep forever, sleeping `interval` seconds between runs. Every API worker
+    starts this, but only the one holding the sweeper lock sweeps; the others
+    take over if it exits.
+    """
+    sweeper = build_sweeper(dry_run=dry_run)
+    lock_file = None
+    try:
+        while True:
+            if lock_file is None:
+                lock_file = acquire_sweeper_lock()
+            if lock_file is not None:
+                try:
+                    await sweeper.sweep()
+                except Exception as e:
+                    logger.error(f"Sweep failed: {str(e)}")
+            await asyncio.sleep(interval)
+    finally:
+        if lock_file is not None:
+            lock_file.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Delete expired sessions, their photos and stale multipart uploads")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would be deleted without deleting")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    lock = acquire_sweeper_lock()
+    if lock is None:
+        raise SystemExit(f"Another sweep is running on this host ({SWEEPER_LOCK_FILE})")
+    with lock:
+        result = asyncio.run(build_sweeper(dry_run=args.dry_run).sweep())
+    print(json.dumps(asdict(result), indent=2))
@@ -0,0 +1,157 @@
+"""
+ZIP archives written as a stream.
+
+Entries are stored, not compressed (photos already are), and each one is
+followed by a data descriptor carrying its CRC-32 and size, so an entry can be
+written while its data is still arriving and nothing is buffered. ZIP64
+records are used once a size, an offset or the number of entries no longer
+fits the classic format.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import AsyncIterable, AsyncIterator, List, Optional
+import struct
+import zlib
+
+LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+END_OF_CENTRAL_DIRECTORY = struct.Struct("<IHHHHIIH")
+ZIP64_END_OF_CENTRAL_DIRECTORY = struct.Struct("<IQHHIIQQQQ")
+ZIP64_LOCATOR = struct.Struct("<IIQI")
+
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP64_COUNT_LIMIT = 0xFFFF
+ZIP64_EXTRA_ID = 0x0001
+
+# General purpose flags: sizes and CRC follow the data; names are UTF-8
+FLAGS = 0x0008 | 0x0800
+VERSION = 20
+VERSION_ZIP64 = 45
+
+
+@dataclass
+class ZipFile:
+    """One file to add: its data arrives as an async iterable of chunks"""
+    name: str
+    modified: datetime
+    chunks: AsyncIterable[bytes]
+    size: Optional[int] = None  # known size, if any; picks the record format
+
+
+@dataclass
+class _Entry:
+    name: bytes
+    dos_time: int
+    dos_date: int
+    offset: int
+    zip64: bool
+    crc: int = 0
+    size: int = 0
+
+
+def _dos_datetime(moment: datetime):
+    if moment.year < 1980:
+        return 0, (1 << 5) | 1  # 1980-01-01
+    dos_time = (moment.hour << 11) | (moment.minute << 5) | (moment.second // 2)
+    dos_date = ((moment.year - 1980) << 9) | (moment.month << 5) | moment.day
+    return dos_time, dos_date
+
+
+class ZipWriter:
+    """Produces the bytes of a ZIP archive one entry at a time"""
+
+    def __init__(self):
+        self._offset = 0
+        self._entries: List[_Entry] = []
+        self._current: Optional[_Entry] = None
+
+    def _emit(self, data: bytes) -> bytes:
+        self._offset += len(data)
+        return data
+
+    def start_entry(self, name: str, modified: datetime, size: Optional[int] = None) -> bytes:
+        """Local file header for a new entry"""
+        dos_time, dos_date = _dos_datetime(modified)
+        # An unknown size might not fit 32 bits, so use ZIP64 for it too
+        zip64 = size is None or size >= ZIP64_LIMIT
+        entry = _Entry(name.encode("utf-8"), dos_time, dos_date, self._offset, zip64)
+        self._current = entry
+
+        extra = struct.pack("<HHQQ", ZIP64_EXTRA_ID, 16, 0, 0) if zip64 else b""
+        placeholder = ZIP64_LIMIT if zip64 else 0
+        header = LOCAL_HEADER.pack(
+            0x04034B50, VERSION_ZIP64 if zip64 else VERSION, FLAGS, 0,
+            dos_time, dos_date, 0, placeholder, placeholder, len(entry.name), len(extra)
+        )
+        return self._emit(header + entry.name + extra)
+
+    def write(self, chunk: bytes) -> bytes:
+        """Pass a chunk of the current entry's data through"""
+        entry = self._current
+        entry.crc = zlib.crc32(chunk, entry.crc)
+        entry.size += len(chunk)
+        return self._emit(chunk)
+
+    def end_entry(self) -> bytes:
+        """Data descriptor closing the current entry"""
+        entry, self._current = self._current, None
+        if not entry.zip64 and entry.size >= ZIP64_LIMIT:
+            raise ValueError(f"{entry.name!r} is larger than its declared size")
+        self._entries.append(entry)
+        size_format = "Q" if entry.zip64 else "I"
+        return self._emit(struct.pack(f"<II{size_format}{size_format}", 0x08074B50, entry.crc, entry.size, entry.size))
+
+    def close(self) -> bytes:
+        """Central directory and end records"""
+        directory_offset = self._offset
+        records = []
+        for entry in self._entries:
+            zip64_fields = []
+            size = entry.size
+            offset = entry.offset
+            if entry.zip64 or size >= ZIP64_LIMIT:
+                zip64_fields += [size, size]
+                size = ZIP64_LIMIT
+            if offset >= ZIP64_LIMIT:
+                zip64_fields.append(offset)
+                offset = ZIP64_LIMIT
+            extra = b""
+            if zip64_fields:
+                extra = struct.pack(f"<HH{len(zip64_fields)}Q", ZIP64_EXTRA_ID, 8 * len(zip64_fields), *zip64_fields)
+            version = VERSION_ZIP64 if zip64_fields else VERSION
+            records.append(CENTRAL_HEADER.pack(
+                0x02014B50, version, version, FLAGS, 0, entry.dos_time, entry.dos_date,
+                entry.crc, size, size, len(entry.name), len(extra), 0, 0, 0, 0, offset
+            ) + entry.name + extra)
+        directory = b"".join(records)
+        directory_size = len(directory)
+
+        count = len(self._entries)
+        needs_zip64 = (count >= ZIP64_COUNT_LIMIT or directory_size >= ZIP64_LIMIT
+                       or directory_offset >= ZIP64_LIMIT)
+        end = b""
+        if needs_zip64:
+            zip64_end_offset = directory_offset + directory_size
+            end += ZIP64_END_OF_CENTRAL_DIRECTORY.pack(
+                0x06064B50, ZIP64_END_OF_CENTRAL_DIRECTORY.size - 12, VERSION_ZIP64, VERSION_ZIP64,
+                0, 0, count, count, directory_size, directory_offset
+            )
+            end += ZIP64_LOCATOR.pack(0x07064B50, 0, zip64_end_offset, 1)
+        end += END_OF_CENTRAL_DIRECTORY.pack(
+            0x06054B50, 0, 0,
+            min(count, ZIP64_COUNT_LIMIT), min(count, ZIP64_COUNT_LIMIT),
+            min(directory_size, ZIP64_LIMIT), min(directory_offset, ZIP64_LIMIT), 0
+        )
+        return self._emit(directory + end)
+
+
+async def stream_zip(files: AsyncIterable[ZipFile]) -> AsyncIterator[bytes]:
+    """Yield a ZIP archive of `files`, holding no more than one chunk at a time"""
+    writer = ZipWriter()
+    async for file in files:
+        yield writer.start_entry(file.name, file.modified, file.size)
+        async for chunk in file.chunks:
+            if chunk:
+                yield writer.write(chunk)
+        yield writer.end_entry()
+    yield writer.close()
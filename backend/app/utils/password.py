@@ -1,62 +1,65 @@
 import bcrypt
+import hmac
 import random
 import string
 import logging
 
+from app.core.config import get_settings
+
 # Initialize logger
 logger = logging.getLogger(__name__)
 
+# bcrypt work factor for new hashes. Stored hashes with a different cost are
+# upgraded on the next successful login (see app.services.password_hasher).
+BCRYPT_ROUNDS = get_settings().BCRYPT_ROUNDS
+
 def generate_random_password(length=6):
     """Generate a random alphanumeric password of specified length"""
     characters = string.ascii_letters + string.digits
     return ''.join(random.choice(characters) for _ in range(length))
 
-def hash_password(password):
+def is_bcrypt_hash(hashed_password):
+    """True if the stored value is a bcrypt hash rather than a legacy plain text password"""
+    return hashed_password.startswith(("$2a$", "$2b$", "$2y$"))
+
+def bcrypt_rounds(hashed_password):
+    """The work factor a bcrypt hash was created with, e.g. 12 for `$2b$12$...`"""
+    return int(hashed_password.split("$")[2])
+
+def hash_password(password, rounds=None):
     """
     Hash a password using bcrypt.
 
-    This function takes a plain text password and returns its hashed version.
-    The process works as follows:
-    1. Encode the password to bytes (UTF-8)
-    2. Generate a random salt using bcrypt
-    3. Hash the password with the salt
-    4. Return the hash as a string
+    This is CPU heavy (~250 ms at 12 rounds) and blocks the calling thread.
+    Code running on the event loop should use
+    app.services.password_hasher.password_hasher.hash instead.
 
     Args:
         password (str): The plain text password to hash
+        rounds (int): bcrypt work factor, defaults to BCRYPT_ROUNDS
 
     Returns:
         str: The hashed password
     """
-    # Log the plain text password - NOTE: This is for demonstration only!
-    # SECURITY WARNING: Logging passwords is a serious security risk and should NEVER
-    # be done in production code. This is only for educational purposes.
-    logger.info(f"Plain text password to be hashed: {password}")
-
-    # HASHING PROCESS COMMENTED OUT
-    # # Encode the password to bytes
-    # password_bytes = password.encode('utf-8')
-    #
-    # # Generate a random salt
-    # salt = bcrypt.gensalt()
-    #
-    # # Hash the password with the salt
-    # hashed = bcrypt.hashpw(password_bytes, salt)
-    #
-    # # Convert the hashed password back to string and return
-    # return hashed.decode('utf-8')
-
-    # Temporarily returning plain password instead of hashed password
-    logger.info(f"IMPORTANT: Password hashing is disabled! Returning plain text password: {password}")
-    return password
+    # Encode the password to bytes
+    password_bytes = password.encode('utf-8')
+
+    # Generate a random salt with the configured work factor
+    salt = bcrypt.gensalt(rounds or BCRYPT_ROUNDS)
+
+    # Hash the password with the salt and convert it back to a string
+    return bcrypt.hashpw(password_bytes, salt).decode('utf-8')
 
 def verify_password(plain_password, hashed_password):
-    """Verify a password against its hash"""
-    # COMMENTED OUT BCRYPT VERIFICATION
-    # plain_password_bytes = plain_password.encode('utf-8')
-    # hashed_password_bytes = hashed_password.encode('utf-8')
-    # return bcrypt.checkpw(plain_password_bytes, hashed_password_bytes)
-
-    # Since password hashing is disabled, just compare plain text passwords
-    logger.info(f"IMPORTANT: Password verification using plain text comparison: comparing '{plain_password}' with '{hashed_password}'")
-    return plain_password == hashed_password
+    """
+    Verify a password against its hash.
+
+    Sessions created while hashing was disabled store the password in plain
+    text; those are compared in constant time and upgraded on login.
+    """
+    if not is_bcrypt_hash(hashed_password):
+        return hmac.compare_digest(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+
+    plain_password_bytes = plain_password.encode('utf-8')
+    hashed_password_bytes = hashed_password.encode('utf-8')
+    return bcrypt.checkpw(plain_password_bytes, hashed_password_bytes)
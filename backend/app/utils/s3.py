@@ -0,0 +1,32 @@
+from typing import Optional
+from urllib.parse import urlparse, unquote
+import re
+
+# The part of an S3 host after the bucket: s3, s3.<region>, s3-<region>, s3.dualstack.<region>
+S3_ENDPOINT_PATTERN = re.compile(r"s3(?:\.dualstack)?(?:[.-][a-z0-9-]+)?\.amazonaws\.com")
+
+
+def object_key_from_url(url: str, bucket: str, prefix: Optional[str] = None) -> Optional[str]:
+    """
+    Extract the object key from a virtual-hosted or path-style URL of `bucket`.
+    URLs on any other host or bucket, and keys outside `prefix` when given,
+    return None.
+    """
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https"):
+        return None
+    host = (parsed.hostname or "").lower()
+    path = unquote(parsed.path).lstrip("/")
+    if host.startswith(f"{bucket}.") and S3_ENDPOINT_PATTERN.fullmatch(host[len(bucket) + 1:]):
+        # Virtual-hosted style: bucket.s3.region.amazonaws.com/key
+        key = path
+    elif S3_ENDPOINT_PATTERN.fullmatch(host):
+        # Path style: s3.amazonaws.com/bucket/key
+        bucket_name, _, key = path.partition("/")
+        if bucket_name != bucket:
+            return None
+    else:
+        return None
+    if not key or (prefix is not None and not key.startswith(prefix)):
+        return None
+    return key
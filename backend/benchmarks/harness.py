@@ -0,0 +1,84 @@
+"""
+Shared setup for the benchmark scripts: runs the app in-process against the
+local S3/DynamoDB stand-ins, so numbers don't depend on network or AWS.
+"""
+from contextlib import asynccontextmanager
+from typing import Dict, List, Sequence
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+
+BASE_URL = "http://bench"
+
+
+def configure_local_env(storage_dir: str = None, log_level: str = "WARNING"):
+    """Point the app at local storage. Must run before `app.main` is imported."""
+    storage_dir = storage_dir or tempfile.mkdtemp(prefix="photoshare-bench-")
+    os.environ["STORAGE_BACKEND"] = "local"
+    os.environ["LOCAL_STORAGE_DIR"] = storage_dir
+    # Presigned URLs point back at the in-process app
+    os.environ["LOCAL_STORAGE_URL"] = BASE_URL
+    os.environ.setdefault("LOG_LEVEL", log_level)
+    os.environ.setdefault("JWT_SECRET_KEY", "benchmark-secret-not-for-production-use")
+    # The auth scenarios send far more attempts than a guest ever would
+    os.environ.setdefault("AUTH_SESSION_BURST", "1000000000")
+    os.environ.setdefault("AUTH_IP_BURST", "1000000000")
+    return storage_dir
+
+
+@asynccontextmanager
+async def app_client():
+    """An httpx client wired straight to the ASGI app, with startup/shutdown run"""
+    import httpx
+    from app.main import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url=BASE_URL, timeout=None) as client:
+            yield client
+
+
+def percentile(sorted_values: Sequence[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted sequence"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 0.50) * 1000, 3),
+        "p90_ms": round(percentile(values, 0.90) * 1000, 3),
+        "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3) if values else 0.0,
+        "mean_ms": round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+    }
+
+
+def peak_rss_mb() -> float:
+    """High-water mark of this process's resident memory"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def run_metadata() -> Dict[str, str]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = "unknown"
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
@@ -0,0 +1,261 @@
+"""
+Load generator replaying the Flutter clients against a running backend.
+
+Photographers follow lib/services/upload_service.dart: one multipart init for
+all their files, then files in batches of MAX_PARALLEL_UPLOADS, each uploaded
+part by part (fetch the part URL, PUT the chunk), completed, and finally a
+session/create with the uploaded URLs. Guests follow the session view: auth,
+photo list, every image through direct-access, then a selection.
+
+    cd backend
+    python -m benchmarks.loadgen --base-url http://localhost:8000 -p 5 -g 50
+    python -m benchmarks.loadgen --in-process -p 3 -g 20 --duration 60 -o load.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+from collections import defaultdict
+from typing import Dict, List
+
+from benchmarks.harness import summarize
+
+# Mirrors UploadService in lib/services/upload_service.dart
+CHUNK_SIZE = 50 * 1024 * 1024
+MAX_PARALLEL_UPLOADS = 3
+
+STAGES = [
+    "multipart-init", "part-url", "part-put", "complete", "session-create", "photographer-total",
+    "auth", "photos", "gallery-image", "select", "guest-total",
+]
+
+
+class StageFailed(Exception):
+    pass
+
+
+class Stats:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    async def timed(self, stage: str, request, expected=(200,)):
+        """Await `request`, recording its latency, or its failure reason"""
+        start = time.perf_counter()
+        try:
+            response = await request
+        except Exception as e:
+            self.errors[stage][type(e).__name__] += 1
+            raise StageFailed(f"{stage}: {type(e).__name__}") from e
+        if response.status_code not in expected:
+            self.errors[stage][str(response.status_code)] += 1
+            raise StageFailed(f"{stage}: HTTP {response.status_code}")
+        self.latencies[stage].append(time.perf_counter() - start)
+        return response
+
+    def report(self, elapsed: float) -> Dict:
+        stages = {}
+        for stage in STAGES + sorted(set(self.latencies) - set(STAGES)):
+            ok = len(self.latencies.get(stage, []))
+            failed = sum(self.errors.get(stage, {}).values())
+            if not ok and not failed:
+                continue
+            result = summarize(self.latencies.get(stage, []))
+            result.update(
+                errors=failed,
+                error_rate=round(failed / (ok + failed), 4),
+                rate_per_s=round(ok / elapsed, 2) if elapsed else 0.0,
+            )
+            if failed:
+                result["error_reasons"] = dict(self.errors[stage])
+            stages[stage] = result
+        return stages
+
+
+class LoadTest:
+    def __init__(self, args, client, stats: Stats):
+        self.args = args
+        self.client = client
+        self.stats = stats
+        self.sessions: List[Dict] = []
+        self.session_ready = asyncio.Event()
+        self.photographers_done = False
+        self.deadline = time.monotonic() + args.duration
+
+    async def upload_file(self, event_id: str, file_name: str, data: bytes, config: Dict):
+        """UploadService._uploadFileInChunks: parts one after another, then complete"""
+        chunk_size = self.args.chunk_size
+        parts = []
+        for part_number in range(1, -(-len(data) // chunk_size) + 1):
+            response = await self.stats.timed("part-url", self.client.post("/api/v1/get-presigned-upload-part-url", json={
+                "event_id": event_id, "file_name": file_name,
+                "upload_id": config["upload_id"], "part_number": part_number,
+            }))
+            chunk = data[(part_number - 1) * chunk_size:part_number * chunk_size]
+            uploaded = await self.stats.timed("part-put", self.client.put(
+                response.json()["presigned_url"], content=chunk,
+                headers={"Content-Type": "application/octet-stream"}
+            ))
+            parts.append({"PartNumber": part_number, "ETag": uploaded.headers.get("etag", "").replace('"', "")})
+        await self.stats.timed("complete", self.client.post("/api/v1/complete-multipart-upload", json={
+            "event_id": event_id, "file_name": file_name, "upload_id": config["upload_id"], "parts": parts,
+        }))
+        return config["file_url"]
+
+    async def photographer_workflow(self, photographer: int):
+        """UploadService.uploadImagesWithPresignedUrls followed by createSession"""
+        event_id = f"load-{photographer}-{uuid.uuid4().hex[:8]}"
+        files = {f"IMG_{i:04d}.jpg": os.urandom(self.args.photo_size) for i in range(self.args.photos)}
+        start = time.perf_counter()
+        try:
+            response = await self.stats.timed("multipart-init", self.client.post(
+                "/api/v1/generate-multipart-upload-urls", json={"event_id": event_id, "file_names": list(files)}
+            ))
+            configs = response.json()["upload_configs"]
+            urls = []
+            # The client starts MAX_PARALLEL_UPLOADS files and waits for all of them before the next batch
+            work = list(zip(files.items(), configs))
+            for i in range(0, len(work), self.args.parallel_uploads):
+                urls += await asyncio.gather(*(
+                    self.upload_file(event_id, name, data, config)
+                    for (name, data), config in work[i:i + self.args.parallel_uploads]
+                ))
+            response = await self.stats.timed("session-create", self.client.post(
+                "/api/v1/session/create", json={"event_id": event_id, "photo_urls": urls}
+            ))
+        except StageFailed:
+            self.stats.errors["photographer-total"]["aborted"] += 1
+            return
+        self.stats.latencies["photographer-total"].append(time.perf_counter() - start)
+        session = response.json()
+        self.sessions.append({"session_id": session["session_id"], "password": session["password"]})
+        self.session_ready.set()
+
+    async def photographer(self, photographer: int):
+        while True:
+            await self.photographer_workflow(photographer)
+            if time.monotonic() >= self.deadline:
+                return
+
+    async def guest_visit(self):
+        session = random.choice(self.sessions)
+        session_id = session["session_id"]
+        start = time.perf_counter()
+        try:
+            response = await self.stats.timed("auth", self.client.post(
+                f"/api/v1/session/{session_id}/auth", json={"password": session["password"]}
+            ))
+            headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+            response = await self.stats.timed("photos", self.client.get(
+                f"/api/v1/session/{session_id}/photos", headers=headers
+            ))
+            photos = response.json()["photos"]
+
+            # Gallery tiles load in parallel, a handful at a time like a browser
+            gate = asyncio.Semaphore(self.args.gallery_concurrency)
+
+            async def load(url):
+                async with gate:
+                    await self.stats.timed("gallery-image", self.client.get(
+                        "/api/v1/direct-access", params={"url": url}
+                    ))
+
+            await asyncio.gather(*(load(url) for url in photos))
+            await asyncio.sleep(self.args.think_time * random.random())
+            picked = random.sample(photos, k=max(1, len(photos) // 3)) if photos else []
+            await self.stats.timed("select", self.client.post(
+                f"/api/v1/session/{session_id}/select", headers=headers, json={"photos": picked}
+            ))
+        except StageFailed:
+            self.stats.errors["guest-total"]["aborted"] += 1
+            return
+        self.stats.latencies["guest-total"].append(time.perf_counter() - start)
+
+    async def guest(self):
+        await self.session_ready.wait()
+        while True:
+            await self.guest_visit()
+            if self.photographers_done and time.monotonic() >= self.deadline:
+                return
+
+    async def run(self):
+        guests = [asyncio.create_task(self.guest()) for _ in range(self.args.guests)]
+        await asyncio.gather(*(self.photographer(p) for p in range(self.args.photographers)))
+        self.photographers_done = True
+        if not self.sessions:
+            # Nothing for guests to browse
+            for task in guests:
+                task.cancel()
+            await asyncio.gather(*guests, return_exceptions=True)
+            return
+        await asyncio.gather(*guests)
+
+
+def print_report(stages: Dict):
+    print(f"{'stage':<20}{'ok':>8}{'errors':>8}{'err%':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for stage, r in stages.items():
+        print(f"{stage:<20}{r['count']:>8}{r['errors']:>8}{r['error_rate'] * 100:>7.1f}%"
+              f"{r['p50_ms']:>10.1f}{r['p99_ms']:>10.1f}{r['max_ms']:>10.1f}")
+        for reason, count in r.get("error_reasons", {}).items():
+            print(f"{'':<20}  {reason}: {count}")
+
+
+async def main_async(args):
+    import httpx
+
+    stats = Stats()
+    limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+    started = time.perf_counter()
+    if args.in_process:
+        from benchmarks.harness import app_client
+        async with app_client() as client:
+            await LoadTest(args, client, stats).run()
+    else:
+        async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+            await LoadTest(args, client, stats).run()
+    return stats.report(time.perf_counter() - started), time.perf_counter() - started
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Replay photographer and guest workflows against the API")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--in-process", action="store_true",
+                        help="run the app in this process on local storage instead of calling --base-url")
+    parser.add_argument("-p", "--photographers", type=int, default=2)
+    parser.add_argument("-g", "--guests", type=int, default=10)
+    parser.add_argument("--photos", type=int, default=6, help="photos per photographer upload")
+    parser.add_argument("--photo-size", type=int, default=3 * 1024 * 1024, help="bytes per photo")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="multipart part size")
+    parser.add_argument("--parallel-uploads", type=int, default=MAX_PARALLEL_UPLOADS)
+    parser.add_argument("--gallery-concurrency", type=int, default=6, help="images a guest loads at once")
+    parser.add_argument("--think-time", type=float, default=2.0, help="max seconds a guest browses before selecting")
+    parser.add_argument("--duration", type=float, default=0,
+                        help="keep repeating workflows for this many seconds (default: one round)")
+    parser.add_argument("--max-connections", type=int, default=200)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("-o", "--output", help="write the report as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.in_process:
+        from benchmarks.harness import configure_local_env
+        configure_local_env()
+
+    stages, elapsed = asyncio.run(main_async(args))
+    print(f"Ran {args.photographers} photographers and {args.guests} guests for {elapsed:.1f}s\n")
+    print_report(stages)
+
+    if args.output:
+        settings = {k: v for k, v in vars(args).items() if k != "output"}
+        with open(args.output, "w") as f:
+            json.dump({"settings": settings, "elapsed_s": round(elapsed, 2), "stages": stages}, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
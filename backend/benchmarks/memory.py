@@ -0,0 +1,298 @@
+"""
+Peak-memory budgets for the upload and download paths.
+
+Pushes large synthetic files through each path with tracemalloc running and
+fails when the extra memory allocated while handling the request exceeds a
+multiple of the streaming chunk size (STREAM_CHUNK_SIZE). proxy-upload takes
+its file as base64 inside a JSON body, so it can't stream: its budget is a
+multiple of the encoded payload instead. session-download may also hold one
+chunk per photo it opens ahead (DOWNLOAD_PREFETCH).
+
+Requests are fed to the ASGI app in small body messages and responses are
+drained without being kept, so the harness itself stays out of the numbers.
+A uvicorn server on a local port receives the presigned PUTs proxy-upload makes.
+
+    cd backend
+    python -m benchmarks.memory                     # 64 MiB files, exits 1 over budget
+    python -m benchmarks.memory --size-mb 256 --budget-chunks 6 -o memory.json
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from typing import Dict, Iterator, List, Tuple
+
+from benchmarks.harness import configure_local_env, peak_rss_mb
+
+MIB = 1024 * 1024
+BODY_MESSAGE_SIZE = 64 * 1024
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(app, port: int):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="memory-harness-server", daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if time.monotonic() > deadline:
+            sys.exit("uvicorn did not start")
+        time.sleep(0.05)
+    return server, thread
+
+
+def repeated(block: bytes, size: int) -> Iterator[bytes]:
+    """`size` bytes as messages reusing one block, so nothing new is allocated"""
+    while size > 0:
+        yield block if size >= len(block) else block[:size]
+        size -= len(block)
+
+
+def multipart_body(boundary: str, fields: Dict[str, str], files: List[Tuple[str, str, int]],
+                   block: bytes) -> Iterator[bytes]:
+    for name, value in fields.items():
+        yield (f"--{boundary}\r\nContent-Disposition: form-data; name=\"{name}\"\r\n\r\n{value}\r\n").encode()
+    for field, filename, size in files:
+        yield (f"--{boundary}\r\nContent-Disposition: form-data; name=\"{field}\"; filename=\"{filename}\"\r\n"
+               f"Content-Type: image/jpeg\r\n\r\n").encode()
+        yield from repeated(block, size)
+        yield b"\r\n"
+    yield f"--{boundary}--\r\n".encode()
+
+
+async def asgi_request(app, method: str, path: str, query: str = "", headers: List[Tuple[str, str]] = (),
+                       body: Iterator[bytes] = ()) -> Tuple[int, int]:
+    """Call the app directly; returns (status, response bytes) without keeping the body"""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": method, "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": query.encode(), "root_path": "",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in headers] + [(b"host", b"memory-harness")],
+        "client": ("127.0.0.1", 50000), "server": ("memory-harness", 80),
+    }
+    chunks = iter(body)
+    pending = next(chunks, None)
+    body_sent = False
+    response_done = asyncio.Event()
+    response = {"status": 0, "bytes": 0}
+
+    async def receive():
+        nonlocal pending, body_sent
+        if body_sent:
+            # Like a server: nothing more until the client goes away
+            await response_done.wait()
+            return {"type": "http.disconnect"}
+        chunk, pending = pending or b"", next(chunks, None)
+        body_sent = pending is None
+        return {"type": "http.request", "body": chunk, "more_body": not body_sent}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            response["bytes"] += len(message.get("body", b""))
+            if not message.get("more_body", False):
+                response_done.set()
+
+    await app(scope, receive, send)
+    return response["status"], response["bytes"]
+
+
+async def measure(name: str, request, budget: int) -> Dict:
+    tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    status, response_bytes = await request()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    result = {
+        "status": status,
+        "response_bytes": response_bytes,
+        "peak_mib": round(peak / MIB, 2),
+        "budget_mib": round(budget / MIB, 2),
+        "within_budget": status == 200 and peak <= budget,
+        "seconds": round(elapsed, 2),
+        "rss_high_water_mb": peak_rss_mb(),
+    }
+    verdict = "ok" if result["within_budget"] else ("FAILED" if status == 200 else f"HTTP {status}")
+    print(f"{name:<16} peak {result['peak_mib']:>8.2f} MiB  budget {result['budget_mib']:>8.2f} MiB  "
+          f"{elapsed:>6.2f}s  {verdict}")
+    return result
+
+
+async def run(args) -> Dict:
+    from app.api.uploads import STREAM_CHUNK_SIZE
+    from app.services.s3 import BUCKET_NAME
+    from app.core.config import get_settings
+    from app.main import app
+    from app.services.local_storage import get_local_s3_client
+
+    size = args.size_mb * MIB
+    chunk_budget = args.budget_chunks * STREAM_CHUNK_SIZE
+    block = os.urandom(BODY_MESSAGE_SIZE)
+    s3 = get_local_s3_client()
+    event_id = f"memory-{uuid.uuid4().hex[:8]}"
+    results = {}
+
+    def upload_form(files):
+        boundary = uuid.uuid4().hex
+        return (
+            [("content-type", f"multipart/form-data; boundary={boundary}")],
+            multipart_body(boundary, {"event_id": event_id}, files, block),
+        )
+
+    async def upload_single():
+        headers, body = upload_form([("file", "large.jpg", size)])
+        return await asgi_request(app, "POST", "/api/v1/upload-photo", headers=headers, body=body)
+
+    async def upload_multiple():
+        headers, body = upload_form([("files", f"large-{i}.jpg", size) for i in range(args.files)])
+        return await asgi_request(app, "POST", "/api/v1/upload-multiple-photos", headers=headers, body=body)
+
+    async def presigned_part():
+        upload = s3.create_multipart_upload(Bucket=BUCKET_NAME, Key=f"{event_id}/part.jpg")
+        query = f"uploadId={upload['UploadId']}&partNumber=1"
+        status = await asgi_request(
+            app, "PUT", f"/local-s3/{BUCKET_NAME}/{event_id}/part.jpg", query=query,
+            headers=[("content-length", str(size))], body=repeated(block, size)
+        )
+        s3.abort_multipart_upload(Bucket=BUCKET_NAME, Key=f"{event_id}/part.jpg", UploadId=upload["UploadId"])
+        return status
+
+    # Stored once, outside the measurement
+    download_key = f"{event_id}/download.jpg"
+    s3.upload_fileobj(_BlockReader(block, size), BUCKET_NAME, download_key)
+    download_url = f"https://{BUCKET_NAME}.s3.ap-south-1.amazonaws.com/{download_key}"
+
+    async def direct_access():
+        from urllib.parse import urlencode
+        return await asgi_request(app, "GET", "/api/v1/direct-access", query=urlencode({"url": download_url}))
+
+    wanted = set(args.only.split(",")) if args.only else None
+    download = None
+    if wanted is None or "session-download" in wanted:
+        # Session, photos and token are set up outside the measurement
+        download = await _download_session(app, s3, event_id, block, size, args.files)
+
+    async def session_download():
+        session_id, token = download
+        return await asgi_request(app, "GET", f"/api/v1/session/{session_id}/download",
+                                  query="include=all", headers=[("authorization", f"Bearer {token}")])
+
+    proxy_size = args.proxy_size_mb * MIB
+    presigned_url = s3.generate_presigned_url(
+        "put_object", Params={"Bucket": BUCKET_NAME, "Key": f"{event_id}/proxied.jpg", "ContentType": "image/jpeg"}
+    )
+    proxy_body = json.dumps({
+        "presigned_url": presigned_url,
+        "file_content": base64.b64encode(os.urandom(proxy_size)).decode(),
+    }).encode()
+
+    async def proxy_upload():
+        return await asgi_request(
+            app, "POST", "/api/v1/proxy-upload", headers=[("content-type", "application/json")],
+            body=(proxy_body[i:i + BODY_MESSAGE_SIZE] for i in range(0, len(proxy_body), BODY_MESSAGE_SIZE))
+        )
+
+    scenarios = [
+        ("upload-photo", upload_single, chunk_budget),
+        ("upload-multiple", upload_multiple, chunk_budget),
+        ("presigned-part", presigned_part, chunk_budget),
+        ("direct-access", direct_access, chunk_budget),
+        ("proxy-upload", proxy_upload, int(args.proxy_budget * len(proxy_body))),
+        # Each photo opened ahead of the one being written holds one chunk
+        ("session-download", session_download, chunk_budget + get_settings().DOWNLOAD_PREFETCH * STREAM_CHUNK_SIZE),
+    ]
+    for name, request, budget in scenarios:
+        if wanted is None or name in wanted:
+            results[name] = await measure(name, request, budget)
+    return results
+
+
+async def _download_session(app, s3, event_id: str, block: bytes, size: int, files: int) -> Tuple[str, str]:
+    """A session of `files` stored photos; returns (session_id, access token)"""
+    import httpx
+    from app.services.s3 import BUCKET_NAME
+
+    photo_urls = []
+    for i in range(files):
+        key = f"{event_id}/zip/photo-{i}.jpg"
+        s3.upload_fileobj(_BlockReader(block, size), BUCKET_NAME, key)
+        photo_urls.append(f"https://{BUCKET_NAME}.s3.ap-south-1.amazonaws.com/{key}")
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://memory-harness") as client:
+        session = (await client.post("/api/v1/session/create",
+                                     json={"event_id": event_id, "photo_urls": photo_urls})).json()
+        auth = await client.post(f"/api/v1/session/{session['session_id']}/auth",
+                                 json={"password": session["password"]})
+    return session["session_id"], auth.json()["access_token"]
+
+
+class _BlockReader:
+    """File-like object returning `size` bytes built from one block"""
+
+    def __init__(self, block: bytes, size: int):
+        self._chunks = repeated(block, size)
+
+    def read(self, amt=None) -> bytes:
+        return next(self._chunks, b"")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Check peak memory of the upload and download paths")
+    parser.add_argument("--size-mb", type=int, default=64, help="size of each synthetic file")
+    parser.add_argument("--files", type=int, default=3, help="files in the multi-photo upload")
+    parser.add_argument("--budget-chunks", type=float, default=8,
+                        help="allowed peak, in multiples of the 1 MiB streaming chunk")
+    parser.add_argument("--proxy-size-mb", type=int, default=16, help="decoded file size for proxy-upload")
+    parser.add_argument("--proxy-budget", type=float, default=3.5,
+                        help="allowed proxy-upload peak, in multiples of its JSON body")
+    parser.add_argument("--only", help="comma-separated paths to check")
+    parser.add_argument("-o", "--output", help="write the results as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_local_env()
+    # The image cache keeps whole objects by design; measure the streaming itself
+    os.environ.setdefault("IMAGE_CACHE_ENABLED", "false")
+    port = free_port()
+    # proxy-upload PUTs to the presigned URL over real HTTP
+    os.environ["LOCAL_STORAGE_URL"] = f"http://127.0.0.1:{port}"
+
+    from app.main import app
+    server, thread = start_server(app, port)
+    tracemalloc.start()
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        tracemalloc.stop()
+        server.should_exit = True
+        thread.join(timeout=10)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"settings": vars(args), "results": results}, f, indent=2)
+    failed = [name for name, result in results.items() if not result["within_budget"]]
+    if failed:
+        print(f"\nOver budget or failed: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
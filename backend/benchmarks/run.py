@@ -0,0 +1,270 @@
+"""
+Benchmarks for the API hot paths.
+
+Runs the app in-process against the local S3/DynamoDB stand-ins and reports
+throughput, latency percentiles and peak RSS per scenario. Results are written
+as JSON; pass --compare to diff against an earlier run and fail on regressions.
+
+    cd backend
+    python -m benchmarks.run                          # all scenarios
+    python -m benchmarks.run --only auth,photos -n 500
+    python -m benchmarks.run --compare benchmarks/results/baseline.json --max-regression 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List
+
+from benchmarks.harness import app_client, configure_local_env, peak_rss_mb, run_metadata, summarize
+
+EVENT_ID = "bench-event"
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+class Scenario:
+    """One benchmarked operation; `setup` runs once, `call` is timed"""
+
+    def __init__(self, name: str, call: Callable, setup: Callable = None, iterations: int = None):
+        self.name = name
+        self.call = call
+        self.setup = setup
+        self.iterations = iterations
+
+
+def check(response, expected: int = 200):
+    if response.status_code != expected:
+        raise RuntimeError(f"{response.request.method} {response.request.url.path} -> {response.status_code}")
+    return response
+
+
+def photo_bytes(size: int) -> bytes:
+    # JPEG markers around filler; content doesn't matter to the upload path
+    return b"\xff\xd8\xff\xe0" + os.urandom(max(size - 6, 0)) + b"\xff\xd9"
+
+
+async def create_session(client, state: Dict):
+    """Upload a few photos and create a session with a token for them"""
+    if "session_id" in state:
+        return
+    urls = []
+    for i in range(5):
+        response = check(await client.post(
+            "/api/v1/upload-photo", data={"event_id": EVENT_ID},
+            files={"file": (f"seed-{i}.jpg", state["photo"], "image/jpeg")}
+        ))
+        urls.append(response.json()["file_url"])
+    session = check(await client.post(
+        "/api/v1/session/create", json={"event_id": EVENT_ID, "photo_urls": urls}
+    )).json()
+    auth = check(await client.post(
+        f"/api/v1/session/{session['session_id']}/auth", json={"password": session["password"]}
+    )).json()
+    state.update(
+        session_id=session["session_id"],
+        password=session["password"],
+        photo_urls=urls,
+        headers={"Authorization": f"Bearer {auth['access_token']}"},
+    )
+
+
+def build_scenarios(args) -> List[Scenario]:
+    async def upload_single(client, state):
+        check(await client.post(
+            "/api/v1/upload-photo", data={"event_id": EVENT_ID},
+            files={"file": ("photo.jpg", state["photo"], "image/jpeg")}
+        ))
+
+    async def upload_multiple(client, state):
+        files = [("files", (f"photo-{i}.jpg", state["photo"], "image/jpeg")) for i in range(args.batch_size)]
+        check(await client.post("/api/v1/upload-multiple-photos", data={"event_id": EVENT_ID}, files=files))
+
+    def presign(count: int):
+        async def call(client, state):
+            response = check(await client.post(
+                "/api/v1/generate-upload-urls", json={"event_id": EVENT_ID, "num_photos": count}
+            ))
+            assert len(response.json()["presigned_urls"]) == count
+        return call
+
+    async def multipart_cycle(client, state):
+        config = check(await client.post(
+            "/api/v1/generate-multipart-upload-urls", json={"event_id": EVENT_ID, "file_names": ["large.jpg"]}
+        )).json()["upload_configs"][0]
+        parts = []
+        for part_number in range(1, args.parts + 1):
+            url = check(await client.post("/api/v1/get-presigned-upload-part-url", json={
+                "event_id": EVENT_ID, "file_name": "large.jpg",
+                "upload_id": config["upload_id"], "part_number": part_number,
+            })).json()["presigned_url"]
+            uploaded = check(await client.put(url, content=state["part"]))
+            parts.append({"PartNumber": part_number, "ETag": uploaded.headers["etag"]})
+        check(await client.post("/api/v1/complete-multipart-upload", json={
+            "event_id": EVENT_ID, "file_name": "large.jpg", "upload_id": config["upload_id"], "parts": parts,
+        }))
+
+    async def auth(client, state):
+        check(await client.post(f"/api/v1/session/{state['session_id']}/auth", json={"password": state["password"]}))
+
+    async def photos(client, state):
+        check(await client.get(f"/api/v1/session/{state['session_id']}/photos", headers=state["headers"]))
+
+    async def select(client, state):
+        check(await client.post(
+            f"/api/v1/session/{state['session_id']}/select", headers=state["headers"],
+            json={"photos": state["photo_urls"][:2]}
+        ))
+
+    async def direct_access(client, state):
+        response = check(await client.get("/api/v1/direct-access", params={"url": state["photo_urls"][0]}))
+        assert len(response.content) == len(state["photo"])
+
+    return [
+        Scenario("upload-single", upload_single),
+        Scenario("upload-multiple", upload_multiple),
+        Scenario("presign-1", presign(1)),
+        Scenario("presign-100", presign(100)),
+        Scenario("presign-500", presign(500), iterations=max(args.iterations // 5, 10)),
+        Scenario("multipart-cycle", multipart_cycle),
+        # bcrypt at the configured cost dominates; fewer rounds keep the run short
+        Scenario("auth", auth, setup=create_session, iterations=max(args.iterations // 10, 10)),
+        Scenario("photos", photos, setup=create_session),
+        Scenario("select", select, setup=create_session),
+        Scenario("direct-access", direct_access, setup=create_session),
+    ]
+
+
+async def run_scenario(client, scenario: Scenario, state: Dict, iterations: int, concurrency: int,
+                       warmup: int) -> Dict:
+    if scenario.setup:
+        await scenario.setup(client, state)
+    for _ in range(warmup):
+        await scenario.call(client, state)
+
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    remaining = iter(range(iterations))
+
+    async def worker():
+        for _ in remaining:
+            start = time.perf_counter()
+            try:
+                await scenario.call(client, state)
+            except Exception as e:
+                errors[str(e)] = errors.get(str(e), 0) + 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    result = summarize(latencies)
+    result.update(
+        iterations=iterations,
+        concurrency=concurrency,
+        errors=sum(errors.values()),
+        throughput_rps=round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        peak_rss_mb=peak_rss_mb(),
+    )
+    if errors:
+        result["error_samples"] = dict(list(errors.items())[:5])
+    return result
+
+
+async def run(args, scenarios: List[Scenario]) -> Dict:
+    state = {"photo": photo_bytes(args.photo_size), "part": os.urandom(args.part_size)}
+    results = {}
+    async with app_client() as client:
+        for scenario in scenarios:
+            iterations = scenario.iterations if scenario.iterations and not args.exact else args.iterations
+            results[scenario.name] = await run_scenario(
+                client, scenario, state, iterations, args.concurrency, args.warmup
+            )
+            r = results[scenario.name]
+            print(f"{scenario.name:<18} {r['throughput_rps']:>9.1f} req/s  p50 {r['p50_ms']:>8.2f} ms  "
+                  f"p99 {r['p99_ms']:>8.2f} ms  rss {r['peak_rss_mb']:>7.1f} MB  errors {r['errors']}")
+    return results
+
+
+def compare(results: Dict, baseline_path: str, max_regression: float) -> List[str]:
+    """Print the change against a baseline run; return the regressions beyond the threshold"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+    regressions = []
+    print(f"\nCompared with {baseline_path}:")
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        changes = []
+        for key, higher_is_worse in (("p50_ms", True), ("p99_ms", True), ("throughput_rps", False)):
+            if not previous[key]:
+                continue
+            change = (current[key] - previous[key]) / previous[key]
+            changes.append(f"{key} {change:+.1%}")
+            worse = change if higher_is_worse else -change
+            if key != "p50_ms" and worse > max_regression:
+                regressions.append(f"{name} {key} {previous[key]} -> {current[key]}")
+        print(f"  {name:<18} " + "  ".join(changes))
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the PhotoShare API hot paths in-process")
+    parser.add_argument("-n", "--iterations", type=int, default=200, help="timed calls per scenario")
+    parser.add_argument("-c", "--concurrency", type=int, default=8, help="concurrent callers")
+    parser.add_argument("--warmup", type=int, default=5, help="untimed calls before each scenario")
+    parser.add_argument("--exact", action="store_true", help="use --iterations for the slow scenarios too")
+    parser.add_argument("--only", help="comma-separated scenario names")
+    parser.add_argument("--photo-size", type=int, default=512 * 1024, help="bytes per uploaded photo")
+    parser.add_argument("--batch-size", type=int, default=10, help="photos per multi-photo upload")
+    parser.add_argument("--part-size", type=int, default=1024 * 1024, help="bytes per multipart part")
+    parser.add_argument("--parts", type=int, default=3, help="parts per multipart upload")
+    parser.add_argument("--storage-dir", help="local storage directory (default: a fresh temp dir)")
+    parser.add_argument("-o", "--output", help="results file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="fail when p99 or throughput is this much worse than --compare")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_local_env(args.storage_dir)
+
+    scenarios = build_scenarios(args)
+    if args.only:
+        wanted = {name.strip() for name in args.only.split(",")}
+        unknown = wanted - {s.name for s in scenarios}
+        if unknown:
+            sys.exit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        scenarios = [s for s in scenarios if s.name in wanted]
+
+    results = asyncio.run(run(args, scenarios))
+
+    started = datetime.now(timezone.utc)
+    output = args.output or os.path.join(RESULTS_DIR, started.strftime("%Y%m%dT%H%M%SZ") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    report = {
+        "created_at": started.isoformat(),
+        "meta": run_metadata(),
+        "settings": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "results": results,
+    }
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.max_regression)
+        if regressions:
+            print("\nRegressions:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Cold-start budget for the API.
+
+Starts fresh interpreters that import `app.main`, run the startup handlers and
+serve one request, and fails when the median time to that first response is
+over budget or when a module that should load lazily (boto3 by default) was
+imported before the first request. One extra run under `-X importtime` lists
+the packages that cost the most to import.
+
+    cd backend
+    python -m benchmarks.startup                      # 5 runs, exits 1 over budget
+    python -m benchmarks.startup --budget-ms 800 --runs 10 -o startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child interpreter; prints one JSON line
+CHILD = """
+import asyncio, json, sys, time
+start = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+loaded_before = sorted(name for name in {forbidden!r} if name in sys.modules)
+
+async def first_request():
+    import httpx
+    app = sys.modules["app.main"].app
+    async with app.router.lifespan_context(app):
+        started = time.perf_counter()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://startup") as client:
+            response = await client.get({path!r})
+        # Before shutdown, which waits for the background AWS client warm-up
+        return started, time.perf_counter(), response.status_code
+
+started, done, status = asyncio.run(first_request())
+print(json.dumps({{
+    "import_ms": (imported - start) * 1000,
+    "startup_ms": (started - imported) * 1000,
+    "first_response_ms": (done - start) * 1000,
+    "status": status,
+    "loaded_before_first_request": loaded_before,
+}}))
+"""
+
+
+def child_env(backend: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [BACKEND_DIR, env.get("PYTHONPATH")]))
+    env.setdefault("LOG_LEVEL", "WARNING")
+    env["STORAGE_BACKEND"] = backend
+    if backend == "local":
+        env.setdefault("LOCAL_STORAGE_DIR", tempfile.mkdtemp(prefix="photoshare-startup-"))
+    return env
+
+
+def run_child(args, importtime: bool = False) -> Tuple[Dict, str]:
+    code = CHILD.format(forbidden=args.forbid, path=args.path)
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    proc = subprocess.run(command, cwd=BACKEND_DIR, env=child_env(args.backend), capture_output=True, text=True)
+    if proc.returncode != 0:
+        sys.exit(f"startup run failed:\n{proc.stderr[-4000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1]), proc.stderr
+
+
+def import_offenders(importtime_output: str, top: int) -> List[Tuple[str, float]]:
+    """Import time per top-level package (the modules' own time, summed), largest first"""
+    totals = defaultdict(float)
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        totals[name.strip().split(".")[0]] += int(self_us) / 1000
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Check the API's time to first response from a cold start")
+    parser.add_argument("--runs", type=int, default=5, help="cold starts to take the median of")
+    parser.add_argument("--budget-ms", type=float, default=1500,
+                        help="allowed median time from interpreter start to the first response")
+    parser.add_argument("--forbid", default="boto3",
+                        help="comma-separated modules that must not be imported before the first request")
+    parser.add_argument("--backend", choices=("s3", "local"), default="s3",
+                        help="STORAGE_BACKEND for the runs (s3 makes no AWS calls for GET /)")
+    parser.add_argument("--path", default="/", help="path of the first request")
+    parser.add_argument("--top", type=int, default=10, help="slowest imported packages to list")
+    parser.add_argument("-o", "--output", help="write the results as JSON")
+    args = parser.parse_args(argv)
+    args.forbid = [name for name in args.forbid.split(",") if name]
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    runs = [run_child(args)[0] for _ in range(args.runs)]
+    _, importtime_output = run_child(args, importtime=True)
+
+    summary = {
+        name: round(statistics.median(run[name] for run in runs), 1)
+        for name in ("import_ms", "startup_ms", "first_response_ms")
+    }
+    loaded = sorted({name for run in runs for name in run["loaded_before_first_request"]})
+    offenders = import_offenders(importtime_output, args.top)
+
+    print(f"import app.main    {summary['import_ms']:>8.1f} ms")
+    print(f"startup handlers   {summary['startup_ms']:>8.1f} ms")
+    print(f"first response     {summary['first_response_ms']:>8.1f} ms  (budget {args.budget_ms:.0f} ms)")
+    print("\nslowest imports (under -X importtime):")
+    for name, ms in offenders:
+        print(f"  {name:<24} {ms:>8.1f} ms")
+
+    failures = []
+    if summary["first_response_ms"] > args.budget_ms:
+        failures.append(f"first response took {summary['first_response_ms']:.0f} ms")
+    if loaded:
+        failures.append(f"imported before the first request: {', '.join(loaded)}")
+    if any(run["status"] != 200 for run in runs):
+        failures.append(f"GET {args.path} did not return 200")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "settings": vars(args),
+                "median": summary,
+                "runs": runs,
+                "import_offenders_ms": dict(offenders),
+                "failures": failures,
+            }, f, indent=2)
+    if failures:
+        print("\n" + "\n".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""
+Tests run against the local S3/DynamoDB stand-ins, like the benchmarks, so
+they need no network or AWS account.
+
+    cd backend
+    python -m pytest
+"""
+import asyncio
+import os
+import tempfile
+
+import pytest
+
+from benchmarks.harness import BASE_URL, configure_local_env
+
+# Before anything imports app.core.config
+configure_local_env()
+os.environ.setdefault("IMAGE_CACHE_DIR", tempfile.mkdtemp(prefix="photoshare-test-cache-"))
+
+
+@pytest.fixture
+def api():
+    """
+    Send one request to the app in-process: api("GET", "/metrics"). The
+    app's startup and shutdown aren't run; shutdown closes the worker pools
+    for the rest of the process.
+    """
+    import httpx
+    from app.main import app
+
+    def send(method: str, url: str, **kwargs) -> httpx.Response:
+        async def run():
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url=BASE_URL) as client:
+                return await client.request(method, url, **kwargs)
+        return asyncio.run(run())
+
+    return send
@@ -0,0 +1,19 @@
+"""Smoke runs of the benchmark suite against the local storage backend"""
+import json
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_benchmark_suite_runs_without_errors(tmp_path):
+    output = tmp_path / "results.json"
+    completed = subprocess.run(
+        [sys.executable, "-m", "benchmarks.run", "-n", "5", "--warmup", "1", "-c", "2", "-o", str(output)],
+        cwd=BACKEND_DIR, capture_output=True, text=True, timeout=300,
+    )
+    assert completed.returncode == 0, completed.stdout + completed.stderr
+    results = json.loads(output.read_text())["results"]
+    assert {"upload-single", "auth", "photos", "direct-access"} <= set(results)
+    assert all(result["errors"] == 0 for result in results.values())
@@ -0,0 +1,100 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.core import breaker as breaker_module
+from app.core.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, DependencyUnavailable
+from app.services.local_storage import LocalTable
+from app.services.jwt import create_access_token
+from app.services.session_cache import META_PENDING, photo_list_cache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_closed_open_half_open_closed(clock):
+    breaker = CircuitBreaker("s3", failure_threshold=3, reset_seconds=10)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+    clock[0] += 4
+    with pytest.raises(DependencyUnavailable) as refused:
+        breaker.before_call()
+    assert refused.value.status_code == 503
+    assert refused.value.headers["Retry-After"] == "6"
+
+    # One probe after reset_seconds; others are refused while it runs
+    clock[0] += 6
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(DependencyUnavailable):
+        breaker.before_call()
+    breaker.record_success()
+    assert (breaker.state, breaker.failures) == (CLOSED, 0)
+    breaker.before_call()
+
+
+def test_failed_probe_opens_it_again(clock):
+    breaker = CircuitBreaker("dynamodb", failure_threshold=1, reset_seconds=10)
+    breaker.record_failure()
+    clock[0] += 10
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    with pytest.raises(DependencyUnavailable):
+        breaker.before_call()
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker("s3", failure_threshold=2, reset_seconds=10)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+
+@pytest.mark.parametrize("status, code, failed", [
+    (500, "InternalError", True),
+    (400, "ProvisionedThroughputExceededException", True),
+    (503, "SlowDown", True),
+    (404, "NoSuchKey", False),
+    (400, "ConditionalCheckFailedException", False),
+    (200, None, False),
+])
+def test_only_server_errors_and_throttling_count_as_failures(monkeypatch, status, code, failed):
+    breaker = CircuitBreaker("test-service", failure_threshold=1)
+    monkeypatch.setitem(breaker_module.breakers, "test-service", breaker)
+    model = SimpleNamespace(service_model=SimpleNamespace(service_name="test-service"))
+    parsed = {"Error": {"Code": code}} if code else {}
+
+    breaker_module._after_call(model, http_response=SimpleNamespace(status_code=status), parsed=parsed)
+    assert (breaker.state == OPEN) == failed
+
+
+def test_photos_served_from_the_cache_while_dynamodb_is_down(api, monkeypatch):
+    def unavailable(self, **kwargs):
+        raise DependencyUnavailable("dynamodb", 5)
+
+    monkeypatch.setattr(LocalTable, "get_item", unavailable)
+    token = create_access_token({"sub": "breaker-session", "pv": 1})
+    headers = {"Authorization": f"Bearer {token}"}
+
+    # Not cached: the 503 comes through
+    response = api("GET", "/api/v1/session/breaker-session/photos", headers=headers)
+    assert (response.status_code, response.headers["Retry-After"]) == (503, "5")
+
+    # An entry due for a recheck is still better than an error
+    photo_list_cache.put("breaker-session", 1, ["https://example.com/a.jpg"], meta_state=META_PENDING)
+    photo_list_cache.peek("breaker-session", 1).stored_at -= 60
+    response = api("GET", "/api/v1/session/breaker-session/photos", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["photos"] == ["https://example.com/a.jpg"]
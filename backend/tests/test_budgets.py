@@ -0,0 +1,30 @@
+"""
+Memory and cold-start budgets, checked by running benchmarks/memory.py and
+benchmarks/startup.py in their own interpreters (both measure the whole
+process, so they can't share pytest's).
+"""
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _run(*args):
+    completed = subprocess.run(
+        [sys.executable, "-m", *args], cwd=BACKEND_DIR, capture_output=True, text=True, timeout=300,
+    )
+    assert completed.returncode == 0, completed.stdout + completed.stderr
+    return completed.stdout
+
+
+def test_upload_and_download_paths_stay_within_memory_budget():
+    # Small files keep the test quick; the budget doesn't grow with the file
+    output = _run("benchmarks.memory", "--size-mb", "16", "--files", "2")
+    for path in ("upload-photo", "upload-multiple", "presigned-part", "direct-access",
+                 "proxy-upload", "session-download"):
+        assert path in output
+
+
+def test_cold_start_within_budget_without_heavy_imports():
+    _run("benchmarks.startup", "--runs", "2", "--forbid", "boto3,PIL,numpy")
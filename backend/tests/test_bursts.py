@@ -0,0 +1,37 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from app.services.bursts import group_bursts
+
+
+def _entry(taken_at, dhash):
+    # [width, height, orientation, taken_at, placeholder, dhash]
+    return [4000, 3000, 1, taken_at, None, dhash]
+
+
+def test_groups_close_similar_frames_in_capture_order():
+    meta = [
+        _entry("2024-05-17T10:00:01", "ffff0000ffff0000"),
+        _entry("2024-05-17T10:00:00", "ffff0000ffff0000"),
+        _entry("2024-05-17T10:00:02", "ffff0000ffff0001"),  # 1 bit off
+        _entry("2024-05-17T10:05:00", "ffff0000ffff0000"),  # too late
+        _entry("2024-05-17T10:05:01", "0000ffff0000ffff"),  # too different
+    ]
+    assert group_bursts(meta, 5, max_distance=10, max_gap=2) == [[1, 0, 2], [3], [4]]
+
+
+def test_photos_without_time_or_hash_stay_alone():
+    meta = [
+        _entry("2024-05-17T10:00:00", "ffff0000ffff0000"),
+        _entry(None, "ffff0000ffff0000"),
+        _entry("2024-05-17T10:00:01", None),
+        None,
+        _entry("2024-05-17T10:00:01", "ffff0000ffff0000"),
+    ]
+    assert group_bursts(meta, 6, max_distance=10, max_gap=2) == [[0, 4], [1], [2], [3], [5]]
+
+
+def test_without_an_index_every_photo_is_its_own_burst():
+    assert group_bursts(None, 3) == [[0], [1], [2]]
+    assert group_bursts([], 0) == []
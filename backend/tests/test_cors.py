@@ -0,0 +1,57 @@
+from app.core.cors import CorsPolicy, with_vary_origin
+
+
+def _headers(headers):
+    return dict(headers) if headers is not None else None
+
+
+def test_exact_and_wildcard_origins():
+    policy = CorsPolicy(["https://app.example.com", "https://*.photos.dev", "http://localhost:3000"])
+    assert policy.is_allowed("https://app.example.com")
+    assert policy.is_allowed("https://a.b.photos.dev")
+    assert policy.is_allowed("http://localhost:3000")
+    assert not policy.is_allowed("https://photos.dev")
+    assert not policy.is_allowed("http://a.photos.dev")
+    assert not policy.is_allowed("http://localhost:3001")
+    assert not policy.is_allowed("https://app.example.com.evil.com")
+
+
+def test_listed_origin_gets_credentials():
+    policy = CorsPolicy(["https://app.example.com"])
+    headers = _headers(policy.simple_headers(b"https://app.example.com"))
+    assert headers[b"access-control-allow-origin"] == b"https://app.example.com"
+    assert headers[b"access-control-allow-credentials"] == b"true"
+    assert policy.simple_headers(b"https://evil.com") is None
+
+
+def test_star_allows_others_without_credentials():
+    policy = CorsPolicy(["https://app.example.com", "*"])
+    headers = _headers(policy.simple_headers(b"https://evil.com"))
+    assert headers[b"access-control-allow-origin"] == b"*"
+    assert b"access-control-allow-credentials" not in headers
+    preflight = _headers(policy.preflight_headers(b"https://evil.com", b"authorization"))
+    assert preflight[b"access-control-allow-origin"] == b"*"
+    assert b"access-control-allow-credentials" not in preflight
+    # Configured origins keep their credentials
+    listed = _headers(policy.simple_headers(b"https://app.example.com"))
+    assert listed[b"access-control-allow-credentials"] == b"true"
+
+
+def test_configured_origin_paths_are_ignored():
+    policy = CorsPolicy(["https://photo-share.web.app/app/"])
+    assert policy.is_allowed("https://photo-share.web.app")
+
+
+def test_preflight_echoes_requested_headers():
+    policy = CorsPolicy(["https://app.example.com"], max_age=600)
+    headers = _headers(policy.preflight_headers(b"https://app.example.com", b"authorization, content-type"))
+    assert headers[b"access-control-allow-headers"] == b"authorization, content-type"
+    assert headers[b"access-control-max-age"] == b"600"
+    assert policy.preflight_headers(b"https://evil.com", b"") is None
+
+
+def test_vary_origin_is_merged():
+    assert with_vary_origin([]) == [(b"vary", b"Origin")]
+    assert with_vary_origin([(b"Vary", b"Accept-Encoding")]) == [(b"Vary", b"Accept-Encoding, Origin")]
+    assert with_vary_origin([(b"vary", b"origin")]) == [(b"vary", b"origin")]
+    assert with_vary_origin([(b"vary", b"*")]) == [(b"vary", b"*")]
@@ -0,0 +1,72 @@
+import asyncio
+import base64
+
+import pytest
+
+from app.api.sessions import decode_cursor, encode_cursor
+from app.core.config import get_settings
+from app.services.dynamodb import get_dynamodb_client, TABLE_NAME
+
+OPERATOR = {"X-Operator-Token": "operator-test-token"}
+
+
+@pytest.fixture(autouse=True)
+def operator_token(monkeypatch):
+    monkeypatch.setattr(get_settings(), "OPERATOR_TOKEN", OPERATOR["X-Operator-Token"])
+
+
+@pytest.fixture
+def list_sessions(api):
+    return lambda event_id, **params: api("GET", f"/api/v1/event/{event_id}/sessions", params=params,
+                                          headers=OPERATOR)
+
+
+def test_cursor_round_trip():
+    key = {"session_id": "s", "event_id": "e", "created_at": 1700000000}
+    assert decode_cursor(encode_cursor(key)) == key
+
+
+def test_pages_follow_the_cursor_newest_first(list_sessions):
+    table = get_dynamodb_client().Table(TABLE_NAME)
+    for n in range(5):
+        table.put_item(Item={"session_id": f"cursor-{n}", "event_id": "cursor-event", "created_at": 1000 + n,
+                             "photo_count": n, "selection_count": 0, "last_activity": 1000 + n})
+
+    seen, cursor = [], None
+    while True:
+        response = list_sessions("cursor-event", limit=2, **({"cursor": cursor} if cursor else {}))
+        assert response.status_code == 200
+        page = response.json()
+        seen += [session["session_id"] for session in page["sessions"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == [f"cursor-{n}" for n in reversed(range(5))]
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64 at all!",
+    base64.urlsafe_b64encode(b"[1, 2]").decode(),
+    base64.urlsafe_b64encode(b'{"session_id": "s"}').decode(),
+])
+def test_malformed_cursor_is_a_400(list_sessions, cursor):
+    assert list_sessions("cursor-event", cursor=cursor).status_code == 400
+
+
+def test_cursor_of_another_event_is_a_400(list_sessions):
+    cursor = encode_cursor({"session_id": "s", "event_id": "other-event", "created_at": 1})
+    assert list_sessions("cursor-event", cursor=cursor).status_code == 400
+
+
+def test_sign_in_records_activity(api, list_sessions):
+    from app.services.sessions import create_photo_session
+
+    table = get_dynamodb_client().Table(TABLE_NAME)
+    session = asyncio.run(create_photo_session(table, "activity-event", []))
+    table.update_item(Key={"session_id": session.session_id}, UpdateExpression="SET last_activity = :old",
+                      ExpressionAttributeValues={":old": 1})
+
+    response = api("POST", f"/api/v1/session/{session.session_id}/auth", json={"password": session.password})
+    assert response.status_code == 200
+    page = list_sessions("activity-event").json()
+    assert page["sessions"][0]["last_activity"] > 1
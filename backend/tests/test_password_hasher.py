@@ -0,0 +1,74 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.api import jwt as jwt_api
+from app.services.dynamodb import get_dynamodb_client, TABLE_NAME
+from app.services.password_hasher import HasherBusy, PasswordHasher
+from app.utils.password import bcrypt_rounds, hash_password
+
+
+@pytest.fixture
+def hasher(monkeypatch):
+    hasher = PasswordHasher(rounds=4, workers=2, max_pending=2)
+    monkeypatch.setattr(jwt_api, "password_hasher", hasher)
+    yield hasher
+    hasher.shutdown()
+
+
+def _stored_hash(session_id: str) -> str:
+    return get_dynamodb_client().Table(TABLE_NAME).get_item(Key={"session_id": session_id})["Item"]["hashed_password"]
+
+
+def _sign_in(api, session_id: str, hashed_password: str, password: str = "secret"):
+    get_dynamodb_client().Table(TABLE_NAME).put_item(Item={
+        "session_id": session_id, "event_id": "hasher-event", "created_at": 1,
+        "hashed_password": hashed_password, "photo_urls": [],
+    })
+    return api("POST", f"/api/v1/session/{session_id}/auth", json={"password": password})
+
+
+def test_full_queue_sheds_load_at_once():
+    hasher = PasswordHasher(rounds=4, workers=1, max_pending=1)
+    release = threading.Event()
+
+    async def run():
+        blocked = asyncio.ensure_future(hasher._run(release.wait))
+        await asyncio.sleep(0)
+        with pytest.raises(HasherBusy):
+            await hasher.verify("secret", hash_password("secret", 4))
+        release.set()
+        await blocked
+        assert hasher.pending == 0
+        assert await hasher.verify("secret", hash_password("secret", 4))
+
+    try:
+        asyncio.run(run())
+    finally:
+        hasher.shutdown()
+
+
+def test_busy_hasher_is_a_503(api, hasher):
+    hasher.max_pending = 0
+    response = _sign_in(api, "hasher-busy", hash_password("secret", 4))
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+
+@pytest.mark.parametrize("stored", ["secret", hash_password("secret", 5)], ids=["plain text", "other work factor"])
+def test_outdated_hashes_are_upgraded_on_sign_in(api, hasher, stored):
+    assert _sign_in(api, "hasher-upgrade", stored).status_code == 200
+    assert bcrypt_rounds(_stored_hash("hasher-upgrade")) == 4
+
+
+def test_current_hashes_are_left_alone(api, hasher):
+    stored = hash_password("secret", 4)
+    assert not hasher.needs_rehash(stored)
+    assert _sign_in(api, "hasher-current", stored).status_code == 200
+    assert _stored_hash("hasher-current") == stored
+
+
+def test_wrong_password_upgrades_nothing(api, hasher):
+    assert _sign_in(api, "hasher-wrong", "secret", password="guess").status_code == 401
+    assert _stored_hash("hasher-wrong") == "secret"
@@ -0,0 +1,76 @@
+import time
+
+import pytest
+from botocore.exceptions import ClientError
+
+from app.services import photo_meta, session_cache
+from app.services.local_storage import LocalDynamoDBResource
+from app.services.photo_meta import index_key, photo_index_state, read_photo_index, store_photo_index
+from app.services.session_cache import META_ABSENT, META_PENDING, META_READY, PhotoListCache
+
+
+@pytest.fixture
+def table(tmp_path):
+    return LocalDynamoDBResource(str(tmp_path / "db.sqlite3"), {"sessions": ("session_id", {})}).Table("sessions")
+
+
+def _session(table, **attributes):
+    item = {"session_id": "s1", "event_id": "e1", "photo_urls": ["a", "b", "c"],
+            "created_at": int(time.time()), "photo_version": 1, **attributes}
+    table.put_item(Item=item)
+    return item
+
+
+def test_index_is_chunked_into_items_of_its_own(table, monkeypatch):
+    monkeypatch.setattr(photo_meta, "PHOTO_INDEX_CHUNK_SIZE", 2)
+    _session(table, photo_index="pending")
+    meta = [[4000, 3000, 1, "2024-05-17T10:00:00", None, "ff"], None, [10, 20, 6, None, None, None]]
+
+    assert store_photo_index(table, "s1", 1, meta, purge_at=123) == 2
+
+    session = table.get_item(Key={"session_id": "s1"})["Item"]
+    assert (session["photo_index"], session["photo_index_chunks"]) == ("ready", 2)
+    assert "photo_meta" not in session
+    chunk = table.get_item(Key={"session_id": index_key("s1", 1, 1)})["Item"]
+    assert (len(chunk["entries"]), chunk["purge_at"], "event_id" in chunk) == (1, 123, False)
+    assert read_photo_index(table, session) == (META_READY, meta)
+
+
+def test_index_of_changed_photos_is_not_marked_ready(table):
+    _session(table, photo_index="pending", photo_version=2)
+    with pytest.raises(ClientError):
+        store_photo_index(table, "s1", 1, [None, None, None])
+    assert table.get_item(Key={"session_id": "s1"})["Item"]["photo_index"] == "pending"
+
+
+def test_pending_index_turns_absent_when_nobody_finishes_it():
+    now = int(time.time())
+    assert photo_index_state({"photo_index": "pending", "created_at": now}, now) == META_PENDING
+    old = now - photo_meta.PHOTO_INDEX_PENDING_SECONDS
+    assert photo_index_state({"photo_index": "pending", "created_at": old}, now) == META_ABSENT
+    assert photo_index_state({"photo_index": "failed", "created_at": now}, now) == META_ABSENT
+    assert photo_index_state({"created_at": now}, now) == META_ABSENT
+    # Indexed before it moved out of the session item
+    assert photo_index_state({"photo_meta": []}, now) == META_READY
+
+
+def test_inline_index_is_still_read(table):
+    session = _session(table, photo_meta=[[10, 20, 1], None, None])
+    assert read_photo_index(table, session) == (META_READY, [[10, 20, 1, None, None, None], None, None])
+
+
+def test_absent_index_is_cached_for_good(monkeypatch):
+    cache = PhotoListCache(max_size=10)
+    cache.put("absent", 1, ["a"], meta_state=META_ABSENT)
+    cache.put("pending", 1, ["a"], meta_state=META_PENDING)
+    cache.put("unread", 1, ["a"])
+    assert cache.get_with_meta("unread", 1) is None
+    assert cache.get_with_meta("pending", 1) is not None
+
+    later = time.monotonic() + session_cache.PENDING_META_RECHECK_SECONDS + 1
+    monkeypatch.setattr(time, "monotonic", lambda: later)
+    assert cache.get_with_meta("absent", 1).meta_state == META_ABSENT
+    assert cache.get_with_meta("pending", 1) is None
+
+    cache.set_meta("pending", 1, None)
+    assert cache.get_with_meta("pending", 1).meta_state == META_ABSENT
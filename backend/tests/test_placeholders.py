@@ -0,0 +1,49 @@
+import io
+
+import pytest
+
+np = pytest.importorskip("numpy")
+Image = pytest.importorskip("PIL.Image")
+
+from app.services.placeholders import blurhash, decode_sample, placeholder
+
+
+def _gradient(width: int, height: int):
+    x = np.linspace(0, 255, width)[None, :, None]
+    y = np.linspace(0, 255, height)[:, None, None]
+    return np.concatenate([
+        np.broadcast_to(x, (height, width, 1)),
+        np.broadcast_to(y, (height, width, 1)),
+        np.full((height, width, 1), 90.0),
+    ], axis=2).astype(np.uint8)
+
+
+def test_blurhash_matches_the_reference_encoder():
+    reference = pytest.importorskip("blurhash")
+    pixels = _gradient(32, 24)
+    assert blurhash(pixels, 4, 3) == reference.encode(pixels, components_x=4, components_y=3)
+
+
+def test_blurhash_of_a_flat_colour():
+    pixels = np.full((8, 8, 3), (255, 0, 0), dtype=np.uint8)
+    result = blurhash(pixels, 4, 3)
+    # Size flag, max AC, DC (4) and 11 AC components (2 each)
+    assert len(result) == 1 + 1 + 4 + 2 * 11
+    assert result[2:6] == "TI:j"  # 0xFF0000, pure red
+
+
+def test_placeholder_puts_more_components_along_the_long_side():
+    landscape = Image.fromarray(_gradient(32, 20))
+    portrait = Image.fromarray(_gradient(20, 32))
+    # The first character encodes (x - 1) + (y - 1) * 9
+    assert placeholder(landscape)[0] == "L"  # 4 x 3
+    assert placeholder(portrait)[0] == "T"  # 3 x 4
+
+
+def test_decode_sample_crops_and_rotates():
+    buffer = io.BytesIO()
+    Image.fromarray(_gradient(400, 300)).save(buffer, "JPEG")
+    sample = decode_sample(buffer.getvalue(), 400, 300, orientation=6)
+    assert max(sample.size) <= 32
+    assert sample.size[0] < sample.size[1]  # rotated to portrait
+    assert decode_sample(b"not an image", 400, 300) is None
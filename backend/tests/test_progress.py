@@ -0,0 +1,75 @@
+import asyncio
+import time
+
+import pytest
+
+from app.services import progress
+from app.services.progress import ChannelLimitReached, ProgressHub
+
+
+def _collect(hub: ProgressHub, channel: str, after: int = 0):
+    """The events a subscriber gets before the channel goes quiet"""
+    async def run():
+        events = []
+        async for event in hub.subscribe(channel, after, heartbeat=0.01):
+            if event is None:
+                break
+            events.append(event)
+        return events
+    return asyncio.run(run())
+
+
+def test_full_hub_refuses_new_channels_instead_of_dropping_busy_ones(monkeypatch):
+    monkeypatch.setattr(progress, "MAX_CHANNELS", 3)
+    hub = ProgressHub(retention=60)
+    channels = [hub.open_channel() for _ in range(3)]
+
+    with pytest.raises(ChannelLimitReached):
+        hub.open_channel()
+    assert all(hub.has_channel(channel) for channel in channels)
+
+    # Once one has been idle for the retention period it makes room
+    hub._channels[channels[0]].last_used = time.monotonic() - 61
+    assert hub.open_channel() not in channels
+    assert not hub.has_channel(channels[0])
+    assert hub.has_channel(channels[1]) and hub.has_channel(channels[2])
+
+
+def test_idle_channel_with_subscribers_is_kept(monkeypatch):
+    monkeypatch.setattr(progress, "MAX_CHANNELS", 2)
+    hub = ProgressHub(retention=60)
+    watched, idle = hub.open_channel(), hub.open_channel()
+    hub._channels[watched].subscribers.add(asyncio.Queue())
+    for channel in (watched, idle):
+        hub._channels[channel].last_used = time.monotonic() - 61
+
+    hub.open_channel()
+    assert hub.has_channel(watched) and not hub.has_channel(idle)
+
+
+def test_late_subscriber_gets_the_history():
+    hub = ProgressHub(history_size=3)
+    channel = hub.open_channel()
+    for n in range(5):
+        hub.publish(channel, "file_uploaded", n=n)
+
+    # Only the last history_size events are kept
+    assert [event.id for event in _collect(hub, channel)] == [3, 4, 5]
+
+
+def test_reconnect_resumes_after_last_event_id():
+    hub = ProgressHub()
+    channel = hub.open_channel()
+    for n in range(4):
+        hub.publish(channel, "file_uploaded", n=n)
+
+    events = _collect(hub, channel, after=2)
+    assert [event.id for event in events] == [3, 4]
+    assert events[0].encoded == b'id: 3\nevent: file_uploaded\ndata: {"n": 2}\n\n'
+
+
+def test_unknown_channels_allocate_nothing():
+    hub = ProgressHub()
+    hub.publish("nobody-opened-this", "file_uploaded")
+    assert not hub.has_channel("nobody-opened-this")
+    assert _collect(hub, "nobody-opened-this") == []
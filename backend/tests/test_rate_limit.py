@@ -0,0 +1,72 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from app.services import rate_limit
+from app.services.rate_limit import MemoryBucketStore, SQLiteBucketStore, limit_auth_attempts
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryBucketStore(), "monotonic"
+    return SQLiteBucketStore(str(tmp_path / "buckets.sqlite3")), "time"
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    """Two attempts per session and IP, three per IP, refilled at one per 10 seconds"""
+    monkeypatch.setattr(rate_limit, "bucket_store", MemoryBucketStore())
+    monkeypatch.setattr(rate_limit, "AUTH_SESSION_BURST", 2)
+    monkeypatch.setattr(rate_limit, "AUTH_SESSION_REFILL_PER_MINUTE", 6)
+    monkeypatch.setattr(rate_limit, "AUTH_IP_BURST", 3)
+    monkeypatch.setattr(rate_limit, "AUTH_IP_REFILL_PER_MINUTE", 6)
+
+
+def _attempt(session_id: str, ip: str):
+    """The 429 raised for an attempt, or None if it may go ahead"""
+    request = Request({"type": "http", "client": (ip, 50000), "headers": []})
+    try:
+        asyncio.run(limit_auth_attempts(request, session_id))
+    except HTTPException as e:
+        return e
+    return None
+
+
+def test_bucket_refills_over_time(store, monkeypatch):
+    store, clock = store
+    now = time.time() if clock == "time" else time.monotonic()
+    monkeypatch.setattr(time, clock, lambda: now)
+    assert store.take("key", 2, 0.5) == (True, 0)
+    assert store.take("key", 2, 0.5) == (True, 0)
+    assert store.take("key", 2, 0.5) == (False, 2)
+
+    monkeypatch.setattr(time, clock, lambda: now + 2)
+    assert store.take("key", 2, 0.5) == (True, 0)
+    assert store.take("key", 2, 0.5)[0] is False
+
+    # Never more than the burst, however long it was idle
+    monkeypatch.setattr(time, clock, lambda: now + 3600)
+    assert [store.take("key", 2, 0.5)[0] for _ in range(3)] == [True, True, False]
+
+
+def test_session_and_ip_buckets_are_separate(limits):
+    assert _attempt("a", "10.0.0.1") is None
+    assert _attempt("a", "10.0.0.1") is None
+    # The (session, IP) bucket is empty
+    assert _attempt("a", "10.0.0.1").status_code == 429
+    # Another guest of the same session isn't affected
+    assert _attempt("a", "10.0.0.2") is None
+    # The IP still has one attempt left for another session, then it's out too
+    assert _attempt("b", "10.0.0.1") is None
+    assert _attempt("c", "10.0.0.1").status_code == 429
+
+
+def test_limited_attempt_is_a_429_with_retry_after(api, limits):
+    responses = [api("POST", "/api/v1/session/rate-limited/auth", json={"password": "guess"}) for _ in range(3)]
+    # Let through (to a 404: the session doesn't exist), then refused before any lookup
+    assert [response.status_code for response in responses] == [404, 404, 429]
+    assert responses[2].headers["Retry-After"] == "10"
@@ -0,0 +1,41 @@
+import pytest
+
+from app.utils.s3 import object_key_from_url
+
+BUCKET = "photos-bucket"
+
+
+@pytest.mark.parametrize("url", [
+    f"https://{BUCKET}.s3.amazonaws.com/ev/s/a.jpg",
+    f"https://{BUCKET}.s3.ap-south-1.amazonaws.com/ev/s/a.jpg",
+    f"https://{BUCKET}.s3-ap-south-1.amazonaws.com/ev/s/a.jpg",
+    f"https://{BUCKET}.s3.dualstack.eu-west-1.amazonaws.com/ev/s/a.jpg",
+    f"https://s3.ap-south-1.amazonaws.com/{BUCKET}/ev/s/a.jpg",
+    f"http://{BUCKET}.s3.amazonaws.com/ev/s/a.jpg?X-Amz-Signature=abc",
+])
+def test_accepts_virtual_hosted_and_path_style_urls(url):
+    assert object_key_from_url(url, BUCKET) == "ev/s/a.jpg"
+
+
+def test_decodes_the_key():
+    url = f"https://{BUCKET}.s3.amazonaws.com/ev/s/my%20photo.jpg"
+    assert object_key_from_url(url, BUCKET) == "ev/s/my photo.jpg"
+
+
+@pytest.mark.parametrize("url", [
+    "https://other-bucket.s3.amazonaws.com/ev/s/a.jpg",
+    f"https://s3.amazonaws.com/other-bucket/{BUCKET}/a.jpg",
+    f"https://{BUCKET}.s3.amazonaws.com.evil.com/ev/s/a.jpg",
+    f"https://evil.com/{BUCKET}/ev/s/a.jpg",
+    f"ftp://{BUCKET}.s3.amazonaws.com/ev/s/a.jpg",
+    f"https://{BUCKET}.s3.amazonaws.com/",
+    "not a url",
+])
+def test_rejects_other_hosts_and_buckets(url):
+    assert object_key_from_url(url, BUCKET) is None
+
+
+def test_keys_outside_the_prefix_are_rejected():
+    url = f"https://{BUCKET}.s3.amazonaws.com/other-event/s/a.jpg"
+    assert object_key_from_url(url, BUCKET, "ev/") is None
+    assert object_key_from_url(url, BUCKET, "other-event/") == "other-event/s/a.jpg"
@@ -0,0 +1,73 @@
+import asyncio
+import time
+
+import pytest
+
+from app.services.dynamodb import EVENT_INDEX_NAME, EXPIRY_INDEX_NAME, expiry_shard
+from app.services.local_storage import LocalDynamoDBResource, LocalS3Client
+from app.services.photo_meta import index_key
+from app.services.sweeper import SessionSweeper
+
+BUCKET = "sweeper-bucket"
+TABLE = "sessions"
+
+
+@pytest.fixture
+def storage(tmp_path):
+    s3 = LocalS3Client(str(tmp_path / "s3"), "http://testserver")
+    dynamodb = LocalDynamoDBResource(str(tmp_path / "db.sqlite3"), {TABLE: ("session_id", {
+        EVENT_INDEX_NAME: ("event_id", "created_at"),
+        EXPIRY_INDEX_NAME: ("expiry_shard", "expires_at"),
+    })})
+    return s3, dynamodb
+
+
+def _sweeper(storage, dry_run=False) -> SessionSweeper:
+    s3, dynamodb = storage
+    return SessionSweeper(s3, dynamodb, BUCKET, TABLE, EVENT_INDEX_NAME, EXPIRY_INDEX_NAME,
+                          dry_run=dry_run, requests_per_second=0)
+
+
+def _session(storage, session_id: str, keys, expires_in: int, **attributes):
+    s3, dynamodb = storage
+    for key in keys:
+        s3.put_object(Bucket=BUCKET, Key=key, Body=b"photo")
+    now = int(time.time())
+    dynamodb.Table(TABLE).put_item(Item={
+        "session_id": session_id, "event_id": "ev", "created_at": now,
+        "photo_urls": [f"https://{BUCKET}.s3.ap-south-1.amazonaws.com/{key}" for key in keys],
+        "expires_at": now + expires_in, "expiry_shard": expiry_shard(session_id), **attributes,
+    })
+
+
+def _keys(storage):
+    return {obj["Key"] for obj in storage[0].list_objects_v2(Bucket=BUCKET).get("Contents", [])}
+
+
+def _has_item(storage, session_id: str) -> bool:
+    return "Item" in storage[1].Table(TABLE).get_item(Key={"session_id": session_id})
+
+
+def test_prefixes_of_live_sessions_are_kept(storage):
+    _session(storage, "expired", ["ev/shared/a.jpg", "ev/own/b.jpg"], expires_in=-60, photo_index_chunks=1)
+    storage[1].Table(TABLE).put_item(Item={"session_id": index_key("expired", None, 0), "entries": []})
+    _session(storage, "live", ["ev/shared/c.jpg"], expires_in=3600)
+
+    report = asyncio.run(_sweeper(storage).sweep())
+
+    assert (report.expired_sessions, report.deleted_sessions, report.skipped_prefixes) == (1, 1, 1)
+    assert _keys(storage) == {"ev/shared/a.jpg", "ev/shared/c.jpg"}
+    assert not _has_item(storage, "expired")
+    assert not _has_item(storage, index_key("expired", None, 0))
+    assert _has_item(storage, "live")
+
+
+def test_dry_run_deletes_nothing(storage):
+    _session(storage, "expired", ["ev/own/a.jpg", "ev/own/b.jpg"], expires_in=-60)
+
+    report = asyncio.run(_sweeper(storage, dry_run=True).sweep())
+
+    assert (report.expired_sessions, report.prefixes, report.deleted_sessions) == (1, 1, 0)
+    assert report.sample_sessions == ["expired"]
+    assert _keys(storage) == {"ev/own/a.jpg", "ev/own/b.jpg"}
+    assert _has_item(storage, "expired")
@@ -0,0 +1,35 @@
+import time
+
+from app.services.jwt import TokenCache
+
+
+def test_hit_until_the_token_expires(monkeypatch):
+    cache = TokenCache(max_size=10)
+    now = time.time()
+    cache.put("token", {"sub": "session", "exp": now + 60})
+    assert cache.get("token") == {"sub": "session", "exp": now + 60}
+
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert cache.get("token") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+    # The expired entry is gone, not just hidden
+    monkeypatch.setattr(time, "time", lambda: now)
+    assert cache.get("token") is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TokenCache(max_size=2)
+    exp = time.time() + 60
+    cache.put("a", {"sub": "a", "exp": exp})
+    cache.put("b", {"sub": "b", "exp": exp})
+    cache.get("a")
+    cache.put("c", {"sub": "c", "exp": exp})
+    assert cache.get("b") is None
+    assert cache.get("a")["sub"] == "a"
+    assert cache.get("c")["sub"] == "c"
+
+
+def test_size_zero_disables_the_cache():
+    cache = TokenCache(max_size=0)
+    cache.put("token", {"sub": "s", "exp": time.time() + 60})
+    assert cache.get("token") is None
@@ -0,0 +1,59 @@
+import asyncio
+import json
+
+from app.services.local_storage import LocalS3Client
+from app.services.progress import progress_hub
+from app.services.s3 import BUCKET_NAME, get_s3_client
+
+
+def _events(channel: str):
+    async def run():
+        events = []
+        async for event in progress_hub.subscribe(channel, heartbeat=0.01):
+            if event is None:
+                break
+            events.append(event.encoded.decode().split("\n")[1].removeprefix("event: "))
+        return events
+    return asyncio.run(run())
+
+
+def test_one_line_per_file_and_a_summary_when_one_fails(api, monkeypatch):
+    store = LocalS3Client.upload_fileobj
+
+    def failing(self, fileobj, bucket, key, *args, **kwargs):
+        if key.endswith("bad.jpg"):
+            raise RuntimeError("disk full")
+        return store(self, fileobj, bucket, key, *args, **kwargs)
+
+    monkeypatch.setattr(LocalS3Client, "upload_fileobj", failing)
+    batch_id = progress_hub.open_channel()
+    files = [("files", (name, b"photo " + name.encode(), "image/jpeg")) for name in ("a.jpg", "bad.jpg", "c.jpg")]
+
+    response = api("POST", "/api/v1/upload-multiple-photos", data={"event_id": "ndjson-event", "batch_id": batch_id},
+                   files=files, headers={"Accept": "application/x-ndjson"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [(line["status"], line.get("filename")) for line in lines] == [
+        ("uploaded", "a.jpg"), ("failed", "bad.jpg"), ("uploaded", "c.jpg"), ("done", None)
+    ]
+    assert "disk full" in lines[1]["error"]
+    assert (lines[3]["uploaded"], lines[3]["failed"]) == (2, 1)
+    assert lines[0]["file_key"] == f"ndjson-event/{lines[3]['session_id']}/a.jpg"
+
+    # The files after the failed one were still stored
+    s3 = get_s3_client()
+    for line in (lines[0], lines[2]):
+        assert s3.get_object(Bucket=BUCKET_NAME, Key=line["file_key"])["Body"].read().startswith(b"photo ")
+
+    events = _events(batch_id)
+    assert "file_failed" in events and events[-1] == "batch_done"
+
+
+def test_without_ndjson_the_batch_answers_at_once(api):
+    files = [("files", ("a.jpg", b"photo", "image/jpeg"))]
+    response = api("POST", "/api/v1/upload-multiple-photos", data={"event_id": "ndjson-event"}, files=files)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/json"
+    assert response.json()["success"]
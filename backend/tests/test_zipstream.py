@@ -0,0 +1,70 @@
+import asyncio
+import io
+import zipfile
+from datetime import datetime
+
+from app.services.zipstream import ZipFile, ZipWriter, ZIP64_COUNT_LIMIT, stream_zip
+
+MODIFIED = datetime(2024, 5, 17, 14, 30, 10)
+
+
+async def _chunks(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+def _build(files) -> bytes:
+    async def collect():
+        return b"".join([part async for part in stream_zip(_files())])
+
+    async def _files():
+        for file in files:
+            yield file
+
+    return asyncio.run(collect())
+
+
+def test_stream_zip_round_trips():
+    archive = _build([
+        ZipFile("a.jpg", MODIFIED, _chunks(b"abc", b"", b"def"), size=6),
+        ZipFile("b.jpg", MODIFIED, _chunks(b"x" * 1000), size=1000),
+    ])
+    with zipfile.ZipFile(io.BytesIO(archive)) as zf:
+        assert zf.testzip() is None
+        assert zf.namelist() == ["a.jpg", "b.jpg"]
+        assert zf.read("a.jpg") == b"abcdef"
+        assert zf.read("b.jpg") == b"x" * 1000
+        assert zf.getinfo("a.jpg").date_time == (2024, 5, 17, 14, 30, 10)
+
+
+def test_unknown_size_uses_zip64_records():
+    archive = _build([ZipFile("photo.jpg", MODIFIED, _chunks(b"data" * 10))])
+    with zipfile.ZipFile(io.BytesIO(archive)) as zf:
+        assert zf.testzip() is None
+        assert zf.read("photo.jpg") == b"data" * 10
+        # Version needed to extract 4.5 marks a ZIP64 entry
+        assert zf.getinfo("photo.jpg").extract_version == 45
+
+
+def test_zip64_end_records_past_the_entry_limit():
+    writer = ZipWriter()
+    parts = []
+    count = ZIP64_COUNT_LIMIT + 1
+    for i in range(count):
+        parts.append(writer.start_entry(f"{i}.jpg", MODIFIED, 1))
+        parts.append(writer.write(b"x"))
+        parts.append(writer.end_entry())
+    parts.append(writer.close())
+    archive = b"".join(parts)
+
+    assert b"PK\x06\x06" in archive[-200:]  # ZIP64 end of central directory
+    with zipfile.ZipFile(io.BytesIO(archive)) as zf:
+        names = zf.namelist()
+        assert len(names) == count
+        assert zf.read(names[-1]) == b"x"
+
+
+def test_names_are_utf8():
+    archive = _build([ZipFile("été.jpg", MODIFIED, _chunks(b"1"), size=1)])
+    with zipfile.ZipFile(io.BytesIO(archive)) as zf:
+        assert zf.namelist() == ["été.jpg"]